@@ -0,0 +1,185 @@
+"""
+Booking under slow upstreams: the sync DRF view on a thread-pool WSGI server
+versus the async booking view on uvicorn (needs the ``asgi`` extra).
+
+    python -m benchmarks.asgi_vs_wsgi --latency 0.5 --bookings 400 --concurrency 50 --workers 8
+
+Fake Calendar and email services add ``--latency`` seconds to every call.
+Both servers run the outbox worker alongside; under ASGI the booking's jobs
+are also dispatched on the event loop right after commit, up to
+SCHEDULING_EAGER_DISPATCH_LIMIT at a time. Reports request
+latency and throughput, and how long after each booking its calendar events
+and confirmation email were done.
+"""
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from .common import print_summary, seed_availability, seed_doctors, seed_patients, setup_django, summarize
+from .fakes import fake_calendar_server, fake_email_server
+
+WSGI_PATH = '/api/scheduling/appointments/'
+ASGI_PATH = '/api/scheduling/appointments/book/'
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class PooledWSGIServer(ThreadingMixIn, WSGIServer):
+    """wsgiref with a fixed pool of request threads, like gunicorn --threads."""
+    daemon_threads = True
+    workers = 8
+
+    def process_request(self, request, client_address):
+        if not hasattr(self, '_pool'):
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='wsgi')
+        self._pool.submit(self.process_request_thread, request, client_address)
+
+
+def start_wsgi(port: int, workers: int):
+    from django.core.wsgi import get_wsgi_application
+
+    PooledWSGIServer.workers = workers
+    server = make_server('127.0.0.1', port, get_wsgi_application(), server_class=PooledWSGIServer, handler_class=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.shutdown
+
+
+def start_asgi(port: int):
+    import uvicorn
+
+    config = uvicorn.Config('main.asgi:application', host='127.0.0.1', port=port, log_level='warning', lifespan='off')
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    def stop() -> None:
+        server.should_exit = True
+    return stop
+
+
+def run_outbox_worker(stop: threading.Event) -> None:
+    from django.db import connection
+    from scheduling.outbox import run_pending
+
+    while not stop.is_set():
+        if run_pending(limit=50) < 50:
+            stop.wait(0.2)
+    connection.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='SQLite file to use (default: a temporary file)')
+    parser.add_argument('--server', choices=('wsgi', 'asgi', 'both'), default='both')
+    parser.add_argument('--latency', type=float, default=0.5, help='Seconds added by each fake upstream call')
+    parser.add_argument('--bookings', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=50, help='Concurrent clients')
+    parser.add_argument('--workers', type=int, default=8, help='WSGI request threads')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--drain-timeout', type=float, default=120.0)
+    args = parser.parse_args()
+
+    calendar = fake_calendar_server(latency=args.latency)
+    email = fake_email_server(latency=args.latency)
+    os.environ['GOOGLE_CALENDAR_API_ROOT'] = calendar.url
+    os.environ['EMAIL_SERVICE_URL'] = email.url
+    db_label = setup_django(args.db)
+
+    import requests
+    from django.db import connection
+    from django.db.models import Max
+    from django.utils import timezone
+    from rest_framework.authtoken.models import Token
+    from scheduling.models import Appointment, Availability, OutboxJob
+    from users.models import User
+
+    doctor_ids = seed_doctors(max(1, args.bookings // 100))
+    patient_ids = seed_patients(args.concurrency)
+    # Linked calendars with a non-expiring token, so no refresh calls are made
+    User.objects.filter(pk__in=[*doctor_ids, *patient_ids]).update(
+        google_access_token='bench', google_refresh_token='bench', google_client_id='bench', google_client_secret='bench'
+    )
+    tokens = [
+        token.key for token in Token.objects.bulk_create(
+            [Token(user_id=pk, key=Token.generate_key()) for pk in patient_ids], ignore_conflicts=True
+        )
+    ]
+    modes = ['wsgi', 'asgi'] if args.server == 'both' else [args.server]
+    print(f"{args.bookings} bookings, {args.concurrency} clients, upstream latency {args.latency}s on {db_label}")
+
+    for offset, mode in enumerate(modes):
+        start = timezone.now() + timedelta(days=1 + 30 * offset)
+        seed_availability(doctor_ids, args.bookings, booked_ratio=0.0, start=start)
+        slot_ids = list(
+            Availability.objects.filter(start_time__gte=start, is_booked=False).values_list('id', flat=True)[:args.bookings]
+        )
+        connection.close()
+
+        port = args.port + offset
+        stop_server = start_wsgi(port, args.workers) if mode == 'wsgi' else start_asgi(port)
+        url = f"http://127.0.0.1:{port}{WSGI_PATH if mode == 'wsgi' else ASGI_PATH}"
+        stop_worker = threading.Event()
+        worker = threading.Thread(target=run_outbox_worker, args=(stop_worker,), daemon=True)
+        worker.start()
+
+        local = threading.local()
+        samples: list[float] = []
+        failures = 0
+        lock = threading.Lock()
+
+        def book(index: int) -> None:
+            nonlocal failures
+            if not hasattr(local, 'session'):
+                local.session = requests.Session()
+                local.session.headers['Authorization'] = f'Token {tokens[index % len(tokens)]}'
+            started = time.perf_counter()
+            response = local.session.post(url, json={'availability': slot_ids[index]})
+            with lock:
+                samples.append(time.perf_counter() - started)
+                failures += response.status_code != 201
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            list(executor.map(book, range(len(slot_ids))))
+        wall = time.perf_counter() - started
+
+        # Wait for every calendar event and confirmation email to finish
+        deadline = time.monotonic() + args.drain_timeout
+        appointment_ids = list(Appointment.objects.filter(availability_id__in=slot_ids).values_list('id', flat=True))
+        jobs = OutboxJob.objects.filter(payload__appointment_id__in=appointment_ids)
+        while jobs.exclude(status=OutboxJob.STATUS_DONE).exists() and time.monotonic() < deadline:
+            time.sleep(0.2)
+        stop_worker.set()
+        worker.join()
+        stop_server()
+
+        done_at = dict(
+            jobs.filter(status=OutboxJob.STATUS_DONE).values('payload__appointment_id')
+            .annotate(done=Max('updated_at')).values_list('payload__appointment_id', 'done')
+        )
+        completion = [
+            (done_at[pk] - created_at).total_seconds()
+            for pk, created_at in Appointment.objects.filter(pk__in=appointment_ids).values_list('id', 'created_at')
+            if pk in done_at
+        ]
+        connection.close()
+
+        print(f"\n[{mode}] throughput={len(slot_ids) / wall:.1f} req/s  non-201={failures}")
+        print_summary(f'{mode}: POST booking', summarize(samples))
+        if completion:
+            print_summary(f'{mode}: booking -> side effects done', summarize(completion))
+        print(f"{mode}: {len(completion)}/{len(appointment_ids)} bookings fully processed")
+        print(f"upstream calls so far: calendar={calendar.counts} email={email.counts}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Overlap validation and patient slot listing against a large Availability table.
+
+    python -m benchmarks.availability_index --rows 2000000 --doctors 2000
+    python -m benchmarks.availability_index --db /tmp/bench.sqlite3 --without-indexes
+
+Re-using ``--db`` skips seeding when the table is already populated.
+"""
+import argparse
+import random
+from datetime import timedelta
+
+from .common import measure, print_summary, seed_availability, seed_doctors, setup_django
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='SQLite file to use (default: a temporary file)')
+    parser.add_argument('--rows', type=int, default=2_000_000)
+    parser.add_argument('--doctors', type=int, default=2_000)
+    parser.add_argument('--iterations', type=int, default=2_000)
+    parser.add_argument('--without-indexes', action='store_true', help='Drop the interval indexes first, for comparison')
+    args = parser.parse_args()
+
+    db_path = setup_django(args.db)
+
+    from django.db import connection
+    from django.utils import timezone
+    from scheduling.models import Availability
+
+    if not Availability.objects.exists():
+        print(f"Seeding {args.rows:,} availability rows across {args.doctors:,} doctors into {db_path} ...")
+        seed_availability(seed_doctors(args.doctors), args.rows)
+
+    if args.without_indexes:
+        with connection.schema_editor() as editor:
+            for index in Availability._meta.indexes:
+                editor.remove_index(Availability, index)
+
+    doctor_ids = list(Availability.objects.values_list('doctor_id', flat=True).distinct())
+    now = timezone.now()
+    rng = random.Random(7)
+
+    def overlap_check() -> None:
+        start = now + timedelta(minutes=30 * rng.randrange(0, 24 * 60))
+        Availability.objects.filter(
+            doctor_id=rng.choice(doctor_ids),
+            start_time__lt=start + timedelta(minutes=30),
+            end_time__gt=start
+        ).exists()
+
+    def patient_slot_page() -> None:
+        list(Availability.objects.filter(is_booked=False, start_time__gt=timezone.now())[:20])
+
+    print(f"{Availability.objects.count():,} rows, indexes {'dropped' if args.without_indexes else 'present'}")
+    print_summary('overlap validation', measure(overlap_check, args.iterations))
+    print_summary('patient slot list (first page)', measure(patient_slot_page, args.iterations))
+
+    if args.without_indexes:
+        with connection.schema_editor() as editor:
+            for index in Availability._meta.indexes:
+                editor.add_index(Availability, index)
+
+
+if __name__ == '__main__':
+    main()
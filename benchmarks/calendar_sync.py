@@ -0,0 +1,74 @@
+"""
+Google Calendar sync cycles for many linked doctors against the fake Calendar
+server: the first full sync, an incremental sync with sync tokens, and the
+full resync after Google expires every token.
+
+    python -m benchmarks.calendar_sync --doctors 2000 --workers 16 --latency 0.05
+
+Each doctor has ``--busy-events`` hour-long busy events at 09:00 UTC on the
+following days and contiguous 30-minute slots over the same days; each
+incremental cycle moves one event per doctor.
+"""
+import argparse
+import os
+import time
+from datetime import timedelta
+
+from .common import seed_availability, seed_doctors, setup_django
+from .fakes import fake_calendar_server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='SQLite file to use (default: a temporary file)')
+    parser.add_argument('--doctors', type=int, default=2000)
+    parser.add_argument('--busy-events', type=int, default=10, help='Busy events per doctor calendar')
+    parser.add_argument('--workers', type=int, default=16, help='Concurrent syncs')
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds added by each fake Calendar call')
+    args = parser.parse_args()
+
+    calendar = fake_calendar_server(latency=args.latency)
+    calendar.busy_events = args.busy_events
+    os.environ['GOOGLE_CALENDAR_API_ROOT'] = calendar.url
+    db_label = setup_django(args.db)
+
+    from django.db.models import Q
+    from django.utils import timezone
+    from scheduling.calendar_sync import sync_due_calendars
+    from scheduling.models import Availability, CalendarBlock
+    from users.models import User
+
+    doctor_ids = seed_doctors(args.doctors)
+    doctors = User.objects.filter(pk__in=doctor_ids)
+    # Linked calendars with a non-expiring token, so no refresh calls are made
+    doctors.update(
+        google_access_token='bench', google_refresh_token='bench', google_client_id='bench', google_client_secret='bench'
+    )
+    start = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    seed_availability(doctor_ids, args.doctors * args.busy_events * 48, booked_ratio=0.0, start=start)
+    print(f"{args.doctors} doctors, {args.busy_events} busy events each, "
+          f"{Availability.objects.count()} slots, {args.latency}s Calendar latency on {db_label}")
+
+    def cycle(label: str) -> None:
+        # Make every doctor due again
+        doctors.update(google_synced_at=None)
+        before = dict(calendar.counts)
+        started = time.perf_counter()
+        synced = 0
+        while results := sync_due_calendars(limit=args.doctors, workers=args.workers):
+            synced += len(results)
+        elapsed = time.perf_counter() - started
+        calls = {key: value - before.get(key, 0) for key, value in calendar.counts.items() if value != before.get(key, 0)}
+        blocked = Availability.objects.filter(is_blocked=True).count()
+        print(f"{label:12s} {synced} calendars in {elapsed:.2f}s ({synced / elapsed:.0f}/s)  "
+              f"blocks={CalendarBlock.objects.count()} blocked_slots={blocked}  calls={calls}")
+
+    cycle('full')
+    cycle('incremental')
+    cycle('incremental')
+    doctors.filter(~Q(google_sync_token=None)).update(google_sync_token='expired')
+    cycle('expired')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Cold-start cost of the Lambda entry points.
+
+    python -m benchmarks.cold_start --runs 20
+    python -m benchmarks.cold_start --runs 0 --importtime --top 25
+
+Every run starts a fresh interpreter, as a Lambda cold start does, and times
+the import of the entry point plus its first request: an unauthenticated API
+call through ``main.wsgi.application`` (full and ``api`` app profiles) and one
+console ``handler.send_email`` invocation. Reports whole-process, import and
+first-request latency, and which heavy SDKs were loaded by the end.
+``--importtime`` adds the slowest top-level packages from
+``python -X importtime`` for each entry point.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Any
+
+from .common import BASE_DIR, print_summary, summarize
+
+HEAVY_MODULES = (
+    'googleapiclient', 'google.oauth2', 'google_auth_oauthlib', 'httplib2',
+    'requests', 'httpx', 'boto3', 'smtplib', 'django.contrib.admin',
+)
+
+WSGI_CHILD = """
+import json, sys, time
+started = time.perf_counter()
+import main.wsgi
+imported = time.perf_counter()
+status = []
+environ = {
+    'REQUEST_METHOD': 'GET', 'PATH_INFO': sys.argv[1], 'QUERY_STRING': '',
+    'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'HTTP_HOST': 'localhost',
+    'wsgi.url_scheme': 'http', 'wsgi.input': __import__('io').BytesIO(), 'wsgi.errors': sys.stderr,
+}
+b''.join(main.wsgi.application(environ, lambda s, headers, exc_info=None: status.append(s)))
+done = time.perf_counter()
+print(json.dumps({'import': imported - started, 'first': done - imported, 'status': status[0],
+                  'loaded': [m for m in json.loads(sys.argv[2]) if m in sys.modules]}))
+"""
+
+HANDLER_CHILD = """
+import json, sys, time
+started = time.perf_counter()
+import handler
+imported = time.perf_counter()
+body = json.dumps({'action': 'SIGNUP_WELCOME', 'recipient': 'bench@example.com', 'data': {'userName': 'Bench'}})
+response = handler.send_email({'body': body}, None)
+done = time.perf_counter()
+print(json.dumps({'import': imported - started, 'first': done - imported, 'status': response['statusCode'],
+                  'loaded': [m for m in json.loads(sys.argv[2]) if m in sys.modules]}))
+"""
+
+TARGETS: dict[str, tuple[str, str, dict[str, str]]] = {
+    # name: (child script, import for -X importtime, extra environment)
+    'wsgi (full)': (WSGI_CHILD, 'main.wsgi', {'DJANGO_APP_PROFILE': 'full'}),
+    'wsgi (api)': (WSGI_CHILD, 'main.wsgi', {'DJANGO_APP_PROFILE': 'api'}),
+    'handler.send_email': (HANDLER_CHILD, 'handler', {'EMAIL_SERVICE_PROVIDER': 'CONSOLE'}),
+}
+
+
+def _env(extra: dict[str, str]) -> dict[str, str]:
+    env = dict(os.environ)
+    env.setdefault('DJANGO_SETTINGS_MODULE', 'main.settings')
+    env.update(extra)
+    return env
+
+
+def run_once(script: str, path: str, env: dict[str, str]) -> tuple[float, dict[str, Any]]:
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-c', script, path, json.dumps(HEAVY_MODULES)],
+        cwd=BASE_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    elapsed = time.perf_counter() - started
+    # The console email provider prints the message first; the report is the last line
+    return elapsed, json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def import_report(module: str, env: dict[str, str], top: int) -> list[tuple[str, float]]:
+    """Import time per top-level package (summed self times), from ``-X importtime``."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=BASE_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    totals: dict[str, float] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        # Self time attributes each module's cost once, wherever it was imported from
+        package = name.strip().split('.')[0]
+        totals[package] = totals.get(package, 0.0) + int(self_us) / 1000
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10, help='Cold starts per entry point')
+    parser.add_argument('--path', default='/api/scheduling/availability/', help='First request for the WSGI app')
+    parser.add_argument('--importtime', action='store_true', help='Also report the slowest imports')
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    for label, (script, module, extra) in TARGETS.items():
+        env = _env(extra)
+        if args.runs:
+            # Untimed first start writes the bytecode a deployed package ships with
+            run_once(script, args.path, env)
+            process, imports, firsts = [], [], []
+            for _ in range(args.runs):
+                elapsed, report = run_once(script, args.path, env)
+                process.append(elapsed)
+                imports.append(report['import'])
+                firsts.append(report['first'])
+            print(f"\n[{label}] status={report['status']} loaded={report['loaded'] or 'none of the heavy SDKs'}")
+            print_summary(f'{label}: process', summarize(process))
+            print_summary(f'{label}: import', summarize(imports))
+            print_summary(f'{label}: first call', summarize(firsts))
+        if args.importtime:
+            print(f"\n[{label}] slowest packages to import (ms)")
+            for package, ms in import_report(module, env, args.top):
+                print(f"  {package:30s} {ms:8.1f}")
+
+
+if __name__ == '__main__':
+    main()
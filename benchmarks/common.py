@@ -0,0 +1,190 @@
+"""
+Shared helpers for the benchmark scripts.
+
+Benchmarks run against their own SQLite file (a temporary one unless
+``--db`` is given) so they never touch ``db.sqlite3``.
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django(db_path: str | None = None) -> str:
+    """
+    Point the default SQLite database at ``db_path``, set up Django and migrate.
+
+    With DB_ENGINE=postgres the configured PostgreSQL database is used as is,
+    so point POSTGRES_DB at a scratch database.
+    """
+    sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'main.settings')
+    # One JSON line per request would drown the results
+    os.environ.setdefault('REQUEST_LOG_LEVEL', 'WARNING')
+
+    from django.conf import settings
+
+    database = settings.DATABASES['default']
+    if database['ENGINE'].endswith('sqlite3'):
+        if db_path is None:
+            db_path = os.path.join(tempfile.mkdtemp(prefix='hms-bench-'), 'bench.sqlite3')
+        database['NAME'] = db_path
+    else:
+        db_path = f"{database['ENGINE'].rsplit('.', 1)[-1]}:{database['NAME']}"
+    # The Django test client sends Host: testserver; the servers started by
+    # asgi_vs_wsgi and load_test are called on 127.0.0.1
+    settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver', '127.0.0.1', 'localhost']
+
+    import django
+    django.setup()
+
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+    return db_path
+
+
+def summarize(samples: list[float]) -> dict[str, float]:
+    """Latency summary in milliseconds for a list of durations in seconds."""
+    ordered = sorted(samples)
+
+    def pct(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000
+
+    return {
+        'count': len(ordered),
+        'mean_ms': statistics.fmean(ordered) * 1000,
+        'p50_ms': pct(0.50),
+        'p95_ms': pct(0.95),
+        'p99_ms': pct(0.99),
+    }
+
+
+def measure(func: Callable[[], Any], iterations: int, warmup: int = 10) -> dict[str, float]:
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+def print_summary(label: str, summary: dict[str, float]) -> None:
+    print(
+        f"{label:<40} n={summary['count']:<6} mean={summary['mean_ms']:.3f}ms "
+        f"p50={summary['p50_ms']:.3f}ms p95={summary['p95_ms']:.3f}ms p99={summary['p99_ms']:.3f}ms"
+    )
+
+
+def seed_users(role: str, count: int) -> list[int]:
+    """
+    Create ``count`` users with unusable passwords; returns the ids of all
+    users with that role. bulk_create sends no post_save, so no welcome emails.
+    """
+    from users.models import User
+
+    start = User.objects.filter(role=role).count()
+    users = [
+        User(
+            username=f'bench-{role}-{start + i}',
+            email=f'bench-{role}-{start + i}@example.com',
+            first_name='Bench',
+            last_name=f'{role.title()}{start + i}',
+            role=role,
+            password='!',
+        )
+        for i in range(count)
+    ]
+    User.objects.bulk_create(users, batch_size=1000)
+    return list(User.objects.filter(role=role).values_list('id', flat=True))
+
+
+def seed_doctors(count: int) -> list[int]:
+    return seed_users('doctor', count)
+
+
+def seed_patients(count: int) -> list[int]:
+    return seed_users('patient', count)
+
+
+def seed_availability(doctor_ids: list[int], total_rows: int, booked_ratio: float = 0.3,
+                      start: datetime | None = None, batch_size: int = 50_000) -> None:
+    """
+    Insert ``total_rows`` non-overlapping 30-minute slots spread across doctors.
+
+    Uses ``executemany`` on a raw cursor because model ``bulk_create`` is far
+    too slow for millions of rows.
+    """
+    from django.db import connection, transaction
+    from django.utils import timezone
+    from scheduling.models import Availability
+
+    start = start or timezone.now() - timedelta(days=30)
+    table = connection.ops.quote_name(Availability._meta.db_table)
+    sql = f"INSERT INTO {table} (doctor_id, start_time, end_time, is_booked, is_blocked) VALUES (%s, %s, %s, %s, %s)"
+    slot = timedelta(minutes=30)
+    per_doctor = max(1, total_rows // len(doctor_ids))
+    rng = random.Random(42)
+    adapt = connection.ops.adapt_datetimefield_value
+
+    rows: list[tuple[Any, ...]] = []
+    inserted = 0
+    with connection.cursor() as cursor:
+        for doctor_id in doctor_ids:
+            for n in range(per_doctor):
+                slot_start = start + slot * n
+                rows.append((doctor_id, adapt(slot_start), adapt(slot_start + slot), rng.random() < booked_ratio, False))
+                if len(rows) >= batch_size:
+                    with transaction.atomic():
+                        cursor.executemany(sql, rows)
+                    inserted += len(rows)
+                    rows = []
+                if inserted + len(rows) >= total_rows:
+                    break
+            if inserted + len(rows) >= total_rows:
+                break
+        if rows:
+            with transaction.atomic():
+                cursor.executemany(sql, rows)
+
+
+def seed_appointments(patient_ids: list[int], batch_size: int = 50_000) -> int:
+    """
+    Give every booked slot without an appointment one, for a random patient.
+    Returns the number inserted; like ``seed_availability`` it bypasses the
+    ORM, so no signals fire and no outbox jobs are queued.
+    """
+    from django.db import connection, transaction
+    from django.utils import timezone
+    from scheduling.models import Appointment, Availability
+
+    table = connection.ops.quote_name(Appointment._meta.db_table)
+    sql = f"INSERT INTO {table} (patient_id, availability_id, created_at) VALUES (%s, %s, %s)"
+    created_at = connection.ops.adapt_datetimefield_value(timezone.now())
+    rng = random.Random(43)
+    slot_ids = Availability.objects.filter(is_booked=True, appointment__isnull=True).values_list('id', flat=True)
+
+    rows: list[tuple[Any, ...]] = []
+    inserted = 0
+    with connection.cursor() as cursor:
+        # Materialised first, so the inserts never run under an open read of the same tables
+        for slot_id in list(slot_ids.iterator(chunk_size=batch_size)):
+            rows.append((rng.choice(patient_ids), slot_id, created_at))
+            if len(rows) >= batch_size:
+                with transaction.atomic():
+                    cursor.executemany(sql, rows)
+                inserted += len(rows)
+                rows = []
+        if rows:
+            with transaction.atomic():
+                cursor.executemany(sql, rows)
+            inserted += len(rows)
+    return inserted
@@ -0,0 +1,103 @@
+"""
+Concurrent booking load test against the real appointment endpoint.
+
+    python -m benchmarks.concurrent_booking --threads 16 --bookings 2000 --slots 500
+    DB_ENGINE=postgres POSTGRES_DB=hms_bench python -m benchmarks.concurrent_booking
+    python -m benchmarks.concurrent_booking --contend 300 --mode locking
+
+Patients race for a shared pool of future slots, so a share of requests
+lose with 409. Reports throughput, latency and status counts, then checks
+that no slot ended up with more than one appointment.
+
+``--contend N`` instead releases N threads at once, each booking the same
+slot, and fails unless exactly one of them gets a 201.
+"""
+import argparse
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from .common import print_summary, seed_availability, seed_doctors, seed_patients, setup_django, summarize
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='SQLite file to use (default: a temporary file)')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--bookings', type=int, default=2000, help='Total booking requests')
+    parser.add_argument('--slots', type=int, default=500, help='Distinct slots competed for')
+    parser.add_argument('--patients', type=int, default=200)
+    parser.add_argument('--mode', choices=('optimistic', 'locking'), help='SCHEDULING_BOOKING_MODE to use')
+    parser.add_argument('--contend', type=int, metavar='N', help='Fire N simultaneous bookings at one slot')
+    args = parser.parse_args()
+
+    db_label = setup_django(args.db)
+
+    from django.conf import settings
+    from django.db import connection, connections
+    from django.utils import timezone
+    from rest_framework.test import APIClient
+    from scheduling.models import Appointment, Availability
+    from users.models import User
+
+    if args.mode:
+        settings.SCHEDULING_BOOKING_MODE = args.mode
+    mode = settings.SCHEDULING_BOOKING_MODE
+    if args.contend:
+        args.slots, args.bookings, args.threads = 1, args.contend, args.contend
+
+    doctor_ids = seed_doctors(max(1, args.slots // 50))
+    seed_availability(doctor_ids, args.slots, booked_ratio=0.0, start=timezone.now() + timedelta(days=1))
+    patients = list(User.objects.filter(pk__in=seed_patients(args.patients)))
+    slot_ids = list(Availability.objects.filter(is_booked=False).values_list('id', flat=True))
+    connection.close()
+
+    samples: list[float] = []
+    statuses: Counter[int] = Counter()
+    lock = threading.Lock()
+    local = threading.local()
+    # In --contend mode every thread waits here so the requests land together
+    barrier = threading.Barrier(args.threads) if args.contend else None
+
+    def book(_: int) -> None:
+        if not hasattr(local, 'client'):
+            local.client = APIClient()
+            local.client.force_authenticate(random.choice(patients))
+        if barrier is not None:
+            barrier.wait()
+        started = time.perf_counter()
+        response = local.client.post('/api/scheduling/appointments/', {'availability': random.choice(slot_ids)}, format='json')
+        elapsed = time.perf_counter() - started
+        with lock:
+            samples.append(elapsed)
+            statuses[response.status_code] += 1
+
+    def worker_done(_: object) -> None:
+        connections.close_all()
+
+    print(f"{args.bookings} bookings, {args.threads} threads, {len(slot_ids)} slots on {db_label} ({mode})")
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        for future in [executor.submit(book, i) for i in range(args.bookings)]:
+            future.result()
+        for future in [executor.submit(worker_done, None) for _ in range(args.threads)]:
+            future.result()
+    wall = time.perf_counter() - started
+
+    print_summary('POST /appointments/', summarize(samples))
+    print(f"throughput={args.bookings / wall:.1f} req/s  statuses={dict(sorted(statuses.items()))}")
+
+    booked = Availability.objects.filter(is_booked=True).count()
+    appointments = Appointment.objects.count()
+    print(f"booked slots={booked} appointments={appointments} created(201)={statuses[201]}")
+    if not booked == appointments == statuses[201]:
+        raise SystemExit("Inconsistent booking state: double booking or lost update detected")
+    if args.contend and statuses[201] != 1:
+        raise SystemExit(f"Expected exactly one winner for the contended slot, got {statuses[201]}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+A doctor dashboard load: paging through ``/availability/`` and
+``/appointments/`` 20 at a time versus one ``/availability/schedule/`` call.
+
+    python -m benchmarks.doctor_schedule --days 7 --slots-per-day 16 --history-days 60
+
+The doctor has ``--slots-per-day`` slots on each of ``--history-days`` past
+days and the next ``--days`` days, with ``--booked-ratio`` of them booked.
+The paged load walks the availability list (which has no date filter) until
+it passes the range and the appointment list to the end, as the dashboard did.
+The schedule endpoint is timed with a cold and a warm cache.
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from urllib.parse import parse_qs, urlparse
+
+from .common import print_summary, seed_availability, seed_doctors, seed_patients, setup_django, summarize
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='SQLite file to use (default: a temporary file)')
+    parser.add_argument('--days', type=int, default=7, help='Days shown on the dashboard')
+    parser.add_argument('--slots-per-day', type=int, default=16)
+    parser.add_argument('--history-days', type=int, default=60, help='Past days of slots and appointments')
+    parser.add_argument('--booked-ratio', type=float, default=0.6)
+    parser.add_argument('--iterations', type=int, default=50)
+    args = parser.parse_args()
+
+    db_label = setup_django(args.db)
+
+    from django.core.cache import cache
+    from django.test import Client
+    from django.utils import timezone
+    from rest_framework.test import APIClient
+    from scheduling.models import Appointment, Availability
+    from users.models import User
+
+    doctor_id = seed_doctors(1)[0]
+    patient_ids = seed_patients(200)
+    today = timezone.localdate()
+    first_day = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=args.history_days)
+    total_days = args.history_days + args.days
+    # 30-minute slots back to back, so a day's slots start at midnight
+    seed_availability([doctor_id], total_days * args.slots_per_day, booked_ratio=args.booked_ratio, start=first_day)
+    rng = random.Random(7)
+    Appointment.objects.bulk_create([
+        Appointment(patient_id=rng.choice(patient_ids), availability_id=slot_id)
+        for slot_id in Availability.objects.filter(doctor_id=doctor_id, is_booked=True).values_list('id', flat=True)
+    ], batch_size=1000)
+
+    api_client = APIClient()
+    api_client.force_authenticate(User.objects.get(pk=doctor_id))
+    # APIClient's methods are untyped; Client's responses are described by django-stubs
+    client: Client = api_client
+    range_end = first_day + timedelta(days=total_days)
+
+    def paged() -> int:
+        requests = 0
+        params = {}
+        while True:
+            page = client.get('/api/scheduling/availability/', params).json()
+            requests += 1
+            if not page['next'] or datetime.fromisoformat(page['results'][-1]['start_time']) >= range_end:
+                break
+            params = {'cursor': parse_qs(urlparse(page['next']).query)['cursor'][0]}
+        url = '/api/scheduling/appointments/'
+        while url:
+            url = client.get(url).json()['next']
+            requests += 1
+        return requests
+
+    params = {'date_from': today.isoformat(), 'date_to': (today + timedelta(days=args.days - 1)).isoformat()}
+
+    def schedule() -> int:
+        response = client.get('/api/scheduling/availability/schedule/', params)
+        assert response.status_code == 200, response.content
+        return 1
+
+    print(f"{Availability.objects.count()} slots, {Appointment.objects.count()} appointments, "
+          f"{args.days}-day dashboard on {db_label}")
+    for label, load, clear in (
+        ('paged lists', paged, False),
+        ('schedule (cold cache)', schedule, True),
+        ('schedule (warm cache)', schedule, False),
+    ):
+        samples = []
+        requests = 0
+        load()
+        for _ in range(args.iterations):
+            if clear:
+                cache.clear()
+            started = time.perf_counter()
+            requests = load()
+            samples.append(time.perf_counter() - started)
+        print_summary(f'{label}: {requests} request(s) per load', summarize(samples))
+
+
+if __name__ == '__main__':
+    main()
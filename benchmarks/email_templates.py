@@ -0,0 +1,48 @@
+"""
+Render throughput of the compiled email templates in handler.py.
+
+    python -m benchmarks.email_templates --iterations 200000
+"""
+import argparse
+import sys
+import time
+
+from .common import BASE_DIR
+
+SAMPLE_DATA = {
+    'SIGNUP_WELCOME': {'userName': 'Ada Lovelace'},
+    'BOOKING_CONFIRMATION': {
+        'userName': 'Ada <Lovelace>',
+        'bookingId': '1042',
+        'details': 'Appointment with Dr. Grace Hopper on 2026-10-20 at 09:30',
+    },
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=200_000)
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(BASE_DIR))
+    import handler
+
+    for action, data in SAMPLE_DATA.items():
+        handler.get_email_template.cache_clear()
+        started = time.perf_counter()
+        handler.get_email_template(action)
+        compile_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        for _ in range(args.iterations):
+            handler.render_email(action, data)
+        elapsed = time.perf_counter() - started
+        print(
+            f"{action:<22} load+compile={compile_ms:.3f}ms "
+            f"render={elapsed / args.iterations * 1e6:.2f}us/msg "
+            f"throughput={args.iterations / elapsed:,.0f} msg/s"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,262 @@
+"""
+Local stand-ins for the upstream services the API talks to.
+
+    python -m benchmarks.fakes calendar --port 8085 --latency 0.2
+    python -m benchmarks.fakes email --port 3003 --latency 0.2
+
+Point the app at the fake Calendar server with
+``GOOGLE_CALENDAR_API_ROOT=http://127.0.0.1:8085``; it accepts single
+``events.insert`` calls, ``/batch/calendar/v3`` multipart batches,
+``events.patch``/``events.delete`` and ``events.list``. Listings return
+``busy_events`` hour-long events on consecutive days (or ``events``, when
+set); with a ``syncToken`` they return one moved event (or ``changes``), and
+the token ``expired`` gets 410 Gone. Batched
+inserts whose summary is in ``rejected_summaries`` get 403 Forbidden. The fake
+email service (``EMAIL_SERVICE_URL``) accepts ``/email/send`` and
+``/email/send-batch`` and sends nothing.
+"""
+import argparse
+import json
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, time as day_time, timedelta, timezone
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, cast
+from urllib.parse import parse_qs
+
+EVENTS_PATH = '/calendar/v3/calendars/primary/events'
+BATCH_PATH = '/batch/calendar/v3'
+
+
+class FakeCalendarHandler(BaseHTTPRequestHandler):
+    """Minimal Google Calendar v3: events insert/patch/delete/list and the batch endpoint."""
+
+    protocol_version = 'HTTP/1.1'
+
+    @property
+    def fake(self) -> 'FakeServer':
+        """``self.server``, typed as the ``FakeServer`` that created this handler."""
+        return cast('FakeServer', self.server)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _insert_event(self, body: bytes) -> dict[str, Any]:
+        event = json.loads(body or b'{}')
+        event['id'] = uuid.uuid4().hex
+        event['htmlLink'] = f"https://calendar.example/event?eid={event['id']}"
+        self.fake.record('insert')
+        return event
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        time.sleep(self.fake.latency)
+        path = self.path.split('?', 1)[0]
+
+        if path == EVENTS_PATH:
+            self.fake.record('request')
+            self._send(200, json.dumps(self._insert_event(body)).encode(), 'application/json')
+        elif path == BATCH_PATH:
+            self.fake.record('request')
+            self.fake.record('batch')
+            self._handle_batch(body)
+        else:
+            self._send(404, b'{"error": "not found"}', 'application/json')
+
+    def do_PATCH(self) -> None:
+        length = int(self.headers.get('Content-Length', 0))
+        event = json.loads(self.rfile.read(length) or b'{}')
+        time.sleep(self.fake.latency)
+        self.fake.record('request')
+        self.fake.record('patch')
+        event['id'] = self.path.split('?', 1)[0].rsplit('/', 1)[-1]
+        self._send(200, json.dumps(event).encode(), 'application/json')
+
+    def do_DELETE(self) -> None:
+        time.sleep(self.fake.latency)
+        self.fake.record('request')
+        self.fake.record('delete')
+        self.send_response(204)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self) -> None:
+        time.sleep(self.fake.latency)
+        path, _, query = self.path.partition('?')
+        if path != EVENTS_PATH:
+            self._send(404, b'{"error": "not found"}', 'application/json')
+            return
+        self.fake.record('request')
+        params = {key: values[0] for key, values in parse_qs(query).items()}
+        sync_token = params.get('syncToken')
+        if 'pageToken' not in params:
+            self.fake.sync_tokens.append(sync_token)
+        if sync_token == 'expired':
+            self._send(410, b'{"error": {"code": 410, "message": "Sync token is no longer valid"}}', 'application/json')
+            return
+
+        if sync_token:
+            self.fake.record('incremental')
+            generation = int(sync_token.rsplit('-', 1)[-1])
+            # One event moves by half an hour per generation
+            index = generation % max(self.fake.busy_events, 1)
+            items = self.fake.changes if self.fake.changes is not None else [
+                self._busy_event(index, shift=timedelta(minutes=30 * (generation % 2)))
+            ]
+            next_token = f'sync-{generation + 1}'
+            self._send(200, json.dumps({'items': items, 'nextSyncToken': next_token}).encode(), 'application/json')
+            return
+
+        self.fake.record('full')
+        offset = int(params.get('pageToken') or 0)
+        page_size = int(params.get('maxResults', 250))
+        total = self.fake.busy_events if self.fake.events is None else len(self.fake.events)
+        end = min(offset + page_size, total)
+        if self.fake.events is None:
+            items = [self._busy_event(i) for i in range(offset, end)]
+        else:
+            items = self.fake.events[offset:end]
+        body: dict[str, Any] = {'items': items}
+        if end < total:
+            body['nextPageToken'] = str(end)
+        else:
+            body['nextSyncToken'] = 'sync-1'
+        self._send(200, json.dumps(body).encode(), 'application/json')
+
+    def _busy_event(self, index: int, shift: timedelta = timedelta()) -> dict[str, Any]:
+        tomorrow = datetime.now(timezone.utc).date() + timedelta(days=1)
+        start = datetime.combine(tomorrow + timedelta(days=index), day_time(9), timezone.utc) + shift
+        return {
+            'id': f'busy{index}',
+            'status': 'confirmed',
+            'start': {'dateTime': start.isoformat()},
+            'end': {'dateTime': (start + timedelta(hours=1)).isoformat()},
+        }
+
+    def _handle_batch(self, body: bytes) -> None:
+        header = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode()
+        message = BytesParser(policy=HTTP).parsebytes(header + body)
+        boundary = f'batch_{uuid.uuid4().hex}'
+        parts = []
+        for part in message.iter_parts():
+            content_id = part['Content-ID'].strip('<>')
+            inner = part.get_payload(decode=True)
+            assert isinstance(inner, bytes)
+            inner_body = re.split(rb'\r?\n\r?\n', inner, maxsplit=1)[-1]
+            if json.loads(inner_body or b'{}').get('summary') in self.fake.rejected_summaries:
+                status = '403 Forbidden'
+                result: dict[str, Any] = {'error': {'code': 403, 'message': 'Insufficient permissions'}}
+            else:
+                status = '200 OK'
+                result = self._insert_event(inner_body)
+            parts.append(
+                f'--{boundary}\r\n'
+                'Content-Type: application/http\r\n'
+                f'Content-ID: <response-{content_id}>\r\n\r\n'
+                f'HTTP/1.1 {status}\r\n'
+                'Content-Type: application/json; charset=UTF-8\r\n\r\n'
+                f'{json.dumps(result)}\r\n'
+            )
+        payload = (''.join(parts) + f'--{boundary}--\r\n').encode()
+        self._send(200, payload, f'multipart/mixed; boundary={boundary}')
+
+
+class FakeEmailHandler(FakeCalendarHandler):
+    """The email Lambda's HTTP surface, answering every message with 200."""
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        time.sleep(self.fake.latency)
+        path = self.path.split('?', 1)[0]
+        self.fake.record('request')
+
+        if path == '/email/send':
+            self.fake.record('email')
+            self._send(200, b'{"message": "Email sent successfully"}', 'application/json')
+        elif path == '/email/send-batch':
+            messages = body.get('messages', [])
+            for _ in messages:
+                self.fake.record('email')
+            results = [
+                {'index': i, 'recipient': message.get('recipient'), 'status': 'sent'}
+                for i, message in enumerate(messages)
+            ]
+            body = {'message': f'{len(results)} of {len(results)} emails sent.', 'results': results}
+            self._send(200, json.dumps(body).encode(), 'application/json')
+        else:
+            self._send(404, b'{"error": "not found"}', 'application/json')
+
+
+class FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, handler: type[BaseHTTPRequestHandler], port: int = 0, latency: float = 0.0):
+        super().__init__(('127.0.0.1', port), handler)
+        self.latency = latency
+        # Events in a fake Calendar listing
+        self.busy_events = 20
+        # Explicit events for full listings and for listings with a sync token
+        self.events: list[dict[str, Any]] | None = None
+        self.changes: list[dict[str, Any]] | None = None
+        # The syncToken sent with each listing, None for full ones
+        self.sync_tokens: list[str | None] = []
+        # Summaries of batched inserts answered with 403
+        self.rejected_summaries: set[str] = set()
+        self.counts: dict[str, int] = {}
+        self._counts_lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def record(self, name: str) -> None:
+        with self._counts_lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def start(self) -> 'FakeServer':
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+HANDLERS: dict[str, type[BaseHTTPRequestHandler]] = {
+    'calendar': FakeCalendarHandler,
+    'email': FakeEmailHandler,
+}
+
+
+def fake_calendar_server(port: int = 0, latency: float = 0.0) -> FakeServer:
+    return FakeServer(FakeCalendarHandler, port, latency).start()
+
+
+def fake_email_server(port: int = 0, latency: float = 0.0) -> FakeServer:
+    return FakeServer(FakeEmailHandler, port, latency).start()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('service', choices=sorted(HANDLERS))
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+    args = parser.parse_args()
+
+    server = FakeServer(HANDLERS[args.service], args.port, args.latency)
+    print(f"Fake {args.service} service listening on {server.url}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,440 @@
+"""
+Load test of the API against a large seeded database, with Google Calendar
+and the email service replaced by local fakes.
+
+    python -m benchmarks.load_test --db /tmp/hms-load.sqlite3 --duration 60 --concurrency 32
+    python -m benchmarks.load_test --db /tmp/hms-load.sqlite3 --save-baseline benchmarks/baselines/load_test.json
+    python -m benchmarks.load_test --db /tmp/hms-load.sqlite3 --baseline benchmarks/baselines/load_test.json --fail-on-regression
+
+The first run against a database seeds it with raw bulk inserts (2000
+doctors, 20000 patients, 2M 30-minute slots spanning past and future, 200k
+appointments by default); later runs reuse the data. ``--concurrency``
+clients then run a weighted mix of flows for ``--duration`` seconds against a
+real server (wsgiref with a thread pool, or uvicorn), with the outbox worker
+running alongside:
+
+    register, login, search, availability (patient list), book,
+    appointments (patient list), schedule (doctor), create_slot (doctor)
+
+Reports p50/p95/p99 latency, throughput and queries per request (from the
+``Server-Timing`` header) for each flow. A run where more than
+``--max-unexpected`` of a flow's requests got an unexpected status or no
+response exits with status 2 without comparing or saving anything.
+``--save-baseline`` writes the results as JSON to commit with a change;
+``--baseline`` compares a run with a saved file and flags flows whose p95
+grew, throughput fell or query count rose beyond ``--tolerance``.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+from typing import Any, Callable
+
+from .asgi_vs_wsgi import run_outbox_worker, start_asgi, start_wsgi
+from .common import (
+    seed_appointments,
+    seed_availability,
+    seed_doctors,
+    seed_patients,
+    setup_django,
+    summarize,
+)
+from .fakes import fake_calendar_server, fake_email_server
+
+DEFAULT_MIX = {
+    'search': 30,
+    'availability': 10,
+    'book': 15,
+    'appointments': 10,
+    'schedule': 10,
+    'create_slot': 5,
+    'login': 5,
+    'register': 2,
+}
+# Statuses a healthy run returns; a booking may lose its slot to a hold
+EXPECTED_STATUSES = {
+    'register': {201},
+    'login': {200},
+    'search': {200},
+    'availability': {200},
+    'book': {201, 409},
+    'appointments': {200},
+    'schedule': {200},
+    'create_slot': {201},
+}
+PASSWORD = 'Load-test-Passw0rd!'
+QUERIES_RE = re.compile(r'db;dur=[\d.]+;desc="(\d+) queries"')
+
+Sample = tuple[float, int | None, int | None]  # seconds, status (None: no response), queries
+
+
+def parse_mix(value: str) -> dict[str, int]:
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"Unknown flow {name!r}; choose from {', '.join(DEFAULT_MIX)}")
+        mix[name] = int(weight or 1)
+    return mix
+
+
+def seed(args: argparse.Namespace) -> None:
+    from django.db import connection
+    from django.utils import timezone
+    from scheduling.models import Availability
+
+    if Availability.objects.exists():
+        return
+    started = time.perf_counter()
+    doctor_ids = seed_doctors(args.doctors)
+    patient_ids = seed_patients(args.patients)
+    # Centre each doctor's run of slots on now, so half are bookable
+    span = timedelta(minutes=30) * (args.slots // args.doctors)
+    seed_availability(
+        doctor_ids, args.slots, booked_ratio=args.appointments / args.slots, start=timezone.now() - span / 2
+    )
+    seed_appointments(patient_ids)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    print(f"Seeded in {time.perf_counter() - started:.0f}s")
+
+
+class Client:
+    """One simulated user agent: a patient and a doctor identity plus an anonymous session."""
+
+    def __init__(self, base_url: str, patient_token: str, doctor_token: str):
+        import requests
+
+        self.base_url = base_url
+        self.patient = requests.Session()
+        self.patient.headers['Authorization'] = f'Token {patient_token}'
+        self.doctor = requests.Session()
+        self.doctor.headers['Authorization'] = f'Token {doctor_token}'
+        self.anonymous = requests.Session()
+
+
+class Workload:
+    """The flows, and the shared pools they draw slots, users and names from."""
+
+    def __init__(self, doctor_ids: list[int], free_slot_ids: list[int], login_emails: list[str]):
+        from django.db.models import Max
+        from django.utils import timezone
+        from scheduling.models import Availability
+
+        self.doctor_ids = doctor_ids
+        self.free_slot_ids = free_slot_ids
+        self.login_emails = login_emails
+        self.today = timezone.localdate()
+        # New slots go after every existing one, including earlier runs' on the same database
+        latest = Availability.objects.aggregate(latest=Max('end_time'))['latest'] or timezone.now()
+        self.new_slot_base = latest.replace(second=0, microsecond=0) + timedelta(days=1)
+        # next() on itertools.count is atomic under the GIL
+        self._slots = itertools.count()
+        self._names = itertools.count()
+        self._new_slots = itertools.count()
+        self.run_id = f'{int(time.time()) % 1_000_000}'
+
+    def flows(self) -> dict[str, Callable[[Client, random.Random], Any]]:
+        return {
+            'register': self.register,
+            'login': self.login,
+            'search': self.search,
+            'availability': self.availability,
+            'book': self.book,
+            'appointments': self.appointments,
+            'schedule': self.schedule,
+            'create_slot': self.create_slot,
+        }
+
+    def register(self, client: Client, rng: random.Random) -> Any:
+        n = next(self._names)
+        return client.anonymous.post(f'{client.base_url}/api/auth/register/', json={
+            'username': f'load-{self.run_id}-{n}',
+            'email': f'load-{self.run_id}-{n}@example.com',
+            'first_name': 'Load',
+            'last_name': f'Patient{n}',
+            'password': PASSWORD,
+            'password_confirm': PASSWORD,
+            'role': 'patient',
+        })
+
+    def login(self, client: Client, rng: random.Random) -> Any:
+        response = client.anonymous.post(
+            f'{client.base_url}/api/auth/login/', json={'email': rng.choice(self.login_emails), 'password': PASSWORD}
+        )
+        # Login also opens a session; a session cookie would make later POSTs need CSRF tokens
+        client.anonymous.cookies.clear()
+        return response
+
+    def search(self, client: Client, rng: random.Random) -> Any:
+        params: dict[str, str | int] = {'date_from': self.today.isoformat()}
+        if rng.random() < 0.5:
+            params['doctor'] = rng.choice(self.doctor_ids)
+        return client.patient.get(f'{client.base_url}/api/scheduling/availability/search/', params=params)
+
+    def availability(self, client: Client, rng: random.Random) -> Any:
+        return client.patient.get(f'{client.base_url}/api/scheduling/availability/')
+
+    def book(self, client: Client, rng: random.Random) -> Any:
+        index = next(self._slots)
+        if index >= len(self.free_slot_ids):
+            return None
+        return client.patient.post(
+            f'{client.base_url}/api/scheduling/appointments/', json={'availability': self.free_slot_ids[index]}
+        )
+
+    def appointments(self, client: Client, rng: random.Random) -> Any:
+        return client.patient.get(f'{client.base_url}/api/scheduling/appointments/')
+
+    def schedule(self, client: Client, rng: random.Random) -> Any:
+        return client.doctor.get(f'{client.base_url}/api/scheduling/availability/schedule/')
+
+    def create_slot(self, client: Client, rng: random.Random) -> Any:
+        start = self.new_slot_base + timedelta(minutes=30) * next(self._new_slots)
+        return client.doctor.post(f'{client.base_url}/api/scheduling/availability/', json={
+            'start_time': start.isoformat(),
+            'end_time': (start + timedelta(minutes=30)).isoformat(),
+        })
+
+
+def run_load(workload: Workload, clients: list[Client], mix: dict[str, int], duration: float,
+             warmup: float) -> dict[str, list[Sample]]:
+    """Drive the mix from one thread per client for ``duration`` seconds after ``warmup``."""
+    flows = workload.flows()
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    samples: dict[str, list[Sample]] = {name: [] for name in names}
+    lock = threading.Lock()
+    measure_from = time.perf_counter() + warmup
+    deadline = measure_from + duration
+
+    def drive(index: int) -> None:
+        import requests
+
+        client = clients[index]
+        rng = random.Random(index)
+        local: list[tuple[str, float, int | None, int | None]] = []
+        try:
+            while True:
+                started = time.perf_counter()
+                if started >= deadline:
+                    break
+                name = rng.choices(names, weights)[0]
+                try:
+                    response = flows[name](client, rng)
+                except requests.ConnectionError:
+                    # Refused or reset by an overloaded server: a failed request, not the end of the client
+                    if started >= measure_from:
+                        local.append((name, time.perf_counter() - started, None, None))
+                    continue
+                if response is None:
+                    continue
+                if started >= measure_from:
+                    match = QUERIES_RE.search(response.headers.get('Server-Timing', ''))
+                    local.append((name, time.perf_counter() - started, response.status_code,
+                                  int(match.group(1)) if match else None))
+        finally:
+            with lock:
+                for name, elapsed, status, queries in local:
+                    samples[name].append((elapsed, status, queries))
+
+    threads = [threading.Thread(target=drive, args=(i,), daemon=True) for i in range(len(clients))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples
+
+
+def report(samples: dict[str, list[Sample]], seconds: float) -> dict[str, dict[str, Any]]:
+    results: dict[str, dict[str, Any]] = {}
+    for name, rows in samples.items():
+        if not rows:
+            continue
+        statuses: dict[str, int] = {}
+        for _, status, _ in rows:
+            key = 'no response' if status is None else str(status)
+            statuses[key] = statuses.get(key, 0) + 1
+        queries = [q for _, _, q in rows if q is not None]
+        results[name] = {
+            **summarize([elapsed for elapsed, _, _ in rows]),
+            'rps': len(rows) / seconds,
+            'errors': sum(1 for _, status, _ in rows if status is None or status >= 500),
+            'unexpected': sum(1 for _, status, _ in rows if status not in EXPECTED_STATUSES[name]),
+            'statuses': statuses,
+            'queries_avg': sum(queries) / len(queries) if queries else None,
+        }
+    return results
+
+
+def print_results(results: dict[str, dict[str, Any]]) -> None:
+    print(f"\n{'flow':<14}{'n':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}  statuses")
+    for name, row in results.items():
+        queries = f"{row['queries_avg']:.1f}" if row['queries_avg'] is not None else '-'
+        print(f"{name:<14}{row['count']:>8}{row['rps']:>9.1f}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}"
+              f"{row['p99_ms']:>10.1f}{queries:>9}  {row['statuses']}")
+
+
+def unhealthy_flows(results: dict[str, dict[str, Any]], max_unexpected: float) -> list[str]:
+    """Lines describing each flow whose share of unexpected statuses exceeds ``max_unexpected``."""
+    return [
+        f"{name}: {row['unexpected']}/{row['count']} unexpected {row['statuses']}"
+        for name, row in results.items() if row['unexpected'] > row['count'] * max_unexpected
+    ]
+
+
+def compare(results: dict[str, dict[str, Any]], baseline: dict[str, Any], tolerance: float) -> list[str]:
+    """Lines describing each flow that regressed against ``baseline`` beyond ``tolerance``."""
+    regressions = []
+    print(f"\n{'flow':<14}{'p95 ms':>18}{'rps':>18}{'queries':>16}")
+    for name, row in results.items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        p95_change = row['p95_ms'] / base['p95_ms'] - 1 if base['p95_ms'] else 0.0
+        rps_change = row['rps'] / base['rps'] - 1 if base['rps'] else 0.0
+        print(f"{name:<14}{base['p95_ms']:>8.1f} -> {row['p95_ms']:<7.1f}{base['rps']:>8.1f} -> {row['rps']:<7.1f}"
+              f"{base['queries_avg'] or 0:>6.1f} -> {row['queries_avg'] or 0:.1f}")
+        if p95_change > tolerance:
+            regressions.append(f"{name}: p95 {base['p95_ms']:.1f}ms -> {row['p95_ms']:.1f}ms ({p95_change:+.0%})")
+        if rps_change < -tolerance:
+            regressions.append(f"{name}: throughput {base['rps']:.1f} -> {row['rps']:.1f} req/s ({rps_change:+.0%})")
+        # Query counts barely vary between runs, so any real increase is a code change
+        if base['queries_avg'] is not None and row['queries_avg'] is not None \
+                and row['queries_avg'] > base['queries_avg'] + 0.5:
+            regressions.append(f"{name}: queries per request {base['queries_avg']:.1f} -> {row['queries_avg']:.1f}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='SQLite file to use, seeded on first use (default: a temporary file)')
+    parser.add_argument('--doctors', type=int, default=2000)
+    parser.add_argument('--patients', type=int, default=20_000)
+    parser.add_argument('--slots', type=int, default=2_000_000)
+    parser.add_argument('--appointments', type=int, default=200_000)
+    parser.add_argument('--server', choices=('wsgi', 'asgi'), default='wsgi')
+    parser.add_argument('--workers', type=int, default=16, help='WSGI request threads')
+    parser.add_argument('--port', type=int, default=8775)
+    parser.add_argument('--concurrency', type=int, default=32, help='Concurrent clients')
+    parser.add_argument('--duration', type=float, default=60.0, help='Measured seconds')
+    parser.add_argument('--warmup', type=float, default=5.0, help='Unmeasured seconds before measuring')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help='Flow weights, e.g. "search=30,book=10" (default: %(default)s)')
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds added by each fake upstream call')
+    parser.add_argument('--seed', type=int, default=1, help='Seed for the order bookable slots are handed out in')
+    parser.add_argument('--save-baseline', type=Path, help='Write the results to this JSON file')
+    parser.add_argument('--baseline', type=Path, help='Compare the results with this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed p95/throughput change (0.2 = 20%%)')
+    parser.add_argument('--max-unexpected', type=float, default=0.05,
+                        help='Share of unexpected statuses per flow that invalidates the run (0.05 = 5%%)')
+    parser.add_argument('--fail-on-regression', action='store_true', help='Exit with status 1 on a regression')
+    args = parser.parse_args()
+
+    calendar = fake_calendar_server(latency=args.latency)
+    email = fake_email_server(latency=args.latency)
+    os.environ['GOOGLE_CALENDAR_API_ROOT'] = calendar.url
+    os.environ['EMAIL_SERVICE_URL'] = email.url
+    db_label = setup_django(args.db)
+    seed(args)
+
+    from django.contrib.auth.hashers import make_password
+    from django.db import connection
+    from django.utils import timezone
+    from rest_framework.authtoken.models import Token
+    from scheduling.models import Appointment, Availability
+    from users.models import User
+
+    doctor_ids = list(User.objects.filter(role='doctor', username__startswith='bench-').values_list('id', flat=True))
+    patient_ids = list(User.objects.filter(role='patient', username__startswith='bench-').values_list('id', flat=True))
+    # One hash for every login user: hashing is what the login flow measures, not the setup
+    login_ids = patient_ids[:200]
+    User.objects.filter(pk__in=login_ids).update(password=make_password(PASSWORD))
+    login_emails = list(User.objects.filter(pk__in=login_ids).values_list('email', flat=True))
+
+    client_doctors = doctor_ids[:args.concurrency]
+    client_patients = patient_ids[-args.concurrency:]
+    Token.objects.bulk_create(
+        [Token(user_id=pk, key=Token.generate_key()) for pk in [*client_doctors, *client_patients]],
+        ignore_conflicts=True
+    )
+    tokens = dict(Token.objects.filter(user_id__in=[*client_doctors, *client_patients]).values_list('user_id', 'key'))
+
+    free_slot_ids = list(
+        Availability.objects.filter(start_time__gt=timezone.now() + timedelta(hours=1), is_booked=False, is_blocked=False)
+        .values_list('id', flat=True)[:200_000]
+    )
+    random.Random(args.seed).shuffle(free_slot_ids)
+    print(f"{User.objects.filter(role='doctor').count()} doctors, {User.objects.filter(role='patient').count()} patients, "
+          f"{Availability.objects.count()} slots, {Appointment.objects.count()} appointments on {db_label}")
+    connection.close()
+
+    stop_server = start_wsgi(args.port, args.workers) if args.server == 'wsgi' else start_asgi(args.port)
+    stop_worker = threading.Event()
+    worker = threading.Thread(target=run_outbox_worker, args=(stop_worker,), daemon=True)
+    worker.start()
+
+    base_url = f'http://127.0.0.1:{args.port}'
+    clients = [
+        Client(base_url, tokens[client_patients[i % len(client_patients)]], tokens[client_doctors[i % len(client_doctors)]])
+        for i in range(args.concurrency)
+    ]
+    workload = Workload(doctor_ids, free_slot_ids, login_emails)
+    print(f"{args.server}: {args.concurrency} clients for {args.duration:.0f}s (+{args.warmup:.0f}s warm-up), "
+          f"upstream latency {args.latency}s")
+    try:
+        samples = run_load(workload, clients, args.mix, args.duration, args.warmup)
+    finally:
+        stop_worker.set()
+        worker.join()
+        stop_server()
+
+    seconds = args.duration
+    results = report(samples, seconds)
+    print_results(results)
+    total = sum(row['count'] for row in results.values())
+    print(f"\ntotal {total} requests, {total / seconds:.1f} req/s; upstream calls: calendar={calendar.counts} email={email.counts}")
+
+    unhealthy = unhealthy_flows(results, args.max_unexpected)
+    if unhealthy:
+        # Timings of requests that failed early say nothing about the code under test
+        print("\nRun invalid, too many unexpected responses:\n  " + "\n  ".join(unhealthy))
+        sys.exit(2)
+
+    config = {
+        key: getattr(args, key) for key in
+        ('doctors', 'patients', 'slots', 'appointments', 'server', 'workers', 'concurrency', 'duration', 'mix', 'latency')
+    }
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        changed = {key: (baseline['config'].get(key), value) for key, value in config.items()
+                   if baseline['config'].get(key) != value}
+        if changed:
+            print(f"\nWarning: settings differ from the baseline: {changed}")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions beyond tolerance:\n  " + "\n  ".join(regressions))
+            if args.fail_on_regression:
+                sys.exit(1)
+        else:
+            print("\nNo regressions beyond tolerance.")
+    if args.save_baseline:
+        args.save_baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.save_baseline.write_text(json.dumps({
+            'config': config,
+            'python': sys.version.split()[0],
+            'database': connection.vendor,
+            'results': results,
+        }, indent=2, sort_keys=True) + '\n')
+        print(f"Baseline written to {args.save_baseline}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Deep-page latency: PageNumberPagination (COUNT + OFFSET) versus the keyset
+cursor pagination used by the availability list.
+
+    python -m benchmarks.pagination --rows 500000 --page 1000
+"""
+import argparse
+import sys
+from urllib.parse import parse_qs, urlparse
+
+from .common import measure, print_summary, seed_availability, seed_doctors, setup_django
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='SQLite file to use (default: a temporary file)')
+    parser.add_argument('--rows', type=int, default=500_000)
+    parser.add_argument('--doctors', type=int, default=500)
+    parser.add_argument('--page', type=int, default=1000)
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    db_path = setup_django(args.db)
+
+    from rest_framework.pagination import Cursor, PageNumberPagination
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+    from scheduling.models import Availability
+    from scheduling.pagination import AvailabilityCursorPagination
+
+    if not Availability.objects.exists():
+        print(f"Seeding {args.rows:,} availability rows into {db_path} ...")
+        seed_availability(seed_doctors(args.doctors), args.rows, booked_ratio=0.0)
+
+    factory = APIRequestFactory()
+    # Open slots, as patients list them, so both sides can use avail_open_start_idx
+    open_slots = Availability.objects.filter(is_booked=False)
+    queryset = open_slots.order_by('start_time', 'id')
+    page_size = 20
+
+    def page_number() -> list:
+        paginator = PageNumberPagination()
+        paginator.page_size = page_size
+        request = Request(factory.get('/', {'page': args.page}))
+        return paginator.paginate_queryset(queryset, request) or []
+
+    # Cursor for the same page, as following next links would reach it: the
+    # (start_time, id) position of the row just before the page's first row.
+    params = {}
+    if args.page > 1:
+        before = queryset[(args.page - 1) * page_size - 1]
+        encoder = AvailabilityCursorPagination()
+        encoder.base_url = 'http://testserver/'
+        position = encoder._get_position_from_instance(before, encoder.get_ordering(None, queryset, None))
+        cursor_url = encoder.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+        params['cursor'] = parse_qs(urlparse(cursor_url).query)['cursor'][0]
+
+    def keyset() -> list:
+        paginator = AvailabilityCursorPagination()
+        request = Request(factory.get('/', params))
+        return paginator.paginate_queryset(open_slots, request) or []
+
+    if page_number() != keyset():
+        sys.exit("The cursor does not select the same page as the page number")
+
+    print(f"{Availability.objects.count():,} rows, page {args.page} of {page_size}")
+    print_summary('PageNumberPagination (COUNT + OFFSET)', measure(page_number, args.iterations, warmup=5))
+    print_summary('AvailabilityCursorPagination (keyset)', measure(keyset, args.iterations, warmup=5))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,28 @@
+import html
 import json
 import os
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import TYPE_CHECKING
 
-# Load .env file if available
-try:
-    from dotenv import load_dotenv
-    load_dotenv()
-except ImportError:
-    pass
+# smtplib (which loads ssl), email.mime and boto3 are imported by the
+# providers that use them, keeping them out of cold starts that don't
+if TYPE_CHECKING:
+    import smtplib
+
+# Load .env file if available; Lambda gets its configuration from the environment
+if not os.environ.get('AWS_LAMBDA_FUNCTION_NAME'):
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
 
 # --- Configuration ---
 DEV_MODE = os.environ.get('DEV_MODE', 'True').lower() == 'true'
@@ -20,53 +33,203 @@ SMTP_HOST = os.environ.get('SMTP_HOST', 'localhost')
 SMTP_PORT = int(os.environ.get('SMTP_PORT', '1025'))
 SMTP_USER = os.environ.get('SMTP_USER', '')
 SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD', '')
+SMTP_TIMEOUT = float(os.environ.get('SMTP_TIMEOUT', '10'))
+SMTP_POOL_SIZE = int(os.environ.get('SMTP_POOL_SIZE', '2'))
+SMTP_IDLE_TIMEOUT = float(os.environ.get('SMTP_IDLE_TIMEOUT', '60'))
+SES_MAX_POOL_CONNECTIONS = int(os.environ.get('SES_MAX_POOL_CONNECTIONS', '10'))
+EMAIL_BATCH_MAX_MESSAGES = int(os.environ.get('EMAIL_BATCH_MAX_MESSAGES', '500'))
+EMAIL_BATCH_WORKERS = int(os.environ.get('EMAIL_BATCH_WORKERS', '10'))
 
 
 # --- Email Templates ---
-def get_signup_welcome_template(data: dict) -> tuple[str, str]:
-    """Generates the HTML for the welcome email."""
-    user_name = data.get('userName', 'User')
-    subject = "Welcome to Our Service!"
-    html_body = f"""
-    <html>
-    <body>
-        <h1>Welcome, {user_name}!</h1>
-        <p>Thank you for signing up for our amazing service. We're excited to have you on board.</p>
-        <p>If you have any questions, feel free to reply to this email.</p>
-        <br>
-        <p>Best Regards,</p>
-        <p>The Team</p>
-    </body>
-    </html>
+# Templates live in email_templates/<name>.html and <name>.txt and use
+# {{ placeholder }} syntax. Each is compiled once per process into a list of
+# literal and placeholder segments; HTML rendering escapes every value.
+TEMPLATE_DIR = Path(__file__).resolve().parent / 'email_templates'
+_PLACEHOLDER = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+
+
+@dataclass(frozen=True)
+class EmailTemplateSpec:
+    name: str
+    subject: str
+    defaults: dict
+
+
+# Dispatch table: adding an email type means adding an entry and its files.
+EMAIL_TEMPLATES: dict[str, EmailTemplateSpec] = {
+    'SIGNUP_WELCOME': EmailTemplateSpec(
+        name='signup_welcome',
+        subject='Welcome to Our Service!',
+        defaults={'userName': 'User'},
+    ),
+    'BOOKING_CONFIRMATION': EmailTemplateSpec(
+        name='booking_confirmation',
+        subject='Booking Confirmation #{{ bookingId }}',
+        defaults={'userName': 'User', 'bookingId': 'N/A', 'details': 'No details provided.'},
+    ),
+    'WAITLIST_OFFER': EmailTemplateSpec(
+        name='waitlist_offer',
+        subject='A slot with Dr. {{ doctorName }} is available',
+        defaults={'userName': 'User', 'doctorName': 'your doctor', 'startTime': 'soon', 'expiresAt': 'shortly'},
+    ),
+}
+
+
+class CompiledTemplate:
+    """A template pre-split into literals (even indexes) and placeholder names (odd indexes)."""
+
+    def __init__(self, source: str, autoescape: bool):
+        self._parts = _PLACEHOLDER.split(source)
+        self._escape = html.escape if autoescape else str
+
+    def render(self, context: dict) -> str:
+        parts = self._parts.copy()
+        for i in range(1, len(parts), 2):
+            parts[i] = self._escape(str(context.get(parts[i], '')))
+        return ''.join(parts)
+
+
+@dataclass(frozen=True)
+class CompiledEmail:
+    spec: EmailTemplateSpec
+    subject: CompiledTemplate
+    html: CompiledTemplate
+    text: CompiledTemplate | None
+
+
+@lru_cache(maxsize=None)
+def get_email_template(action: str) -> CompiledEmail | None:
+    """Loads and compiles the templates for an action on first use."""
+    spec = EMAIL_TEMPLATES.get(action)
+    if spec is None:
+        return None
+    text_path = TEMPLATE_DIR / f'{spec.name}.txt'
+    return CompiledEmail(
+        spec=spec,
+        subject=CompiledTemplate(spec.subject, autoescape=False),
+        html=CompiledTemplate((TEMPLATE_DIR / f'{spec.name}.html').read_text(encoding='utf-8'), autoescape=True),
+        text=CompiledTemplate(text_path.read_text(encoding='utf-8'), autoescape=False) if text_path.exists() else None,
+    )
+
+
+def render_email(action: str, data: dict) -> tuple[str, str, str | None] | None:
+    """Returns (subject, html_body, text_body) for an action, or None if the action is unknown."""
+    template = get_email_template(action)
+    if template is None:
+        return None
+    context = {**template.spec.defaults, **data}
+    # A value containing CR/LF must not add lines to the Subject header
+    subject = ' '.join(template.subject.render(context).split())
+    return (
+        subject,
+        template.html.render(context),
+        template.text.render(context) if template.text else None,
+    )
+
+
+# --- Connection Pools ---
+# Module-level so they survive warm Lambda invocations and long-running workers.
+class SMTPConnectionPool:
     """
-    return subject, html_body
-
-
-def get_booking_confirmation_template(data: dict) -> tuple[str, str]:
-    """Generates the HTML for the booking confirmation email."""
-    user_name = data.get('userName', 'User')
-    booking_id = data.get('bookingId', 'N/A')
-    booking_details = data.get('details', 'No details provided.')
-    subject = f"Booking Confirmation #{booking_id}"
-    html_body = f"""
-    <html>
-    <body>
-        <h1>Booking Confirmed, {user_name}!</h1>
-        <p>Your booking with ID <strong>{booking_id}</strong> has been successfully confirmed.</p>
-        <h3>Booking Details:</h3>
-        <p>{booking_details}</p>
-        <br>
-        <p>We look forward to seeing you!</p>
-        <p>Best Regards,</p>
-        <p>The Team</p>
-    </body>
-    </html>
+    Keeps up to ``size`` authenticated SMTP connections open between sends.
+
+    Connections idle for longer than ``idle_timeout`` are closed instead of
+    reused (servers drop them anyway), and a connection that raises during a
+    send is discarded so the next checkout reconnects.
     """
-    return subject, html_body
+
+    def __init__(self, size: int, idle_timeout: float):
+        self.idle_timeout = idle_timeout
+        self._idle: list[tuple['smtplib.SMTP', float]] = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _connect(self) -> 'smtplib.SMTP':
+        import smtplib
+
+        server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+        if SMTP_USER and SMTP_PASSWORD:
+            server.starttls()
+            server.login(SMTP_USER, SMTP_PASSWORD)
+        return server
+
+    @staticmethod
+    def _close(server: 'smtplib.SMTP') -> None:
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    def _checkout(self) -> 'smtplib.SMTP':
+        now = time.monotonic()
+        stale = []
+        server = None
+        with self._lock:
+            while self._idle:
+                candidate, last_used = self._idle.pop()
+                if now - last_used > self.idle_timeout:
+                    stale.append(candidate)
+                else:
+                    server = candidate
+                    break
+        for candidate in stale:
+            self._close(candidate)
+        return server or self._connect()
+
+    @contextmanager
+    def connection(self):
+        self._slots.acquire()
+        try:
+            server = self._checkout()
+            try:
+                yield server
+            except Exception:
+                self._close(server)
+                raise
+            with self._lock:
+                self._idle.append((server, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    def close_all(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for server, _ in idle:
+            self._close(server)
+
+
+_smtp_pool = SMTPConnectionPool(SMTP_POOL_SIZE, SMTP_IDLE_TIMEOUT)
+
+_ses_client = None
+_ses_client_lock = threading.Lock()
+
+
+def get_ses_client():
+    """Returns the shared SES client, creating it on first use."""
+    global _ses_client
+    if _ses_client is None:
+        import boto3
+        from botocore.config import Config
+
+        with _ses_client_lock:
+            if _ses_client is None:
+                _ses_client = boto3.client(
+                    'ses',
+                    region_name=AWS_SES_REGION,
+                    config=Config(max_pool_connections=SES_MAX_POOL_CONNECTIONS, retries={'mode': 'standard'}),
+                )
+    return _ses_client
+
+
+def reset_ses_client() -> None:
+    global _ses_client
+    with _ses_client_lock:
+        _ses_client = None
 
 
 # --- Email Sending Logic ---
-def send_via_console(recipient: str, subject: str, html_body: str) -> bool:
+def send_via_console(recipient: str, subject: str, html_body: str, text_body: str | None = None) -> bool:
     """Prints email to console for development/testing."""
     print("\n" + "=" * 60)
     print("[EMAIL SENT] (Console Output)")
@@ -77,29 +240,46 @@ def send_via_console(recipient: str, subject: str, html_body: str) -> bool:
     print("-" * 60)
     print("BODY:")
     print(html_body)
+    if text_body:
+        print("-" * 60)
+        print("TEXT BODY:")
+        print(text_body)
     print("=" * 60 + "\n")
     return True
 
 
-def send_via_ses(recipient: str, subject: str, html_body: str) -> bool:
+def _provider_failed(
+    reason: str, fallback: bool, recipient: str, subject: str, html_body: str, text_body: str | None
+) -> bool:
+    """Prints the email to the console instead, or reports failure when ``fallback`` is off."""
+    if not fallback:
+        print(f"{reason}. Email to {recipient} not sent.")
+        return False
+    print(f"{reason}. Falling back to console.")
+    return send_via_console(recipient, subject, html_body, text_body)
+
+
+def send_via_ses(
+    recipient: str, subject: str, html_body: str, text_body: str | None = None, *, fallback: bool = True
+) -> bool:
     """Sends an email using AWS SES."""
     try:
         import boto3
-        from botocore.exceptions import ClientError, NoCredentialsError
     except ImportError:
-        print("boto3 not installed. Falling back to console.")
-        return send_via_console(recipient, subject, html_body)
+        return _provider_failed("boto3 not installed", fallback, recipient, subject, html_body, text_body)
 
     if not SENDER_EMAIL:
-        print("SENDER_EMAIL not configured. Falling back to console.")
-        return send_via_console(recipient, subject, html_body)
+        return _provider_failed("SENDER_EMAIL not configured", fallback, recipient, subject, html_body, text_body)
+
+    body = {'Html': {'Charset': 'UTF-8', 'Data': html_body}}
+    if text_body:
+        body['Text'] = {'Charset': 'UTF-8', 'Data': text_body}
 
     try:
-        ses_client = boto3.client('ses', region_name=AWS_SES_REGION)
-        response = ses_client.send_email(
+        response = get_ses_client().send_email(
             Destination={'ToAddresses': [recipient]},
             Message={
-                'Body': {'Html': {'Charset': 'UTF-8', 'Data': html_body}},
+                'Body': body,
                 'Subject': {'Charset': 'UTF-8', 'Data': subject},
             },
             Source=SENDER_EMAIL,
@@ -107,50 +287,116 @@ def send_via_ses(recipient: str, subject: str, html_body: str) -> bool:
         print(f"SES email sent! Message ID: {response['MessageId']}")
         return True
     except Exception as e:
-        print(f"SES error: {e}. Falling back to console.")
-        return send_via_console(recipient, subject, html_body)
-
+        # Rebuild the client next time in case credentials or endpoint went bad
+        reset_ses_client()
+        return _provider_failed(f"SES error: {e}", fallback, recipient, subject, html_body, text_body)
 
-def send_via_smtp(recipient: str, subject: str, html_body: str) -> bool:
-    """Sends an email using SMTP server."""
-    if not SENDER_EMAIL:
-        print("SENDER_EMAIL not configured. Falling back to console.")
-        return send_via_console(recipient, subject, html_body)
 
-    requires_auth = bool(SMTP_USER and SMTP_PASSWORD)
+def _smtp_message(recipient: str, subject: str, html_body: str, text_body: str | None) -> str:
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
 
     msg = MIMEMultipart('alternative')
     msg['Subject'] = subject
     msg['From'] = SENDER_EMAIL
     msg['To'] = recipient
+    # Clients show the last alternative they support, so plain text goes first
+    if text_body:
+        msg.attach(MIMEText(text_body, 'plain'))
     msg.attach(MIMEText(html_body, 'html'))
+    return msg.as_string()
 
-    try:
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
-            if requires_auth:
-                server.starttls()
-                server.login(SMTP_USER, SMTP_PASSWORD)
-            server.sendmail(SENDER_EMAIL, recipient, msg.as_string())
-        print(f"SMTP email sent to {recipient}!")
+
+def send_many_via_smtp(messages: list[tuple[str, str, str, str | None]]) -> list[str | None]:
+    """
+    Sends (recipient, subject, html_body, text_body) messages over one pooled
+    SMTP connection. Returns an error per message, or None where it was sent.
+
+    A message the server refuses fails on its own and the connection carries
+    on; a dropped connection is replaced once before the rest are given up.
+    """
+    if not SENDER_EMAIL:
+        return ["SENDER_EMAIL not configured"] * len(messages)
+
+    import smtplib
+
+    payloads = [
+        (recipient, _smtp_message(recipient, subject, html_body, text_body))
+        for recipient, subject, html_body, text_body in messages
+    ]
+    errors: list[str | None] = []
+    retried = False
+    while len(errors) < len(payloads):
+        try:
+            with _smtp_pool.connection() as server:
+                for recipient, payload in payloads[len(errors):]:
+                    try:
+                        server.sendmail(SENDER_EMAIL, recipient, payload)
+                        print(f"SMTP email sent to {recipient}!")
+                        errors.append(None)
+                    except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException) as e:
+                        # smtplib resets the transaction, so the connection is still usable
+                        errors.append(f"SMTP error: {e}")
+                    retried = False
+        except (smtplib.SMTPServerDisconnected, ConnectionError) as e:
+            # A pooled connection may have been dropped by the server; retry once on a fresh one
+            if retried:
+                errors.extend([f"SMTP error: {e}"] * (len(payloads) - len(errors)))
+            retried = True
+        except Exception as e:
+            errors.extend([f"SMTP error: {e}"] * (len(payloads) - len(errors)))
+    return errors
+
+
+def send_via_smtp(
+    recipient: str, subject: str, html_body: str, text_body: str | None = None, *, fallback: bool = True
+) -> bool:
+    """Sends an email using SMTP server."""
+    error = send_many_via_smtp([(recipient, subject, html_body, text_body)])[0]
+    if error is None:
         return True
-    except Exception as e:
-        print(f"SMTP error: {e}. Falling back to console.")
-        return send_via_console(recipient, subject, html_body)
+    return _provider_failed(error, fallback, recipient, subject, html_body, text_body)
 
 
-def send_email_internal(recipient: str, subject: str, html_body: str) -> bool:
-    """Routes email to the appropriate provider."""
+def send_email_internal(
+    recipient: str, subject: str, html_body: str, text_body: str | None = None, *, fallback: bool = True
+) -> bool:
+    """
+    Routes email to the appropriate provider. A provider that fails prints the
+    email to the console instead unless ``fallback`` is False.
+    """
     provider = EMAIL_SERVICE_PROVIDER.upper()
 
     if DEV_MODE:
-        return send_via_console(recipient, subject, html_body)
+        return send_via_console(recipient, subject, html_body, text_body)
 
     if provider == 'SES':
-        return send_via_ses(recipient, subject, html_body)
+        return send_via_ses(recipient, subject, html_body, text_body, fallback=fallback)
     elif provider == 'SMTP':
-        return send_via_smtp(recipient, subject, html_body)
+        return send_via_smtp(recipient, subject, html_body, text_body, fallback=fallback)
     else:
-        return send_via_console(recipient, subject, html_body)
+        return send_via_console(recipient, subject, html_body, text_body)
+
+
+def _batch_worker_count() -> int:
+    """Concurrency for batch sends, bounded by what the provider can use."""
+    provider = EMAIL_SERVICE_PROVIDER.upper()
+    if DEV_MODE or provider not in ('SES', 'SMTP'):
+        return 1  # console output must not interleave
+    if provider == 'SMTP':
+        # Each worker holds one pooled connection for the whole batch
+        return max(1, min(EMAIL_BATCH_WORKERS, SMTP_POOL_SIZE))
+    return max(1, min(EMAIL_BATCH_WORKERS, SES_MAX_POOL_CONNECTIONS))
+
+
+_batch_executor: ThreadPoolExecutor | None = None
+
+
+def _get_batch_executor() -> ThreadPoolExecutor:
+    global _batch_executor
+    if _batch_executor is None:
+        _batch_executor = ThreadPoolExecutor(max_workers=_batch_worker_count(), thread_name_prefix='email-batch')
+    return _batch_executor
 
 
 # --- Main Lambda Handler ---
@@ -168,17 +414,15 @@ def send_email(event: dict, context: object) -> dict:
                 'body': json.dumps({'message': 'Error: "action" and "recipient" are required.'})
             }
 
-        if action == 'SIGNUP_WELCOME':
-            subject, html_body = get_signup_welcome_template(data)
-        elif action == 'BOOKING_CONFIRMATION':
-            subject, html_body = get_booking_confirmation_template(data)
-        else:
+        rendered = render_email(action, data)
+        if rendered is None:
             return {
                 'statusCode': 400,
                 'body': json.dumps({'message': f'Error: Unknown action "{action}"'})
             }
+        subject, html_body, text_body = rendered
 
-        success = send_email_internal(recipient, subject, html_body)
+        success = send_email_internal(recipient, subject, html_body, text_body)
 
         if success:
             return {
@@ -202,3 +446,106 @@ def send_email(event: dict, context: object) -> dict:
             'statusCode': 500,
             'body': json.dumps({'message': 'An internal server error occurred.'})
         }
+
+
+def send_email_batch(event: dict, context: object) -> dict:
+    """
+    Sends many emails in one invocation.
+
+    Expects ``{"messages": [{"action", "recipient", "data"}, ...]}``. Messages
+    are rendered up front and sent through a bounded thread pool: over SMTP
+    each worker holds one pooled connection for its share of the batch, over
+    SES each message is a ``send_email`` call on the shared client. (SES bulk
+    sending only renders templates stored in SES, while ours are rendered and
+    escaped here.) A provider failure is reported as ``failed`` rather than
+    printed to the console. Returns a status per message, in request order;
+    207 if some messages failed.
+    """
+    try:
+        body = json.loads(event.get('body', '{}'))
+        messages = body.get('messages')
+
+        if not isinstance(messages, list) or not messages:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'message': 'Error: "messages" must be a non-empty list.'})
+            }
+        if len(messages) > EMAIL_BATCH_MAX_MESSAGES:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'message': f'Error: At most {EMAIL_BATCH_MAX_MESSAGES} messages per batch.'})
+            }
+
+        results: list[dict] = []
+        pending = []
+        for index, message in enumerate(messages):
+            message = message if isinstance(message, dict) else {}
+            action = message.get('action')
+            recipient = message.get('recipient')
+            result = {'index': index, 'recipient': recipient}
+            results.append(result)
+
+            if not action or not recipient:
+                result.update(status='invalid', error='"action" and "recipient" are required.')
+                continue
+            data = message.get('data', {})
+            if not isinstance(data, dict):
+                result.update(status='invalid', error='"data" must be an object.')
+                continue
+            rendered = render_email(action, data)
+            if rendered is None:
+                result.update(status='invalid', error=f'Unknown action "{action}"')
+                continue
+            pending.append((result, recipient, *rendered))
+
+        executor = _get_batch_executor()
+        if not DEV_MODE and EMAIL_SERVICE_PROVIDER.upper() == 'SMTP':
+            # Each worker sends its share of the batch over a single pooled connection
+            workers = _batch_worker_count()
+            chunks = [pending[i::workers] for i in range(min(workers, len(pending)))]
+            chunk_futures = [
+                (chunk, executor.submit(send_many_via_smtp, [message[1:] for message in chunk]))
+                for chunk in chunks
+            ]
+            for chunk, chunk_future in chunk_futures:
+                try:
+                    errors = chunk_future.result()
+                except Exception as e:
+                    errors = [str(e)] * len(chunk)
+                for (result, *_), error in zip(chunk, errors):
+                    if error is None:
+                        result['status'] = 'sent'
+                    else:
+                        result.update(status='failed', error=error)
+        else:
+            futures = [
+                (result, executor.submit(send_email_internal, recipient, subject, html_body, text_body, fallback=False))
+                for result, recipient, subject, html_body, text_body in pending
+            ]
+            for result, future in futures:
+                try:
+                    sent = future.result()
+                    result['status'] = 'sent' if sent else 'failed'
+                except Exception as e:
+                    result.update(status='failed', error=str(e))
+
+        sent_count = sum(1 for result in results if result['status'] == 'sent')
+        return {
+            'statusCode': 200 if sent_count == len(results) else 207,
+            'body': json.dumps({
+                'message': f'{sent_count} of {len(results)} emails sent.',
+                'results': results,
+            })
+        }
+
+    except json.JSONDecodeError:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'message': 'Error: Invalid JSON in request body.'})
+        }
+    except Exception as e:
+        print(f"An unexpected error occurred: {e}")
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'message': 'An internal server error occurred.'})
+        }
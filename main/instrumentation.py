@@ -0,0 +1,200 @@
+"""
+Per-request performance instrumentation.
+
+``main.middleware.InstrumentationMiddleware`` opens a ``RequestMetrics`` for
+each request in a context variable. While it is open, every database query
+(through a connection execute wrapper) and every upstream call wrapped in
+``timed`` (Google Calendar, the email service) adds its count and time to it.
+When the response is ready the middleware sends the totals out as a
+``Server-Timing`` header, one JSON log line, and in-process aggregates that
+``metrics_view`` serves at ``/metrics`` in the Prometheus text format (only
+when ``METRICS_TOKEN`` is set).
+
+Aggregates live in the process: scrape each worker separately. Upstream calls
+made outside a request (the outbox worker, calendar sync) still count toward
+the upstream histogram of the process that made them.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Any, Iterator
+import hmac
+import threading
+
+from django.conf import settings
+from django.http import Http404, HttpRequest, HttpResponse
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, label_names: Labels):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values: dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Labels, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def _label_text(self, labels: Labels, extra: str = '') -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        lines.extend(f'{self.name}{self._label_text(labels)} {value}' for labels, value in values)
+        return lines
+
+
+class Histogram(Counter):
+    def __init__(self, name: str, help_text: str, label_names: Labels, buckets: tuple[float, ...] = DURATION_BUCKETS):
+        super().__init__(name, help_text, label_names)
+        self.buckets = buckets
+        # labels -> [count per bucket..., +Inf count, sum]
+        self._series: dict[Labels, list[float]] = {}
+
+    def observe(self, labels: Labels, value: float) -> None:
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self) -> list[str]:
+        with self._lock:
+            series = sorted((labels, list(values)) for labels, values in self._series.items())
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for labels, values in series:
+            for bound, count in [*zip(self.buckets, values), ('+Inf', values[-2])]:
+                le = f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{self._label_text(labels, le)} {count}')
+            lines.append(f'{self.name}_sum{self._label_text(labels)} {values[-1]}')
+            lines.append(f'{self.name}_count{self._label_text(labels)} {values[-2]}')
+        return lines
+
+
+HTTP_REQUESTS = Counter(
+    'hms_http_requests_total', 'Requests handled, by view and response status.', ('method', 'view', 'status')
+)
+HTTP_DURATION = Histogram(
+    'hms_http_request_duration_seconds', 'Time from request to response object.', ('method', 'view')
+)
+HTTP_DB_QUERIES = Counter('hms_http_db_queries_total', 'Database queries run while handling requests.', ('view',))
+HTTP_DB_SECONDS = Counter('hms_http_db_seconds_total', 'Time spent in database queries while handling requests.', ('view',))
+HTTP_UPSTREAM_SECONDS = Counter(
+    'hms_http_upstream_seconds_total', 'Time spent calling upstream services while handling requests.', ('view', 'upstream')
+)
+UPSTREAM_DURATION = Histogram(
+    'hms_upstream_duration_seconds', 'Calls to Google Calendar and the email service.', ('upstream', 'operation', 'outcome')
+)
+METRICS = (HTTP_REQUESTS, HTTP_DURATION, HTTP_DB_QUERIES, HTTP_DB_SECONDS, HTTP_UPSTREAM_SECONDS, UPSTREAM_DURATION)
+
+
+@dataclass
+class RequestMetrics:
+    started: float = field(default_factory=perf_counter)
+    # name -> [calls, seconds]; "db" plus one entry per upstream
+    spans: dict[str, list[float]] = field(default_factory=dict)
+
+    def add(self, name: str, seconds: float) -> None:
+        span = self.spans.setdefault(name, [0, 0.0])
+        span[0] += 1
+        span[1] += seconds
+
+    def calls(self, name: str) -> int:
+        return int(self.spans.get(name, (0, 0.0))[0])
+
+    def seconds(self, name: str) -> float:
+        return self.spans.get(name, (0, 0.0))[1]
+
+
+_current: ContextVar[RequestMetrics | None] = ContextVar('request_metrics', default=None)
+
+
+def current_request_metrics() -> RequestMetrics | None:
+    return _current.get()
+
+
+@contextmanager
+def collect_request_metrics() -> Iterator[RequestMetrics]:
+    """Collect query and upstream timings of the code run inside the block."""
+    metrics = RequestMetrics()
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def timed(upstream: str, operation: str) -> Iterator[None]:
+    """Time one upstream call, for the current request and the process histogram."""
+    started = perf_counter()
+    outcome = 'ok'
+    try:
+        yield
+    except BaseException:
+        outcome = 'error'
+        raise
+    finally:
+        elapsed = perf_counter() - started
+        UPSTREAM_DURATION.observe((upstream, operation, outcome), elapsed)
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.add(upstream, elapsed)
+
+
+def _time_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add('db', perf_counter() - started)
+
+
+def install_query_timer(connection: Any, **kwargs: Any) -> None:
+    """Time the connection's queries; also a ``connection_created`` receiver."""
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+def render_metrics() -> str:
+    return '\n'.join(line for metric in METRICS for line in metric.render()) + '\n'
+
+
+def metrics_view(request: HttpRequest) -> HttpResponse:
+    """
+    Prometheus scrape endpoint; requires ``Authorization: Bearer <METRICS_TOKEN>``.
+    The aggregates name every view and its traffic, so without a configured
+    token the endpoint does not exist (404).
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if not token:
+        raise Http404()
+    supplied = request.headers.get('Authorization', '')
+    if not supplied:
+        return HttpResponse(status=401)
+    if not hmac.compare_digest(supplied.encode(), f'Bearer {token}'.encode()):
+        return HttpResponse(status=403)
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,99 @@
+from typing import Any
+import json
+import logging
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.http import HttpRequest, HttpResponse
+
+from .instrumentation import (
+    HTTP_DB_QUERIES,
+    HTTP_DB_SECONDS,
+    HTTP_DURATION,
+    HTTP_REQUESTS,
+    HTTP_UPSTREAM_SECONDS,
+    RequestMetrics,
+    collect_request_metrics,
+    install_query_timer,
+)
+
+logger = logging.getLogger(__name__)
+
+# Upstreams reported in Server-Timing and the request log, as passed to ``timed``
+UPSTREAMS = ('calendar', 'email')
+
+
+class InstrumentationMiddleware:
+    """
+    Records query count and time, upstream time and total time per request
+    (see ``main.instrumentation``). Place it first in MIDDLEWARE so the total
+    covers the rest of the stack. Disabled with PERF_INSTRUMENTATION=False.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response: Any):
+        if not getattr(settings, 'PERF_INSTRUMENTATION', True):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        # Connections opened later (new threads, sync_to_async) time their queries too
+        connection_created.connect(install_query_timer, dispatch_uid='main.instrumentation.query_timer')
+
+    def __call__(self, request: HttpRequest) -> Any:
+        if self.async_mode:
+            return self.__acall__(request)
+        install_query_timer(connection)
+        with collect_request_metrics() as metrics:
+            response = self.get_response(request)
+        return self._finish(request, response, metrics)
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        with collect_request_metrics() as metrics:
+            response = await self.get_response(request)
+        return self._finish(request, response, metrics)
+
+    def _finish(self, request: HttpRequest, response: HttpResponse, metrics: RequestMetrics) -> HttpResponse:
+        total = perf_counter() - metrics.started
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unmatched'
+
+        method = request.method or ''
+        HTTP_REQUESTS.inc((method, view, str(response.status_code)))
+        HTTP_DURATION.observe((method, view), total)
+        HTTP_DB_QUERIES.inc((view,), metrics.calls('db'))
+        HTTP_DB_SECONDS.inc((view,), metrics.seconds('db'))
+        for upstream in UPSTREAMS:
+            if metrics.calls(upstream):
+                HTTP_UPSTREAM_SECONDS.inc((view, upstream), metrics.seconds(upstream))
+
+        timings = [f'db;dur={metrics.seconds("db") * 1000:.1f};desc="{metrics.calls("db")} queries"']
+        timings.extend(
+            f'{upstream};dur={metrics.seconds(upstream) * 1000:.1f};desc="{metrics.calls(upstream)} calls"'
+            for upstream in UPSTREAMS if metrics.calls(upstream)
+        )
+        timings.append(f'total;dur={total * 1000:.1f}')
+        existing = response.get('Server-Timing')
+        response['Server-Timing'] = ', '.join([existing, *timings] if existing else timings)
+
+        if logger.isEnabledFor(logging.INFO):
+            record = {
+                'method': method,
+                'path': request.path,
+                'view': view,
+                'status': response.status_code,
+                'duration_ms': round(total * 1000, 1),
+                'db_queries': metrics.calls('db'),
+                'db_ms': round(metrics.seconds('db') * 1000, 1),
+            }
+            for upstream in UPSTREAMS:
+                record[f'{upstream}_calls'] = metrics.calls(upstream)
+                record[f'{upstream}_ms'] = round(metrics.seconds(upstream) * 1000, 1)
+            logger.info(json.dumps(record))
+        return response
@@ -24,6 +24,15 @@ SECRET_KEY = "django-insecure-!78rc2%*_h_kk-vp__quyl4g!p5-rmdh+-^p%tukc0s^finmbd
 
 GOOGLE_CLIENT_SECRETS_FILE = os.path.join(BASE_DIR, "google_calender_secret.json")
 GOOGLE_API_SCOPES = ["https://www.googleapis.com/auth/calendar"]
+# Per-process Calendar API client cache (users.services)
+GOOGLE_CALENDAR_CLIENT_CACHE_SIZE = int(os.getenv('GOOGLE_CALENDAR_CLIENT_CACHE_SIZE', '256'))
+GOOGLE_CALENDAR_CLIENT_TTL = int(os.getenv('GOOGLE_CALENDAR_CLIENT_TTL', '3000'))
+GOOGLE_API_TIMEOUT = int(os.getenv('GOOGLE_API_TIMEOUT', '10'))
+# Point at a local fake (python -m benchmarks.fakes calendar) for testing
+GOOGLE_CALENDAR_API_ROOT = os.getenv('GOOGLE_CALENDAR_API_ROOT', 'https://www.googleapis.com')
+# Incremental calendar sync (python manage.py sync_google_calendars)
+GOOGLE_CALENDAR_SYNC_INTERVAL_SECONDS = int(os.getenv('GOOGLE_CALENDAR_SYNC_INTERVAL_SECONDS', '300'))
+GOOGLE_CALENDAR_SYNC_WORKERS = int(os.getenv('GOOGLE_CALENDAR_SYNC_WORKERS', '8'))
 REDIRECT_URI = "http://localhost:8000/oauth2callback"
 
 # SECURITY WARNING: don't run with debug turned on in production!
@@ -79,7 +88,7 @@ INSTALLED_APPS = [
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
         "rest_framework.authentication.SessionAuthentication",
-        "rest_framework.authentication.TokenAuthentication",
+        "users.authentication.CachedTokenAuthentication",
     ],
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
@@ -87,7 +96,38 @@ REST_FRAMEWORK = {
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 20,
 }
+
+# Outbox worker (scheduling.outbox): retry policy for deferred side effects
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '8'))
+OUTBOX_BACKOFF_BASE_SECONDS = int(os.getenv('OUTBOX_BACKOFF_BASE_SECONDS', '5'))
+OUTBOX_BACKOFF_MAX_SECONDS = int(os.getenv('OUTBOX_BACKOFF_MAX_SECONDS', '3600'))
+OUTBOX_LEASE_SECONDS = int(os.getenv('OUTBOX_LEASE_SECONDS', '300'))
+# Async booking view: run the booking's jobs on the event loop right after commit
+SCHEDULING_EAGER_DISPATCH = os.getenv('SCHEDULING_EAGER_DISPATCH', 'True').lower() == 'true'
+# Cap on concurrent eager dispatches per process; bookings past it leave their jobs to the worker
+SCHEDULING_EAGER_DISPATCH_LIMIT = int(os.getenv('SCHEDULING_EAGER_DISPATCH_LIMIT', '4'))
+OUTBOX_DISPATCH_TIMEOUT_SECONDS = float(os.getenv('OUTBOX_DISPATCH_TIMEOUT_SECONDS', '10'))
+# Shared httpx client for async views (users.async_http)
+ASYNC_HTTP_TIMEOUT = float(os.getenv('ASYNC_HTTP_TIMEOUT', '10'))
+ASYNC_HTTP_MAX_CONNECTIONS = int(os.getenv('ASYNC_HTTP_MAX_CONNECTIONS', '100'))
+
+# Internal email service client (users.email_service)
+EMAIL_SERVICE_URL = os.getenv('EMAIL_SERVICE_URL', 'http://localhost:3003')
+EMAIL_SERVICE_TIMEOUT = float(os.getenv('EMAIL_SERVICE_TIMEOUT', '5'))
+EMAIL_SERVICE_POOL_SIZE = int(os.getenv('EMAIL_SERVICE_POOL_SIZE', '10'))
+EMAIL_SERVICE_BREAKER_THRESHOLD = int(os.getenv('EMAIL_SERVICE_BREAKER_THRESHOLD', '5'))
+EMAIL_SERVICE_BREAKER_RESET_SECONDS = float(os.getenv('EMAIL_SERVICE_BREAKER_RESET_SECONDS', '30'))
+
+# Background email dispatch (users.dispatch). Use
+# 'scheduling.tasks.OutboxEmailBackend' for durable delivery via the outbox.
+EMAIL_DISPATCH_BACKEND = os.getenv('EMAIL_DISPATCH_BACKEND', 'users.dispatch.ThreadPoolEmailBackend')
+EMAIL_DISPATCH_WORKERS = int(os.getenv('EMAIL_DISPATCH_WORKERS', '4'))
+# Per-request timings: Server-Timing header, JSON log line, /metrics aggregates
+PERF_INSTRUMENTATION = os.getenv('PERF_INSTRUMENTATION', 'True').lower() == 'true'
+# /metrics answers 404 unless set, and then requires "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
 MIDDLEWARE = [
+    "main.middleware.InstrumentationMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -117,16 +157,127 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "main.wsgi.application"
 
+# DJANGO_APP_PROFILE=api trims the app for the API Lambda: no admin, messages,
+# static files, dev extensions or browsable API, so a cold start imports and
+# checks less. Run management commands and the admin with the full profile.
+DJANGO_APP_PROFILE = os.getenv('DJANGO_APP_PROFILE', 'full').lower()
+if DJANGO_APP_PROFILE == 'api':
+    API_PROFILE_EXCLUDED_APPS = {
+        "django.contrib.admin",
+        "django.contrib.messages",
+        "django.contrib.staticfiles",
+        "django_extensions",
+    }
+    INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in API_PROFILE_EXCLUDED_APPS]
+    MIDDLEWARE = [m for m in MIDDLEWARE if m != "django.contrib.messages.middleware.MessageMiddleware"]
+    TEMPLATES[0]["OPTIONS"]["context_processors"] = [
+        processor for processor in TEMPLATES[0]["OPTIONS"]["context_processors"]
+        if processor != "django.contrib.messages.context_processors.messages"
+    ]
+    REST_FRAMEWORK["DEFAULT_RENDERER_CLASSES"] = ["rest_framework.renderers.JSONRenderer"]
+
 
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+# DB_ENGINE=postgres selects PostgreSQL (install the "postgres" extra);
+# anything else uses a local SQLite file tuned for concurrent access.
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite').lower()
+
+if DB_ENGINE == 'postgres':
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.getenv('POSTGRES_DB', 'hms'),
+            "USER": os.getenv('POSTGRES_USER', 'postgres'),
+            "PASSWORD": os.getenv('POSTGRES_PASSWORD', ''),
+            "HOST": os.getenv('POSTGRES_HOST', 'localhost'),
+            "PORT": os.getenv('POSTGRES_PORT', '5432'),
+            # Persistent connections, verified before reuse
+            "CONN_MAX_AGE": int(os.getenv('DB_CONN_MAX_AGE', '60')),
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": {},
+        }
     }
-}
+    if os.getenv('DB_POOL', 'False').lower() == 'true':
+        # psycopg connection pool; replaces persistent connections
+        DATABASES["default"]["CONN_MAX_AGE"] = 0
+        DATABASES["default"]["OPTIONS"]["pool"] = {
+            "min_size": int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+            "max_size": int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+            "timeout": int(os.getenv('DB_POOL_TIMEOUT', '10')),
+        }
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.getenv('SQLITE_PATH', BASE_DIR / "db.sqlite3"),
+            "OPTIONS": {
+                # WAL lets readers proceed during writes; NORMAL sync is safe with WAL
+                "init_command": "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;",
+                # Take the write lock at BEGIN so concurrent bookings queue
+                # instead of failing when upgrading a read lock
+                "transaction_mode": "IMMEDIATE",
+                # Seconds to wait on a locked database before raising
+                "timeout": int(os.getenv('SQLITE_BUSY_TIMEOUT', '20')),
+            },
+            # A file rather than the default shared in-memory database, whose
+            # table locks fail at once instead of waiting, so concurrency
+            # tests see the same locking as a deployment
+            "TEST": {"NAME": os.getenv('SQLITE_TEST_PATH', BASE_DIR / "test_db.sqlite3")},
+        }
+    }
+
+
+# Cache
+# Set REDIS_URL to share cached data (free-slot summaries, auth) across processes.
+# Without it those caches are bypassed: the per-process LocMemCache would miss
+# invalidations made by other workers and serve stale slots and tokens.
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "OPTIONS": {"MAX_ENTRIES": 50000},
+        }
+    }
+
+# Seconds a token lookup (user id and permission fields) stays cached
+# (users.authentication), 0 disables. Needs a shared cache: without REDIS_URL
+# a logout could not reach other processes, so it is off by default there
+AUTH_TOKEN_CACHE_TTL = int(os.getenv('AUTH_TOKEN_CACHE_TTL', '300' if REDIS_URL else '0'))
+
+# Seconds a per-doctor, per-day free-slot summary stays cached (scheduling.cache);
+# only used with a shared cache (REDIS_URL)
+SCHEDULING_SLOT_CACHE_TTL = int(os.getenv('SCHEDULING_SLOT_CACHE_TTL', '300'))
+# Searches over more doctor-days than this read Availability instead of the
+# per-doctor, per-day cache, so an all-doctor search cannot flood it
+SCHEDULING_SEARCH_CACHE_MAX_PAIRS = int(os.getenv('SCHEDULING_SEARCH_CACHE_MAX_PAIRS', '500'))
+
+# How concurrent bookings of one slot are serialised (scheduling.booking):
+# "optimistic" (conditional UPDATE) or "locking" (SELECT ... FOR UPDATE)
+SCHEDULING_BOOKING_MODE = os.getenv('SCHEDULING_BOOKING_MODE', 'optimistic')
+
+# Seconds a patient's checkout hold and a waitlist offer reserve a slot (scheduling.holds)
+SCHEDULING_HOLD_SECONDS = int(os.getenv('SCHEDULING_HOLD_SECONDS', '120'))
+SCHEDULING_WAITLIST_OFFER_SECONDS = int(os.getenv('SCHEDULING_WAITLIST_OFFER_SECONDS', '900'))
+# Active holds (waitlist offers included) one patient may have at a time
+SCHEDULING_MAX_HOLDS_PER_PATIENT = int(os.getenv('SCHEDULING_MAX_HOLDS_PER_PATIENT', '3'))
+
+# Pub/sub backend for the slot event stream (scheduling.events); the in-process
+# broker only reaches clients of the same process, use Redis across processes
+SCHEDULING_EVENT_BROKER = os.getenv(
+    'SCHEDULING_EVENT_BROKER',
+    'scheduling.events.RedisBroker' if REDIS_URL else 'scheduling.events.InProcessBroker'
+)
+SCHEDULING_EVENT_KEEPALIVE_SECONDS = int(os.getenv('SCHEDULING_EVENT_KEEPALIVE_SECONDS', '15'))
 
 
 # Password validation
@@ -164,3 +315,19 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/6.0/howto/static-files/
 
 STATIC_URL = "static/"
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        # One JSON line per request from main.middleware.InstrumentationMiddleware
+        "main.middleware": {
+            "handlers": ["console"],
+            "level": os.getenv('REQUEST_LOG_LEVEL', 'INFO'),
+            "propagate": False,
+        },
+    },
+}
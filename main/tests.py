@@ -0,0 +1,42 @@
+import re
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from users.models import User
+
+SERVER_TIMING_DB = re.compile(r'db;dur=(?P<ms>[\d.]+);desc="(?P<queries>\d+) queries"')
+
+
+class InstrumentationMiddlewareTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='pat', email='pat@example.com', role='patient'))
+
+    def test_server_timing_reports_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/scheduling/availability/')
+        self.assertEqual(response.status_code, 200)
+        timing = response['Server-Timing']
+        match = SERVER_TIMING_DB.search(timing)
+        assert match is not None, timing
+        self.assertEqual(int(match['queries']), len(queries))
+        self.assertGreater(float(match['ms']), 0)
+        self.assertRegex(timing, r'total;dur=[\d.]+$')
+
+
+class MetricsViewTests(TestCase):
+    def test_not_served_without_token(self):
+        with override_settings(METRICS_TOKEN=''):
+            self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_requires_the_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('hms_http_requests_total{method="GET",view="metrics",status="403"}', response.content.decode())
@@ -1,9 +1,17 @@
 from users.views import GoogleCalendarRedirectView
-from django.contrib import admin
+from django.apps import apps
 from django.urls import path, include
 
+from .instrumentation import metrics_view
+
 urlpatterns = [
-    path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
     path('oauth2callback', GoogleCalendarRedirectView.as_view(), name='google-calendar-redirect'),
+    path('metrics', metrics_view, name='metrics'),
 ]
+
+# Not installed under DJANGO_APP_PROFILE=api
+if apps.is_installed('django.contrib.admin'):
+    from django.contrib import admin
+
+    urlpatterns.insert(0, path('admin/', admin.site.urls))
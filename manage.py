@@ -7,6 +7,9 @@ import sys
 def main():
     """Run administrative tasks."""
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'main.settings')
+    if sys.argv[1:2] == ['test']:
+        # One JSON line per request would drown the test output
+        os.environ.setdefault('REQUEST_LOG_LEVEL', 'WARNING')
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc:
@@ -1,15 +1,19 @@
 from django.contrib import admin
-from .models import Availability, Appointment
+from django.db import transaction
+from .models import Availability, Appointment, CalendarBlock, OutboxJob, WaitlistEntry
+from .rescheduling import release_booked_slot
 
 @admin.register(Availability)
 class AvailabilityAdmin(admin.ModelAdmin):
-    list_display = ('doctor', 'start_time', 'end_time', 'is_booked')
-    list_filter = ('is_booked', 'start_time', 'doctor__username')
+    list_display = ('doctor', 'start_time', 'end_time', 'is_booked', 'is_blocked', 'held_by', 'hold_expires_at')
+    list_select_related = ('doctor', 'held_by')
+    list_filter = ('is_booked', 'is_blocked', 'start_time', 'doctor__username')
     search_fields = ('doctor__username', 'doctor__email')
 
 @admin.register(Appointment)
 class AppointmentAdmin(admin.ModelAdmin):
     list_display = ('patient', 'get_doctor', 'get_start_time', 'created_at')
+    list_select_related = ('patient', 'availability__doctor')
     list_filter = ('created_at',)
     search_fields = ('patient__username', 'patient__email', 'availability__doctor__username')
 
@@ -20,3 +24,34 @@ class AppointmentAdmin(admin.ModelAdmin):
     def get_start_time(self, obj):
         return obj.availability.start_time
     get_start_time.short_description = 'Slot Time'
+
+    # Deleting an appointment frees its slot, as cancelling through the API does
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            super().delete_model(request, obj)
+            release_booked_slot(obj.availability)
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            slots = [appointment.availability for appointment in queryset.select_related('availability')]
+            super().delete_queryset(request, queryset)
+            for slot in slots:
+                release_booked_slot(slot)
+
+@admin.register(WaitlistEntry)
+class WaitlistEntryAdmin(admin.ModelAdmin):
+    list_display = ('patient', 'doctor', 'created_at', 'offered_slot', 'offer_expires_at')
+    list_select_related = ('patient', 'doctor', 'offered_slot__doctor')
+    search_fields = ('patient__username', 'doctor__username')
+
+@admin.register(CalendarBlock)
+class CalendarBlockAdmin(admin.ModelAdmin):
+    list_display = ('doctor', 'start_time', 'end_time', 'google_event_id')
+    list_select_related = ('doctor',)
+    search_fields = ('doctor__username', 'google_event_id')
+
+@admin.register(OutboxJob)
+class OutboxJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'attempts', 'run_after', 'updated_at')
+    list_filter = ('status', 'kind')
+    readonly_fields = ('created_at', 'updated_at')
@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class SchedulingConfig(AppConfig):
     name = 'scheduling'
+
+    def ready(self):
+        # Registers outbox job handlers and cache invalidation receivers
+        import scheduling.tasks
+        import scheduling.signals
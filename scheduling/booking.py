@@ -0,0 +1,151 @@
+"""
+Booking a slot for a patient.
+
+``SCHEDULING_BOOKING_MODE`` selects how concurrent bookings of one slot are
+serialised:
+
+* ``optimistic`` (default) claims the slot with a single conditional
+  ``UPDATE ... SET is_booked = true WHERE id = ? AND is_booked = false`` and
+  checks the affected row count; the row lock is held only from that UPDATE
+  to commit. The ``Appointment.availability`` one-to-one constraint is the
+  backstop if a claim is ever bypassed.
+* ``locking`` reads the slot with ``SELECT ... FOR UPDATE``, checks it and
+  saves it, holding the row lock for the whole transaction.
+
+Either way a slot held by another patient (see ``scheduling.holds``) cannot
+be booked until the hold lapses; booking clears the booking patient's hold.
+Slots blocked by the doctor's Google Calendar (see
+``scheduling.calendar_sync``) cannot be booked at all.
+"""
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .cache import invalidate_slots
+from .events import SLOT_BOOKED, publish_slot_event
+from .models import Appointment, Availability, OutboxJob, WaitlistEntry
+from .tasks import enqueue_booking_integrations
+
+BOOKING_MODES = ('optimistic', 'locking')
+
+
+class Booking(NamedTuple):
+    appointment: Appointment
+    # Calendar and email jobs queued with the booking
+    jobs: list[OutboxJob]
+
+
+class SlotNotFound(Exception):
+    """The requested availability slot does not exist."""
+
+
+class SlotAlreadyBooked(Exception):
+    """Another booking holds the requested slot."""
+
+
+class SlotHeld(SlotAlreadyBooked):
+    """Another patient holds the requested slot for now."""
+
+
+class SlotBlocked(SlotAlreadyBooked):
+    """The doctor's Google Calendar is busy during the requested slot."""
+
+
+def booking_mode() -> str:
+    mode = getattr(settings, 'SCHEDULING_BOOKING_MODE', 'optimistic')
+    if mode not in BOOKING_MODES:
+        raise ValueError(f"SCHEDULING_BOOKING_MODE must be one of {BOOKING_MODES}, not {mode!r}")
+    return mode
+
+
+def not_held_by_others(patient, now) -> Q:
+    """Matches slots that are unheld, held by ``patient`` or whose hold has expired."""
+    return Q(hold_expires_at__isnull=True) | Q(hold_expires_at__lte=now) | Q(held_by=patient)
+
+
+def book_slot(patient, availability_id) -> Booking:
+    """
+    Book ``availability_id`` for ``patient`` and queue the booking's calendar
+    and email jobs in the same transaction. Returns the appointment and the
+    queued jobs.
+
+    Raises ``SlotNotFound``, ``SlotAlreadyBooked``, ``SlotHeld`` or ``SlotBlocked``.
+    """
+    if booking_mode() == 'locking':
+        return _book_with_lock(patient, availability_id)
+    return _book_optimistic(patient, availability_id)
+
+
+def _book_with_lock(patient, availability_id) -> Booking:
+    with transaction.atomic():
+        try:
+            slot = Availability.objects.select_for_update(of=('self',)).select_related('doctor').get(
+                pk=availability_id
+            )
+        except Availability.DoesNotExist:
+            raise SlotNotFound()
+
+        if slot.is_booked:
+            raise SlotAlreadyBooked()
+        if slot.is_blocked:
+            raise SlotBlocked()
+        if slot.is_held_for_other(patient):
+            raise SlotHeld()
+
+        was_held = slot.held_by_id == patient.pk
+        slot.is_booked = True
+        slot.held_by, slot.hold_expires_at = None, None
+        slot.save(update_fields=['is_booked', 'held_by', 'hold_expires_at'])
+
+        appointment = Appointment.objects.create(patient=patient, availability=slot)
+        if was_held:
+            _close_waitlist_offer(patient, slot)
+        # Calendar and email work runs in the outbox worker after commit
+        jobs = enqueue_booking_integrations(appointment)
+    return Booking(appointment, jobs)
+
+
+def _book_optimistic(patient, availability_id) -> Booking:
+    # Unlocked read: 404s and already-booked slots never reach a write
+    try:
+        slot = Availability.objects.select_related('doctor').get(pk=availability_id)
+    except Availability.DoesNotExist:
+        raise SlotNotFound()
+    now = timezone.now()
+    if slot.is_booked:
+        raise SlotAlreadyBooked()
+    if slot.is_blocked:
+        raise SlotBlocked()
+    if slot.is_held_for_other(patient, now):
+        raise SlotHeld()
+
+    was_held = slot.held_by_id == patient.pk
+    try:
+        with transaction.atomic():
+            claimed = Availability.objects.filter(pk=slot.pk, is_booked=False, is_blocked=False).filter(
+                not_held_by_others(patient, now)
+            ).update(is_booked=True, held_by=None, hold_expires_at=None)
+            if not claimed:
+                raise SlotAlreadyBooked()
+            slot.is_booked = True
+            slot.held_by, slot.hold_expires_at = None, None
+
+            appointment = Appointment.objects.create(patient=patient, availability=slot)
+            if was_held:
+                _close_waitlist_offer(patient, slot)
+            jobs = enqueue_booking_integrations(appointment)
+            # update() sends no post_save, so invalidate and publish here
+            invalidate_slots([slot])
+            publish_slot_event(SLOT_BOOKED, [slot])
+    except IntegrityError:
+        # The one-to-one on Appointment.availability rejected a second booking
+        raise SlotAlreadyBooked()
+    return Booking(appointment, jobs)
+
+
+def _close_waitlist_offer(patient, slot: Availability) -> None:
+    # A patient booking the slot they were offered leaves the waitlist
+    WaitlistEntry.objects.filter(patient=patient, doctor_id=slot.doctor_id).delete()
@@ -0,0 +1,182 @@
+"""
+Cached per-doctor, per-day summaries of free slots and doctor schedules.
+
+The patient slot search reads these summaries instead of querying
+``Availability`` directly. Each summary is a sorted list of
+``(start_time, end_time, slot_id)`` for one doctor's unbooked, unheld, unblocked slots
+on one (local) day. Slot changes invalidate the affected days after commit; cache
+misses for any number of doctor-days are filled with a single query.
+
+Searches spanning more doctor-days than ``SCHEDULING_SEARCH_CACHE_MAX_PAIRS``
+(typically those across every doctor) skip the summaries and page through
+``Availability`` instead, so one search cannot flood the cache.
+
+The doctor schedule keeps every slot of a doctor-day, with its appointment
+and patient name, and is invalidated together with the free-slot summary.
+
+Invalidation only reaches the cache of the process that made the change, so
+the summaries, schedules and the doctor directory are cached only when the
+default cache is shared by every process (Redis); with the per-process
+LocMemCache they are read from the database each time, see
+``slot_cache_enabled``.
+"""
+from datetime import date, datetime, timedelta
+from typing import Any, Iterable
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models import CharField, F, Q, Value
+from django.db.models.functions import Concat
+from django.utils import timezone
+
+from .models import Availability
+
+FreeSlot = tuple[datetime, datetime, int]
+
+DOCTOR_DIRECTORY_KEY = 'scheduling:doctors'
+
+SCHEDULE_FIELDS = (
+    'id', 'start_time', 'end_time', 'is_booked', 'is_blocked', 'hold_expires_at',
+    'appointment_id', 'patient_id', 'patient_name',
+)
+
+
+def _ttl() -> int:
+    return getattr(settings, 'SCHEDULING_SLOT_CACHE_TTL', 300)
+
+
+def slot_cache_enabled() -> bool:
+    """Whether slot data may be cached: only in a cache every process shares."""
+    return _ttl() > 0 and not isinstance(caches['default'], LocMemCache)
+
+
+def free_slots_key(doctor_id: int, day: date) -> str:
+    return f'scheduling:free_slots:{doctor_id}:{day.isoformat()}'
+
+
+def schedule_key(doctor_id: int, day: date) -> str:
+    return f'scheduling:schedule:{doctor_id}:{day.isoformat()}'
+
+
+def slot_day(value: datetime) -> date:
+    return timezone.localdate(value)
+
+
+def day_bounds(day: date) -> tuple[datetime, datetime]:
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(day, datetime.min.time()), tz)
+    return start, start + timedelta(days=1)
+
+
+def invalidate_doctor_days(doctor_id: int, days: Iterable[date]) -> None:
+    """Drop cached summaries and schedules for the given doctor-days once the transaction commits."""
+    if not slot_cache_enabled():
+        return
+    keys = [key(doctor_id, day) for day in set(days) for key in (free_slots_key, schedule_key)]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate_slots(slots: Iterable[Any]) -> None:
+    by_doctor: dict[int, set[date]] = {}
+    for slot in slots:
+        by_doctor.setdefault(slot.doctor_id, set()).add(slot_day(slot.start_time))
+    for doctor_id, days in by_doctor.items():
+        invalidate_doctor_days(doctor_id, days)
+
+
+def invalidate_doctor_directory() -> None:
+    if slot_cache_enabled():
+        transaction.on_commit(lambda: cache.delete(DOCTOR_DIRECTORY_KEY))
+
+
+def doctor_directory() -> dict[int, dict[str, Any]]:
+    """Id -> public details for every doctor, cached until a doctor changes."""
+    use_cache = slot_cache_enabled()
+    directory = cache.get(DOCTOR_DIRECTORY_KEY) if use_cache else None
+    if directory is None:
+        from users.models import User
+
+        directory = {
+            doctor['id']: doctor
+            for doctor in User.objects.filter(role='doctor').values('id', 'username', 'first_name', 'last_name', 'role')
+        }
+        if use_cache:
+            cache.set(DOCTOR_DIRECTORY_KEY, directory, _ttl())
+    return directory
+
+
+def get_free_slots(doctor_ids: Iterable[int], days: list[date]) -> dict[tuple[int, date], list[FreeSlot]]:
+    """Summaries for every (doctor, day) pair, loading all misses in one query."""
+    pairs = [(doctor_id, day) for doctor_id in doctor_ids for day in days]
+    keys = {free_slots_key(doctor_id, day): (doctor_id, day) for doctor_id, day in pairs}
+    use_cache = slot_cache_enabled()
+    cached = cache.get_many(list(keys)) if use_cache else {}
+    summaries = {keys[key]: value for key, value in cached.items()}
+
+    missing = [pair for pair in pairs if pair not in summaries]
+    if missing:
+        loaded: dict[tuple[int, date], list[FreeSlot]] = {pair: [] for pair in missing}
+        range_start = day_bounds(min(day for _, day in missing))[0]
+        range_end = day_bounds(max(day for _, day in missing))[1]
+        rows = Availability.objects.filter(
+            doctor_id__in={doctor_id for doctor_id, _ in missing},
+            start_time__gte=range_start,
+            start_time__lt=range_end,
+            is_booked=False,
+            is_blocked=False
+        ).filter(
+            # Holds invalidate their day when placed, released or swept
+            Q(hold_expires_at__isnull=True) | Q(hold_expires_at__lte=timezone.now())
+        ).order_by('start_time', 'id').values_list('doctor_id', 'start_time', 'end_time', 'id')
+        for doctor_id, start_time, end_time, slot_id in rows:
+            pair = (doctor_id, slot_day(start_time))
+            if pair in loaded:
+                loaded[pair].append((start_time, end_time, slot_id))
+        if use_cache:
+            cache.set_many({free_slots_key(*pair): value for pair, value in loaded.items()}, _ttl())
+        summaries.update(loaded)
+
+    return summaries
+
+
+def get_doctor_schedule(doctor_id: int, days: list[date]) -> dict[date, list[dict[str, Any]]]:
+    """
+    Every slot of the doctor on each day, ordered by start time, with its
+    appointment and patient name. Misses are loaded with one query joining
+    the appointment and patient. Renaming a patient does not invalidate
+    their appointments' days, so names can lag by up to the cache TTL.
+    """
+    keys = {schedule_key(doctor_id, day): day for day in days}
+    use_cache = slot_cache_enabled()
+    cached = cache.get_many(list(keys)) if use_cache else {}
+    schedule = {keys[key]: value for key, value in cached.items()}
+
+    missing = [day for day in days if day not in schedule]
+    if missing:
+        loaded: dict[date, list[dict[str, Any]]] = {day: [] for day in missing}
+        rows = Availability.objects.filter(
+            doctor_id=doctor_id,
+            start_time__gte=day_bounds(min(missing))[0],
+            start_time__lt=day_bounds(max(missing))[1],
+        ).annotate(
+            appointment_id=F('appointment__id'),
+            patient_id=F('appointment__patient_id'),
+            patient_name=Concat(
+                'appointment__patient__first_name', Value(' '), 'appointment__patient__last_name',
+                output_field=CharField()
+            ),
+        ).order_by('start_time', 'id').values(*SCHEDULE_FIELDS)
+        for row in rows:
+            day = slot_day(row['start_time'])
+            if day in loaded:
+                # Concat yields ' ' for slots without an appointment
+                row['patient_name'] = row['patient_name'].strip() if row['patient_id'] else None
+                loaded[day].append(row)
+        if use_cache:
+            cache.set_many({schedule_key(doctor_id, day): value for day, value in loaded.items()}, _ttl())
+        schedule.update(loaded)
+
+    return schedule
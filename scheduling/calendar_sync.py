@@ -0,0 +1,273 @@
+"""
+Incremental sync from doctors' Google Calendars into slot availability.
+
+Each linked doctor keeps Google's ``nextSyncToken`` in
+``User.google_sync_token``, so a sync only lists events changed since the
+previous one. A full listing happens on the first sync and whenever Google
+expires the token (410 Gone), and replaces the doctor's blocks wholesale.
+
+Busy events become ``CalendarBlock`` rows and every future slot overlapping a
+block is marked ``Availability.is_blocked``, which hides it from patients and
+stops it being held or booked. Slots whose last block goes away are unblocked
+and offered to the waitlist. Events this app created for appointments
+(matched on ``doctor_google_event_id`` or the ``hmsAppointmentId`` private
+property) never block; if one is deleted in Google the appointment forgets
+its event id. Our own changes to those events are pushed by outbox jobs in
+``scheduling.tasks``.
+
+``sync_due_calendars`` runs one cycle: it leases doctors not synced for
+``GOOGLE_CALENDAR_SYNC_INTERVAL_SECONDS`` with a conditional UPDATE on
+``google_synced_at`` (so several ``sync_google_calendars`` processes split
+the work) and syncs them on a thread pool, since each sync mostly waits on
+Google.
+"""
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from functools import reduce
+from operator import or_
+from typing import Any, Iterable, NamedTuple
+import logging
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, F, OuterRef, Q, QuerySet
+from django.utils import timezone
+
+from .cache import day_bounds, invalidate_slots
+from .events import SLOT_BLOCKED, SLOT_RELEASED, publish_slot_event
+from .holds import offer_freed_slot
+from .models import Appointment, Availability, CalendarBlock
+from users.models import User
+from users.services import SyncTokenExpired, list_calendar_changes
+
+logger = logging.getLogger(__name__)
+
+# Private extended property set on the events we create for appointments
+APPOINTMENT_EVENT_PROPERTY = 'hmsAppointmentId'
+# Windows per slot query, to keep statements a reasonable size
+WINDOW_CHUNK = 200
+
+Interval = tuple[datetime, datetime]
+
+
+class SyncResult(NamedTuple):
+    doctor_id: int
+    full: bool
+    events: int
+    blocked: int
+    unblocked: int
+
+
+def sync_interval() -> timedelta:
+    return timedelta(seconds=getattr(settings, 'GOOGLE_CALENDAR_SYNC_INTERVAL_SECONDS', 300))
+
+
+def linked_doctors() -> QuerySet[User]:
+    return User.objects.filter(role='doctor', google_refresh_token__isnull=False).exclude(google_refresh_token='')
+
+
+def _parse_time(value: dict[str, Any]) -> datetime | None:
+    if 'dateTime' in value:
+        return datetime.fromisoformat(value['dateTime'])
+    if 'date' in value:
+        # All-day events start at local midnight
+        return day_bounds(date.fromisoformat(value['date']))[0]
+    return None
+
+
+def _busy_interval(event: dict[str, Any], now: datetime) -> Interval | None:
+    """The time an event makes the doctor unavailable, or None if it does not."""
+    if event.get('status') == 'cancelled' or event.get('transparency') == 'transparent':
+        return None
+    start = _parse_time(event.get('start', {}))
+    end = _parse_time(event.get('end', {}))
+    # Past events cannot conflict with bookable slots
+    if start is None or end is None or end <= start or end <= now:
+        return None
+    return start, end
+
+
+def _is_appointment_event(event: dict[str, Any]) -> bool:
+    return APPOINTMENT_EVENT_PROPERTY in event.get('extendedProperties', {}).get('private', {})
+
+
+def _merge(windows: Iterable[Interval]) -> list[Interval]:
+    merged: list[Interval] = []
+    for start, end in sorted(windows):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def blocked_flags(doctor_id: int, intervals: list[Interval]) -> list[bool]:
+    """Whether each interval overlaps one of the doctor's blocks, from a single query."""
+    if not intervals:
+        return []
+    busy = _merge(CalendarBlock.objects.filter(
+        doctor_id=doctor_id,
+        start_time__lt=max(end for _, end in intervals),
+        end_time__gt=min(start for start, _ in intervals),
+    ).values_list('start_time', 'end_time'))
+    busy_ends = [end for _, end in busy]
+    flags = []
+    for start, end in intervals:
+        idx = bisect_right(busy_ends, start)
+        flags.append(idx < len(busy) and busy[idx][0] < end)
+    return flags
+
+
+def refresh_blocked_slots(doctor_id: int, windows: Iterable[Interval], now: datetime | None = None) -> tuple[int, int]:
+    """
+    Re-derive ``is_blocked`` for the doctor's future slots overlapping
+    ``windows`` from the current blocks. Returns (blocked, unblocked) counts.
+    Call inside the transaction that changed the blocks.
+    """
+    now = now or timezone.now()
+    overlapping_block = CalendarBlock.objects.filter(
+        doctor_id=OuterRef('doctor_id'),
+        start_time__lt=OuterRef('end_time'),
+        end_time__gt=OuterRef('start_time'),
+    )
+    merged = _merge(windows)
+    blocked: dict[int, Availability] = {}
+    unblocked: dict[int, Availability] = {}
+    for i in range(0, len(merged), WINDOW_CHUNK):
+        in_windows = reduce(or_, (Q(start_time__lt=end, end_time__gt=start) for start, end in merged[i:i + WINDOW_CHUNK]))
+        slots = Availability.objects.filter(in_windows, doctor_id=doctor_id, end_time__gt=now)
+        blocked.update((slot.pk, slot) for slot in slots.filter(Exists(overlapping_block), is_blocked=False))
+        unblocked.update((slot.pk, slot) for slot in slots.filter(~Exists(overlapping_block), is_blocked=True))
+
+    if blocked:
+        Availability.objects.filter(pk__in=blocked).update(is_blocked=True)
+    if unblocked:
+        Availability.objects.filter(pk__in=unblocked).update(is_blocked=False)
+    # update() sends no post_save, so invalidate and publish here
+    invalidate_slots([*blocked.values(), *unblocked.values()])
+    publish_slot_event(SLOT_BLOCKED, blocked.values())
+    publish_slot_event(SLOT_RELEASED, unblocked.values())
+    for slot in unblocked.values():
+        slot.is_blocked = False
+        if not slot.is_booked:
+            offer_freed_slot(slot, now)
+
+    conflicts = sum(slot.is_booked for slot in blocked.values())
+    if conflicts:
+        logger.warning(f"{conflicts} booked slot(s) of doctor {doctor_id} now overlap busy Google Calendar time")
+    return len(blocked), len(unblocked)
+
+
+def _apply_changes(doctor: User, events: list[dict[str, Any]], full: bool, now: datetime) -> tuple[int, int]:
+    own_ids = set(
+        Appointment.objects.filter(
+            availability__doctor=doctor, doctor_google_event_id__in=[event['id'] for event in events]
+        ).values_list('doctor_google_event_id', flat=True)
+    )
+
+    busy: dict[str, Interval] = {}
+    gone: list[str] = []
+    deleted_own: list[str] = []
+    for event in events:
+        # Deleted events carry only id and status, so match our own by id too
+        if event['id'] in own_ids or _is_appointment_event(event):
+            if event.get('status') == 'cancelled':
+                deleted_own.append(event['id'])
+            continue
+        interval = _busy_interval(event, now)
+        if interval is None:
+            gone.append(event['id'])
+        else:
+            busy[event['id']] = interval
+
+    if deleted_own:
+        # Later updates and deletes must not target an event that no longer exists
+        Appointment.objects.filter(
+            availability__doctor=doctor, doctor_google_event_id__in=deleted_own
+        ).update(doctor_google_event_id=None)
+
+    stale = CalendarBlock.objects.filter(doctor=doctor)
+    if not full:
+        stale = stale.filter(google_event_id__in=[*busy, *gone])
+    windows = list(stale.values_list('start_time', 'end_time'))
+    stale.delete()
+    CalendarBlock.objects.bulk_create([
+        CalendarBlock(doctor=doctor, google_event_id=event_id, start_time=start, end_time=end)
+        for event_id, (start, end) in busy.items()
+    ])
+    windows.extend(busy.values())
+    return refresh_blocked_slots(doctor.pk, windows, now)
+
+
+def sync_doctor_calendar(doctor: User) -> SyncResult:
+    """Apply a doctor's Google Calendar changes since their last sync."""
+    full = not doctor.google_sync_token
+    try:
+        events, next_token = list_calendar_changes(doctor, doctor.google_sync_token)
+    except SyncTokenExpired:
+        logger.info(f"Sync token expired for {doctor.email}; running a full sync")
+        full = True
+        events, next_token = list_calendar_changes(doctor, None)
+
+    now = timezone.now()
+    with transaction.atomic():
+        blocked, unblocked = _apply_changes(doctor, events, full, now)
+        User.objects.filter(pk=doctor.pk).update(google_sync_token=next_token, google_synced_at=now)
+    doctor.google_sync_token, doctor.google_synced_at = next_token, now
+    return SyncResult(doctor.pk, full, len(events), blocked, unblocked)
+
+
+def claim_due_doctors(limit: int, now: datetime | None = None) -> list[User]:
+    """
+    Lease up to ``limit`` linked doctors whose last sync is older than the
+    sync interval, longest-waiting first, by moving their ``google_synced_at``
+    forward with a conditional UPDATE.
+    """
+    now = now or timezone.now()
+    candidates = list(
+        linked_doctors().filter(
+            Q(google_synced_at__isnull=True) | Q(google_synced_at__lte=now - sync_interval())
+        ).order_by(F('google_synced_at').asc(nulls_first=True), 'pk').values_list('pk', 'google_synced_at')[:limit]
+    )
+    claimed_ids = [
+        pk for pk, synced_at in candidates
+        if User.objects.filter(pk=pk, google_synced_at=synced_at).update(google_synced_at=now)
+    ]
+    return list(User.objects.filter(pk__in=claimed_ids))
+
+
+def clear_unlinked_blocks(now: datetime | None = None) -> int:
+    """Drop blocks of doctors who disconnected Google Calendar and unblock their slots."""
+    doctor_ids = set(
+        CalendarBlock.objects.exclude(doctor__in=linked_doctors()).values_list('doctor_id', flat=True).distinct()
+    )
+    for doctor_id in doctor_ids:
+        with transaction.atomic():
+            blocks = CalendarBlock.objects.filter(doctor_id=doctor_id)
+            windows = list(blocks.values_list('start_time', 'end_time'))
+            blocks.delete()
+            refresh_blocked_slots(doctor_id, windows, now)
+    return len(doctor_ids)
+
+
+def _sync_in_thread(doctor: User) -> SyncResult | None:
+    try:
+        return sync_doctor_calendar(doctor)
+    except Exception as e:
+        # Leased already, so the doctor is retried after the next interval
+        logger.error(f"Calendar sync failed for {doctor.email}: {str(e)}")
+        return None
+    finally:
+        connection.close()
+
+
+def sync_due_calendars(limit: int = 1000, workers: int | None = None) -> list[SyncResult]:
+    """Run one sync cycle over up to ``limit`` due doctors. Returns the successful results."""
+    clear_unlinked_blocks()
+    doctors = claim_due_doctors(limit)
+    if not doctors:
+        return []
+    workers = workers or getattr(settings, 'GOOGLE_CALENDAR_SYNC_WORKERS', 8)
+    with ThreadPoolExecutor(max_workers=min(workers, len(doctors)), thread_name_prefix='calendar-sync') as pool:
+        return [result for result in pool.map(_sync_in_thread, doctors) if result is not None]
@@ -0,0 +1,195 @@
+"""
+Slot availability change events for the streaming endpoint.
+
+``publish_slot_event`` is called wherever a slot changes state and hands the
+event to the configured broker after the transaction commits. Each event is
+published on the slot's doctor channel (``doctor:<id>``) and on ``doctors``
+for clients watching every doctor.
+
+The broker is chosen by ``SCHEDULING_EVENT_BROKER`` (a dotted path):
+
+* ``scheduling.events.InProcessBroker`` (default) fans events out to
+  subscribers in the same process. Events from other processes (the outbox
+  worker, the hold sweeper, other server workers) are not seen.
+* ``scheduling.events.RedisBroker`` uses Redis pub/sub on ``REDIS_URL`` so
+  every process shares one feed; needs the ``redis`` extra.
+"""
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Any, AsyncIterator, Iterable
+import asyncio
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+SLOT_CREATED = 'slot.created'
+SLOT_UPDATED = 'slot.updated'
+SLOT_BOOKED = 'slot.booked'
+SLOT_HELD = 'slot.held'
+SLOT_RELEASED = 'slot.released'
+SLOT_BLOCKED = 'slot.blocked'
+SLOT_DELETED = 'slot.deleted'
+
+ALL_DOCTORS_CHANNEL = 'doctors'
+
+
+def doctor_channel(doctor_id: int) -> str:
+    return f'doctor:{doctor_id}'
+
+
+class _Subscription:
+    """
+    A subscriber's bounded mailbox on its event loop. Publishers may call
+    ``deliver`` from any thread; when a slow client falls ``maxsize`` events
+    behind, the oldest are dropped.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, maxsize: int):
+        self._loop = loop
+        self._messages: deque[dict[str, Any]] = deque(maxlen=maxsize)
+        self._ready = asyncio.Event()
+
+    def deliver(self, message: dict[str, Any]) -> None:
+        self._loop.call_soon_threadsafe(self._put, message)
+
+    def _put(self, message: dict[str, Any]) -> None:
+        self._messages.append(message)
+        self._ready.set()
+
+    async def get(self, timeout: float) -> dict[str, Any] | None:
+        """The next event, or None if none arrives within ``timeout`` seconds."""
+        if not self._messages:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        return self._messages.popleft()
+
+
+class InProcessBroker:
+    def __init__(self, max_pending: int | None = None):
+        self.max_pending = max_pending or getattr(settings, 'SCHEDULING_EVENT_MAX_PENDING', 100)
+        self._subscribers: dict[str, set[_Subscription]] = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, channel: str, message: dict[str, Any]) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.deliver(message)
+
+    def publish_many(self, messages: Iterable[tuple[str, dict[str, Any]]]) -> None:
+        """Publish ``(channel, message)`` pairs."""
+        for channel, message in messages:
+            self.publish(channel, message)
+
+    @asynccontextmanager
+    async def subscribe(self, channels: Iterable[str]) -> AsyncIterator[_Subscription]:
+        channels = list(channels)
+        subscription = _Subscription(asyncio.get_running_loop(), self.max_pending)
+        with self._lock:
+            for channel in channels:
+                self._subscribers[channel].add(subscription)
+        try:
+            yield subscription
+        finally:
+            with self._lock:
+                for channel in channels:
+                    self._subscribers[channel].discard(subscription)
+                    if not self._subscribers[channel]:
+                        del self._subscribers[channel]
+
+
+class RedisBroker(InProcessBroker):
+    """
+    Publishes to Redis; each process runs one listener task that relays
+    Redis messages to its local subscribers through the in-process fan-out.
+    """
+    PREFIX = 'scheduling:events:'
+
+    def __init__(self, url: str | None = None, max_pending: int | None = None):
+        import redis
+        import redis.asyncio
+
+        super().__init__(max_pending)
+        self.url = url or getattr(settings, 'REDIS_URL', None) or 'redis://localhost:6379/0'
+        self._client = redis.Redis.from_url(self.url)
+        self._async_redis = redis.asyncio
+        self._listener: asyncio.Task | None = None
+
+    def publish(self, channel: str, message: dict[str, Any]) -> None:
+        self._client.publish(self.PREFIX + channel, json.dumps(message))
+
+    def publish_many(self, messages: Iterable[tuple[str, dict[str, Any]]]) -> None:
+        # One round trip for every PUBLISH instead of one each
+        pipeline = self._client.pipeline(transaction=False)
+        for channel, message in messages:
+            pipeline.publish(self.PREFIX + channel, json.dumps(message))
+        pipeline.execute()
+
+    @asynccontextmanager
+    async def subscribe(self, channels: Iterable[str]) -> AsyncIterator[_Subscription]:
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+        async with super().subscribe(channels) as subscription:
+            yield subscription
+
+    async def _listen(self) -> None:
+        client = self._async_redis.Redis.from_url(self.url)
+        pubsub = client.pubsub()
+        await pubsub.psubscribe(self.PREFIX + '*')
+        try:
+            async for message in pubsub.listen():
+                if message['type'] != 'pmessage':
+                    continue
+                channel = message['channel'].decode()[len(self.PREFIX):]
+                super().publish(channel, json.loads(message['data']))
+        finally:
+            await pubsub.aclose()
+            await client.aclose()
+
+
+@lru_cache(maxsize=1)
+def get_event_broker() -> Any:
+    path = getattr(settings, 'SCHEDULING_EVENT_BROKER', 'scheduling.events.InProcessBroker')
+    return import_string(path)()
+
+
+def _slot_payload(slot: Any) -> dict[str, Any]:
+    return {
+        'id': slot.pk,
+        'doctor': slot.doctor_id,
+        'start_time': slot.start_time.isoformat(),
+        'end_time': slot.end_time.isoformat(),
+    }
+
+
+def publish_slot_event(event_type: str, slots: Iterable[Any]) -> None:
+    """
+    Publish one event per slot once the surrounding transaction commits, in a
+    single ``publish_many`` call (one Redis round trip with ``RedisBroker``).
+    """
+    messages = []
+    for slot in slots:
+        message = {'type': event_type, 'slot': _slot_payload(slot)}
+        messages.append((doctor_channel(slot.doctor_id), message))
+        messages.append((ALL_DOCTORS_CHANNEL, message))
+    if not messages:
+        return
+
+    def send() -> None:
+        try:
+            get_event_broker().publish_many(messages)
+        except Exception as e:
+            # Streaming is best effort; never fail the write that caused it
+            logger.warning(f"Failed to publish {event_type} events: {e}")
+
+    transaction.on_commit(send)
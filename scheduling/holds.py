@@ -0,0 +1,191 @@
+"""
+Slot holds and the per-doctor waitlist.
+
+A patient can hold a free slot for ``SCHEDULING_HOLD_SECONDS`` while checking
+out; nobody else can book or hold it until the hold is released or expires.
+Each patient holds at most ``SCHEDULING_MAX_HOLDS_PER_PATIENT`` slots at a
+time, waitlist offers included, so one client cannot hide a doctor's diary.
+When a held slot is freed, the doctor's oldest waitlist entry without an
+open offer is given a hold of ``SCHEDULING_WAITLIST_OFFER_SECONDS`` and an
+offer email.
+
+Expiry is handled by ``sweep_expired_holds`` (the ``sweep_slot_holds``
+command), which reads expired holds off the partial ``hold_expires_at``
+index; request paths only compare ``hold_expires_at`` on the row they touch.
+"""
+from datetime import datetime, timedelta
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .booking import SlotAlreadyBooked, SlotBlocked, SlotHeld, SlotNotFound, not_held_by_others
+from .cache import invalidate_slots
+from .events import SLOT_HELD, SLOT_RELEASED, publish_slot_event
+from .models import Availability, WaitlistEntry
+from .outbox import enqueue
+from .tasks import SEND_EMAIL_JOB
+from users.models import User
+
+logger = logging.getLogger(__name__)
+
+
+def hold_seconds() -> int:
+    return getattr(settings, 'SCHEDULING_HOLD_SECONDS', 120)
+
+
+def offer_seconds() -> int:
+    return getattr(settings, 'SCHEDULING_WAITLIST_OFFER_SECONDS', 900)
+
+
+def max_holds() -> int:
+    return getattr(settings, 'SCHEDULING_MAX_HOLDS_PER_PATIENT', 3)
+
+
+class TooManyHolds(Exception):
+    """The patient already holds ``max_holds()`` slots."""
+
+
+def hold_slot(patient, availability_id) -> Availability:
+    """
+    Hold a future, unbooked slot for ``patient``.
+
+    Holding a slot the patient already holds keeps the existing (possibly
+    longer waitlist-offer) expiry. Raises ``SlotNotFound``, ``SlotAlreadyBooked``,
+    ``SlotHeld``, ``SlotBlocked`` or ``TooManyHolds``.
+    """
+    now = timezone.now()
+    try:
+        slot = Availability.objects.get(pk=availability_id, start_time__gt=now)
+    except (Availability.DoesNotExist, ValueError):
+        raise SlotNotFound()
+    if slot.is_booked:
+        raise SlotAlreadyBooked()
+    if slot.is_blocked:
+        raise SlotBlocked()
+    if slot.held_by_id == patient.pk and slot.hold_expires_at and slot.hold_expires_at > now:
+        return slot
+    if slot.is_held_for_other(patient, now):
+        raise SlotHeld()
+
+    expires_at = now + timedelta(seconds=hold_seconds())
+    with transaction.atomic():
+        # Locking the patient row serializes their concurrent holds, so the cap holds
+        list(User.objects.select_for_update().filter(pk=patient.pk).values_list('pk', flat=True))
+        if Availability.objects.filter(held_by=patient, hold_expires_at__gt=now, is_booked=False).count() >= max_holds():
+            raise TooManyHolds()
+        claimed = Availability.objects.filter(pk=slot.pk, is_booked=False, is_blocked=False).filter(
+            not_held_by_others(patient, now)
+        ).update(held_by=patient, hold_expires_at=expires_at)
+        if not claimed:
+            raise SlotHeld()
+        # Held slots drop out of the free-slot search until released or expired
+        invalidate_slots([slot])
+        publish_slot_event(SLOT_HELD, [slot])
+
+    slot.held_by, slot.hold_expires_at = patient, expires_at
+    return slot
+
+
+def release_hold(patient, availability_id) -> bool:
+    """
+    Release ``patient``'s hold on a slot and offer it to the waitlist.
+    Declining a waitlist offer this way also gives up the waitlist place.
+    """
+    with transaction.atomic():
+        try:
+            released = Availability.objects.filter(
+                pk=availability_id, held_by=patient, is_booked=False
+            ).update(held_by=None, hold_expires_at=None)
+        except ValueError:
+            return False
+        if not released:
+            return False
+        slot = Availability.objects.get(pk=availability_id)
+        WaitlistEntry.objects.filter(offered_slot=slot, patient=patient).delete()
+        invalidate_slots([slot])
+        publish_slot_event(SLOT_RELEASED, [slot])
+        offer_freed_slot(slot)
+    return True
+
+
+def offer_freed_slot(slot: Availability, now: datetime | None = None) -> WaitlistEntry | None:
+    """
+    Hold a freed slot for the doctor's next waiting patient and queue the
+    offer email. Call inside the transaction that freed the slot.
+    """
+    now = now or timezone.now()
+    if slot.start_time <= now:
+        return None
+
+    entry = WaitlistEntry.objects.select_related('patient', 'doctor').filter(
+        doctor_id=slot.doctor_id, offered_slot__isnull=True
+    ).order_by('created_at', 'id').first()
+    if entry is None:
+        return None
+
+    expires_at = now + timedelta(seconds=offer_seconds())
+    held = Availability.objects.filter(pk=slot.pk, is_booked=False, is_blocked=False).filter(
+        Q(hold_expires_at__isnull=True) | Q(hold_expires_at__lte=now)
+    ).update(held_by=entry.patient, hold_expires_at=expires_at)
+    offered = held and WaitlistEntry.objects.filter(pk=entry.pk, offered_slot__isnull=True).update(
+        offered_slot=slot, offer_expires_at=expires_at
+    )
+    if not offered:
+        # Lost a race with another release or sweep; they will offer instead
+        if held:
+            Availability.objects.filter(pk=slot.pk, held_by=entry.patient).update(held_by=None, hold_expires_at=None)
+        return None
+
+    entry.offered_slot, entry.offer_expires_at = slot, expires_at
+    publish_slot_event(SLOT_HELD, [slot])
+    enqueue(SEND_EMAIL_JOB, {
+        "action": "WAITLIST_OFFER",
+        "recipient": entry.patient.email,
+        "data": {
+            "userName": entry.patient.get_full_name(),
+            "doctorName": entry.doctor.get_full_name(),
+            "slotId": str(slot.pk),
+            "startTime": timezone.localtime(slot.start_time).strftime('%Y-%m-%d at %H:%M'),
+            "expiresAt": timezone.localtime(expires_at).strftime('%Y-%m-%d at %H:%M'),
+        },
+    })
+    return entry
+
+
+def sweep_expired_holds(limit: int = 500, now: datetime | None = None) -> int:
+    """
+    Clear up to ``limit`` expired holds in expiry order, drop waitlist
+    entries whose offer lapsed and offer each freed slot to the next patient.
+    Returns the number of holds cleared.
+    """
+    now = now or timezone.now()
+    expired = list(
+        Availability.objects.filter(hold_expires_at__lte=now).order_by('hold_expires_at')[:limit]
+    )
+    cleared = 0
+    for slot in expired:
+        with transaction.atomic():
+            # Conditional so a hold renewed since the read above is kept
+            if not Availability.objects.filter(pk=slot.pk, hold_expires_at__lte=now).update(
+                held_by=None, hold_expires_at=None
+            ):
+                continue
+            cleared += 1
+            WaitlistEntry.objects.filter(offered_slot=slot).delete()
+            invalidate_slots([slot])
+            if not slot.is_booked:
+                publish_slot_event(SLOT_RELEASED, [slot])
+                offer_freed_slot(slot, now)
+    if cleared:
+        logger.info(f"Cleared {cleared} expired slot hold(s)")
+    return cleared
+
+
+def next_hold_expiry() -> datetime | None:
+    """The earliest pending hold expiry, read from the partial expiry index."""
+    return Availability.objects.filter(hold_expires_at__isnull=False).order_by(
+        'hold_expires_at'
+    ).values_list('hold_expires_at', flat=True).first()
@@ -0,0 +1,35 @@
+import signal
+import time
+from typing import Any
+
+from django.core.management.base import BaseCommand
+
+from scheduling.outbox import run_pending
+
+
+class Command(BaseCommand):
+    help = "Drain the outbox: run queued calendar and email jobs with retries and backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Process one batch and exit.')
+        parser.add_argument('--batch-size', type=int, default=50, help='Jobs claimed per batch.')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to sleep when the queue is empty.')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        self._stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        batch_size = options['batch_size']
+        while not self._stopping:
+            processed = run_pending(limit=batch_size)
+            if processed:
+                self.stdout.write(f"Processed {processed} outbox job(s)")
+            if options['once']:
+                break
+            # Keep draining while there is a backlog, sleep only when idle
+            if processed < batch_size:
+                time.sleep(options['poll_interval'])
+
+    def _stop(self, signum: int, frame: Any) -> None:
+        self._stopping = True
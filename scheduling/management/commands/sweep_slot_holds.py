@@ -0,0 +1,47 @@
+import signal
+import time
+from typing import Any
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from scheduling.holds import next_hold_expiry, sweep_expired_holds
+
+
+class Command(BaseCommand):
+    help = "Expire slot holds and offer freed slots to waitlisted patients."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Sweep once and exit.')
+        parser.add_argument('--batch-size', type=int, default=500, help='Holds cleared per sweep.')
+        parser.add_argument('--max-sleep', type=float, default=30.0, help='Longest wait between sweeps, in seconds.')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        self._stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        batch_size = options['batch_size']
+        while not self._stopping:
+            cleared = sweep_expired_holds(limit=batch_size)
+            if cleared:
+                self.stdout.write(f"Cleared {cleared} expired hold(s)")
+            if options['once']:
+                break
+            if cleared >= batch_size:
+                continue
+            # Sleep until the earliest pending expiry rather than polling;
+            # holds placed meanwhile are picked up within --max-sleep
+            delay = options['max_sleep']
+            next_expiry = next_hold_expiry()
+            if next_expiry is not None:
+                delay = min(delay, max(0.0, (next_expiry - timezone.now()).total_seconds()))
+            self._sleep(delay)
+
+    def _sleep(self, seconds: float) -> None:
+        deadline = time.monotonic() + seconds
+        while not self._stopping and time.monotonic() < deadline:
+            time.sleep(min(1.0, deadline - time.monotonic()))
+
+    def _stop(self, signum: int, frame: Any) -> None:
+        self._stopping = True
@@ -0,0 +1,48 @@
+import signal
+import time
+from typing import Any
+
+from django.core.management.base import BaseCommand
+
+from scheduling.calendar_sync import sync_due_calendars
+
+
+class Command(BaseCommand):
+    help = "Pull changes from doctors' Google Calendars and block slots that clash with busy time."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run one sync cycle and exit.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Doctors synced per cycle.')
+        parser.add_argument('--workers', type=int, default=None, help='Concurrent syncs (default GOOGLE_CALENDAR_SYNC_WORKERS).')
+        parser.add_argument('--poll-interval', type=float, default=10.0, help='Seconds to sleep when no doctor is due.')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        self._stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        batch_size = options['batch_size']
+        while not self._stopping:
+            started = time.monotonic()
+            results = sync_due_calendars(limit=batch_size, workers=options['workers'])
+            if results:
+                full = sum(result.full for result in results)
+                blocked = sum(result.blocked for result in results)
+                unblocked = sum(result.unblocked for result in results)
+                self.stdout.write(
+                    f"Synced {len(results)} calendar(s) ({full} full) in {time.monotonic() - started:.1f}s: "
+                    f"{blocked} slot(s) blocked, {unblocked} unblocked"
+                )
+            if options['once']:
+                break
+            # Keep going while doctors are overdue, sleep only when caught up
+            if len(results) < batch_size:
+                self._sleep(options['poll_interval'])
+
+    def _sleep(self, seconds: float) -> None:
+        deadline = time.monotonic() + seconds
+        while not self._stopping and time.monotonic() < deadline:
+            time.sleep(min(1.0, deadline - time.monotonic()))
+
+    def _stop(self, signum: int, frame: Any) -> None:
+        self._stopping = True
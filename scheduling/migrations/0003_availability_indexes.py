@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-17 10:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduling', '0002_outboxjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='availability',
+            index=models.Index(fields=['doctor', 'start_time', 'end_time'], name='avail_doctor_interval_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='availability',
+            index=models.Index(condition=models.Q(('is_booked', False)), fields=['start_time'], name='avail_open_start_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-17 11:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduling', '0003_availability_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='doctor_google_event_id',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+    ]
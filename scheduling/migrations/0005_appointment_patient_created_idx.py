@@ -0,0 +1,19 @@
+# Generated by Django 6.0 on 2026-10-17 14:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduling', '0004_appointment_doctor_google_event_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient', '-created_at', '-id'], name='appt_patient_created_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 6.0 on 2026-10-17 16:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduling', '0006_slot_holds_waitlist'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='availability',
+            name='is_blocked',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='CalendarBlock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('google_event_id', models.CharField(max_length=255)),
+                ('start_time', models.DateTimeField()),
+                ('end_time', models.DateTimeField()),
+                ('doctor', models.ForeignKey(limit_choices_to={'role': 'doctor'}, on_delete=django.db.models.deletion.CASCADE, related_name='calendar_blocks', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Calendar Block',
+                'verbose_name_plural': 'Calendar Blocks',
+                'ordering': ['start_time'],
+                'indexes': [models.Index(fields=['doctor', 'start_time', 'end_time'], name='calblock_doctor_interval_idx')],
+                'constraints': [models.UniqueConstraint(fields=('doctor', 'google_event_id'), name='calblock_doctor_event_uniq')],
+            },
+        ),
+    ]
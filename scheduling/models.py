@@ -1,7 +1,10 @@
+from datetime import datetime
+
 from django.db import models
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 
 
 class Availability(models.Model):
@@ -14,11 +17,56 @@ class Availability(models.Model):
     start_time = models.DateTimeField()
     end_time = models.DateTimeField()
     is_booked = models.BooleanField(default=False)
+    # Overlaps busy time in the doctor's Google Calendar (see scheduling.calendar_sync)
+    is_blocked = models.BooleanField(default=False)
+    # Short-lived reservation while a patient checks out or answers a waitlist offer
+    held_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='held_slots',
+        limit_choices_to={'role': 'patient'}
+    )
+    hold_expires_at = models.DateTimeField(null=True, blank=True)
+
+    # Set by Django at runtime; declared for type checkers
+    doctor_id: int
+    held_by_id: int | None
+    _loaded_start_time: datetime | None
+    _loaded_end_time: datetime | None
 
     class Meta:
         verbose_name = _('Availability Slot')
         verbose_name_plural = _('Availability Slots')
         ordering = ['start_time']
+        indexes = [
+            # Overlap checks: doctor = ? AND start_time < ? AND end_time > ?
+            models.Index(fields=['doctor', 'start_time', 'end_time'], name='avail_doctor_interval_idx'),
+            # Patient slot browsing: only open slots, scanned in start_time order
+            models.Index(fields=['start_time'], condition=models.Q(is_booked=False), name='avail_open_start_idx'),
+            # Hold sweeper: only held slots, scanned in expiry order
+            models.Index(
+                fields=['hold_expires_at'],
+                condition=models.Q(hold_expires_at__isnull=False),
+                name='avail_hold_expiry_idx'
+            ),
+        ]
+
+    def is_held_for_other(self, user, now=None) -> bool:
+        """True while an unexpired hold belongs to someone other than ``user``."""
+        if self.hold_expires_at is None or self.held_by_id == getattr(user, 'pk', None):
+            return False
+        return self.hold_expires_at > (now or timezone.now())
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so cache invalidation can also cover the slot's old day
+        # and moved appointments can update their calendar events
+        instance._loaded_start_time = instance.__dict__.get('start_time')
+        instance._loaded_end_time = instance.__dict__.get('end_time')
+        return instance
 
     def clean(self) -> None:
         if self.start_time and self.end_time and self.start_time >= self.end_time:
@@ -45,16 +93,141 @@ class Appointment(models.Model):
         related_name='appointment'
     )
     created_at = models.DateTimeField(auto_now_add=True)
+
+    patient_id: int
     google_event_id = models.CharField(
         max_length=255,
         null=True,
         blank=True
     )
+    doctor_google_event_id = models.CharField(
+        max_length=255,
+        null=True,
+        blank=True
+    )
 
     class Meta:
         verbose_name = _('Appointment')
         verbose_name_plural = _('Appointments')
         ordering = ['-created_at']
+        indexes = [
+            # Patient appointment list, keyset-paginated on (-created_at, -id)
+            models.Index(fields=['patient', '-created_at', '-id'], name='appt_patient_created_idx'),
+        ]
 
     def __str__(self) -> str:
         return f"Appt: {self.patient.username} with {self.availability.doctor.username}"
+
+
+class WaitlistEntry(models.Model):
+    """
+    A patient waiting for any slot with a doctor. When a slot is freed the
+    oldest entry without an open offer is offered it as a hold.
+    """
+    patient = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='waitlist_entries',
+        limit_choices_to={'role': 'patient'}
+    )
+    doctor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='waitlisted_by',
+        limit_choices_to={'role': 'doctor'}
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    offered_slot = models.ForeignKey(
+        Availability,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='waitlist_offers'
+    )
+    offer_expires_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = _('Waitlist Entry')
+        verbose_name_plural = _('Waitlist Entries')
+        ordering = ['created_at', 'id']
+        constraints = [
+            models.UniqueConstraint(fields=['patient', 'doctor'], name='waitlist_patient_doctor_uniq'),
+        ]
+        indexes = [
+            # Next in line for a doctor: doctor = ? AND offered_slot IS NULL ORDER BY created_at, id
+            models.Index(fields=['doctor', 'created_at', 'id'], name='waitlist_doctor_queue_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f"Waitlist: {self.patient.username} for {self.doctor.username}"
+
+
+class CalendarBlock(models.Model):
+    """
+    Busy time copied from a doctor's Google Calendar by the calendar sync.
+    Slots overlapping any block are marked ``Availability.is_blocked``.
+    """
+    doctor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='calendar_blocks',
+        limit_choices_to={'role': 'doctor'}
+    )
+    google_event_id = models.CharField(max_length=255)
+    start_time = models.DateTimeField()
+    end_time = models.DateTimeField()
+
+    class Meta:
+        verbose_name = _('Calendar Block')
+        verbose_name_plural = _('Calendar Blocks')
+        ordering = ['start_time']
+        constraints = [
+            models.UniqueConstraint(fields=['doctor', 'google_event_id'], name='calblock_doctor_event_uniq'),
+        ]
+        indexes = [
+            # Slot overlap checks: doctor = ? AND start_time < ? AND end_time > ?
+            models.Index(fields=['doctor', 'start_time', 'end_time'], name='calblock_doctor_interval_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f"Busy: {self.doctor.username} - {self.start_time.strftime('%Y-%m-%d %H:%M')}"
+
+
+class OutboxJob(models.Model):
+    """
+    A deferred side effect (calendar sync, email) recorded in the same
+    transaction as the change that caused it and drained by the
+    ``run_outbox_worker`` management command.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, _('Pending')),
+        (STATUS_RUNNING, _('Running')),
+        (STATUS_DONE, _('Done')),
+        (STATUS_FAILED, _('Failed')),
+    )
+
+    kind = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=8)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _('Outbox Job')
+        verbose_name_plural = _('Outbox Jobs')
+        ordering = ['run_after', 'id']
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.kind} #{self.pk} ({self.status})"
@@ -0,0 +1,271 @@
+"""
+Database-backed outbox for side effects that must not block a request.
+
+Jobs are inserted with ``enqueue`` inside the caller's transaction, so they
+only become visible to the worker once the originating change commits.
+``run_pending`` claims a batch of due jobs with one locked SELECT and one
+UPDATE (safe to run from several worker processes), dispatches them to the
+handler registered for their ``kind`` and reschedules failures with
+exponential backoff.
+
+Handlers registered with ``batch=True`` receive every claimed payload of
+their kind at once and return one outcome (None or an exception) per payload,
+which lets them coalesce upstream calls across jobs.
+
+Kinds may also register a coroutine with ``register_async_job``. Async views
+use ``dispatch_now`` to claim the jobs they just committed and run them
+concurrently on the event loop instead of waiting for the worker; anything
+that fails or times out is retried by the worker as usual.
+"""
+import asyncio
+import logging
+import random
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Iterable, TypeVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q, QuerySet
+from django.utils import timezone
+
+from .models import OutboxJob
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[[dict[str, Any]], None]
+BatchJobHandler = Callable[[list[dict[str, Any]]], list[Exception | None]]
+AsyncJobHandler = Callable[[dict[str, Any]], Awaitable[None]]
+
+T = TypeVar('T')
+
+_handlers: dict[str, JobHandler] = {}
+_batch_handlers: dict[str, BatchJobHandler] = {}
+_async_handlers: dict[str, AsyncJobHandler] = {}
+
+
+def _setting(name: str, default: Any) -> Any:
+    return getattr(settings, name, default)
+
+
+def register_job(kind: str, batch: bool = False) -> Callable[[Any], Any]:
+    """Register the decorated function as the handler for jobs of ``kind``."""
+    def decorator(func: Any) -> Any:
+        if batch:
+            _batch_handlers[kind] = func
+        else:
+            _handlers[kind] = func
+        return func
+    return decorator
+
+
+def register_async_job(kind: str) -> Callable[[Any], Any]:
+    """Register the decorated coroutine function for ``dispatch_now`` of jobs of ``kind``."""
+    def decorator(func: Any) -> Any:
+        _async_handlers[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(kind: str, payload: dict[str, Any], delay: timedelta | None = None) -> OutboxJob:
+    """Record a job; call inside the transaction that makes it necessary."""
+    return enqueue_many([(kind, payload)], delay=delay)[0]
+
+
+def enqueue_many(
+    jobs: list[tuple[str, dict[str, Any]]],
+    delay: timedelta | None = None
+) -> list[OutboxJob]:
+    """Record several jobs with a single INSERT."""
+    run_after = timezone.now() + (delay or timedelta())
+    max_attempts = _setting('OUTBOX_MAX_ATTEMPTS', 8)
+    return OutboxJob.objects.bulk_create([
+        OutboxJob(kind=kind, payload=payload, run_after=run_after, max_attempts=max_attempts)
+        for kind, payload in jobs
+    ])
+
+
+def backoff_delay(attempts: int) -> timedelta:
+    """Exponential backoff with full jitter, capped at OUTBOX_BACKOFF_MAX_SECONDS."""
+    base = _setting('OUTBOX_BACKOFF_BASE_SECONDS', 5)
+    cap = _setting('OUTBOX_BACKOFF_MAX_SECONDS', 3600)
+    ceiling = min(cap, base * (2 ** max(attempts - 1, 0)))
+    return timedelta(seconds=random.uniform(ceiling / 2, ceiling))
+
+
+def _due_filter(now: Any) -> Q:
+    # Running jobs whose lease has lapsed belong to a worker that died mid-job.
+    return (
+        Q(status=OutboxJob.STATUS_PENDING, run_after__lte=now)
+        | Q(status=OutboxJob.STATUS_RUNNING, locked_until__lt=now)
+    )
+
+
+def _claim(candidates: QuerySet[OutboxJob], now: Any, limit: int | None = None) -> list[OutboxJob]:
+    """
+    Lease up to ``limit`` due jobs among ``candidates`` with one SELECT and one
+    UPDATE.
+
+    On PostgreSQL the SELECT locks the rows and skips any another worker has
+    locked, so concurrent workers claim disjoint batches. SQLite ignores
+    FOR UPDATE; there the transaction holds the database write lock from its
+    start (``transaction_mode`` IMMEDIATE), which serializes claimers.
+    """
+    lease = now + timedelta(seconds=_setting('OUTBOX_LEASE_SECONDS', 300))
+    with transaction.atomic():
+        due = candidates.filter(_due_filter(now)).select_for_update(skip_locked=True)
+        claimed = list(due[:limit] if limit else due)
+        if claimed:
+            OutboxJob.objects.filter(pk__in=[job.pk for job in claimed]).update(
+                status=OutboxJob.STATUS_RUNNING,
+                locked_until=lease,
+                attempts=F('attempts') + 1,
+                updated_at=now,
+            )
+    for job in claimed:
+        job.status = OutboxJob.STATUS_RUNNING
+        job.locked_until = lease
+        job.attempts += 1
+        job.updated_at = now
+    return claimed
+
+
+def claim_due_jobs(limit: int) -> list[OutboxJob]:
+    """Lease up to ``limit`` due jobs, oldest first, to this worker."""
+    now = timezone.now()
+    return _claim(OutboxJob.objects.all(), now, limit)
+
+
+def claim_jobs(job_ids: Iterable[int], now: Any = None) -> list[OutboxJob]:
+    """Lease the given jobs if they are still due; returns the ones claimed."""
+    return _claim(OutboxJob.objects.filter(pk__in=list(job_ids)), now or timezone.now())
+
+
+def _record_success(job: OutboxJob) -> None:
+    job.status = OutboxJob.STATUS_DONE
+    job.locked_until = None
+    job.last_error = ''
+
+
+def _record_failure(job: OutboxJob, error: Exception) -> None:
+    job.last_error = f"{type(error).__name__}: {error}"
+    job.locked_until = None
+    if job.attempts >= job.max_attempts:
+        job.status = OutboxJob.STATUS_FAILED
+        logger.error(f"Outbox job {job} failed permanently: {job.last_error}")
+    else:
+        job.status = OutboxJob.STATUS_PENDING
+        job.run_after = timezone.now() + backoff_delay(job.attempts)
+        logger.warning(f"Outbox job {job} failed (attempt {job.attempts}), retrying at {job.run_after}: {job.last_error}")
+
+
+def _record_outcomes(jobs: list[OutboxJob], outcomes: list[Exception | None]) -> int:
+    """Apply each job's outcome and write them all back with one UPDATE."""
+    now = timezone.now()
+    for job, error in zip(jobs, outcomes):
+        if error is None:
+            _record_success(job)
+        else:
+            _record_failure(job, error)
+        job.updated_at = now
+    # atomic() also opens the connection, which SQLite's bulk_update needs to size its batches
+    with transaction.atomic():
+        OutboxJob.objects.bulk_update(jobs, ['status', 'run_after', 'locked_until', 'last_error', 'updated_at'])
+    return outcomes.count(None)
+
+
+def run_job(job: OutboxJob) -> bool:
+    """Execute a claimed job and record the outcome. Returns True on success."""
+    return run_jobs([job]) == 1
+
+
+def run_jobs(jobs: list[OutboxJob]) -> int:
+    """Execute claimed jobs, batching by kind where supported. Returns the number that succeeded."""
+    by_kind: dict[str, list[OutboxJob]] = {}
+    for job in jobs:
+        by_kind.setdefault(job.kind, []).append(job)
+
+    succeeded = 0
+    for kind, group in by_kind.items():
+        outcomes: list[Exception | None]
+        if kind in _batch_handlers:
+            try:
+                outcomes = _batch_handlers[kind]([job.payload for job in group])
+            except Exception as e:
+                outcomes = [e] * len(group)
+        else:
+            outcomes = [_run_single(kind, job.payload) for job in group]
+        succeeded += _record_outcomes(group, outcomes)
+    return succeeded
+
+
+def _run_single(kind: str, payload: dict[str, Any]) -> Exception | None:
+    handler = _handlers.get(kind)
+    try:
+        if handler is None:
+            raise LookupError(f"No handler registered for outbox job kind '{kind}'")
+        handler(payload)
+    except Exception as e:
+        return e
+    return None
+
+
+def run_pending(limit: int = 50) -> int:
+    """Claim and run one batch of due jobs. Returns the number processed."""
+    jobs = claim_due_jobs(limit)
+    run_jobs(jobs)
+    return len(jobs)
+
+
+async def run_in_db_thread(func: Callable[..., T], *args: Any) -> T:
+    """
+    Run ORM work from async code on a pool thread. ``sync_to_async``'s default
+    thread-sensitive mode funnels every such call in the process through one
+    thread, which serializes concurrent bookings behind each other and behind
+    ``dispatch_now``'s bookkeeping. The pool thread's connection is closed
+    or kept per CONN_MAX_AGE afterwards, as at the end of a request.
+    """
+    def call() -> T:
+        close_old_connections()
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+
+    return await sync_to_async(call, thread_sensitive=False)()
+
+
+async def _run_async(job: OutboxJob, timeout: float) -> Exception | None:
+    try:
+        await asyncio.wait_for(_async_handlers[job.kind](job.payload), timeout)
+    except Exception as e:
+        return e
+    return None
+
+
+async def dispatch_now(jobs: Iterable[OutboxJob], timeout: float | None = None) -> int:
+    """
+    Claim committed jobs that have an async handler and run them concurrently
+    with ``asyncio.gather``, each bounded by ``timeout`` seconds. Returns the
+    number that succeeded; the rest, and any interrupted by cancellation, are
+    left to the worker's backoff.
+    """
+    job_ids = [job.pk for job in jobs if job.kind in _async_handlers]
+    if not job_ids:
+        return 0
+    timeout = timeout or _setting('OUTBOX_DISPATCH_TIMEOUT_SECONDS', 10)
+    claimed = await run_in_db_thread(claim_jobs, job_ids)
+    outcomes: dict[int, Exception | None] = {}
+
+    async def run(job: OutboxJob) -> None:
+        outcomes[job.pk] = await _run_async(job, timeout)
+
+    try:
+        await asyncio.gather(*(run(job) for job in claimed))
+    except asyncio.CancelledError:
+        # Record the jobs that finished and hand the rest back to the worker
+        # now, rather than leaving them RUNNING until their lease lapses
+        cancelled = RuntimeError('Dispatch cancelled')
+        await run_in_db_thread(_record_outcomes, claimed, [outcomes.get(job.pk, cancelled) for job in claimed])
+        raise
+    return await run_in_db_thread(_record_outcomes, claimed, [outcomes[job.pk] for job in claimed])
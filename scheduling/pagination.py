@@ -0,0 +1,129 @@
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+from rest_framework.response import Response
+
+
+class CountingCursorPagination(CursorPagination):
+    """
+    Keyset pagination (no OFFSET scan, no COUNT(*) per page) with an opt-in
+    total: pass ``?include_count=true`` to add ``count`` to the response.
+
+    DRF's cursor holds only the first ordering field plus an offset past the
+    rows tied with it, so a tied row added or removed between requests shifts
+    the next page by one row (and ties beyond ``offset_cutoff`` can't be paged
+    through). Here the cursor holds every ordering field of the row it points
+    at (e.g. ``start_time`` and ``id``) and the next page starts right after it.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    count_query_param = 'include_count'
+    position_separator = '|'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get(self.count_query_param, '').lower() in ('1', 'true', 'yes'):
+            self.count = queryset.count()
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.sort_key = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+
+        reverse = self.cursor is not None and self.cursor.reverse
+        ordering = list(self.sort_key)
+        if reverse:
+            ordering = [field[1:] if field.startswith('-') else f'-{field}' for field in ordering]
+        queryset = queryset.order_by(*ordering)
+        if self.cursor is not None:
+            values = self._decode_position(queryset.model, self.cursor.position)
+            queryset = queryset.filter(self._after(ordering, values))
+
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_more = len(results) > self.page_size
+        # A cursor was taken from a row, so there are rows on its other side
+        if reverse:
+            self.page.reverse()
+            self.has_previous, self.has_next = has_more, True
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+        return self.page
+
+    @staticmethod
+    def _after(ordering, values) -> Q:
+        """Rows after ``values`` in ``ordering``: (a, b) > (x, y) is a > x OR (a = x AND b > y)."""
+        names = [field.lstrip('-') for field in ordering]
+        lookups = ['lt' if field.startswith('-') else 'gt' for field in ordering]
+        after = Q()
+        for i, (name, lookup) in enumerate(zip(names, lookups)):
+            after |= Q(**dict(zip(names[:i], values[:i])), **{f'{name}__{lookup}': values[i]})
+        # The bound on the first field alone lets the index range scan start at the cursor
+        return Q(**{f'{names[0]}__{lookups[0]}e': values[0]}) & after
+
+    def _get_position_from_instance(self, instance, ordering):
+        return self.position_separator.join(str(getattr(instance, field.lstrip('-'))) for field in ordering)
+
+    def _decode_position(self, model, position) -> list:
+        texts = (position or '').split(self.position_separator)
+        if len(texts) != len(self.sort_key):
+            raise NotFound(self.invalid_cursor_message)
+        values = []
+        for field, text in zip(self.sort_key, texts):
+            try:
+                value = model._meta.get_field(field.lstrip('-')).to_python(text)
+            except ValidationError:
+                raise NotFound(self.invalid_cursor_message)
+            # Naive times cannot be compared with aware ones
+            if value is None or (isinstance(value, datetime) and timezone.is_naive(value)):
+                raise NotFound(self.invalid_cursor_message)
+            values.append(value)
+        return values
+
+    def _link(self, instance, reverse: bool):
+        if instance is not None:
+            position = self._get_position_from_instance(instance, self.sort_key)
+        else:
+            # An empty page past the cursor's row (deleted since); page back from the cursor itself
+            position = self.cursor.position if self.cursor is not None else None
+        return self.encode_cursor(Cursor(offset=0, reverse=reverse, position=position))
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self._link(self.page[-1] if self.page else None, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self._link(self.page[0] if self.page else None, reverse=True)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.count is not None:
+            response.data = {'count': self.count, **(response.data or {})}
+        return response
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['count'] = {'type': 'integer', 'example': 123}
+        return response_schema
+
+
+class AvailabilityCursorPagination(CountingCursorPagination):
+    def get_ordering(self, request, queryset, view):
+        # id breaks ties between slots that start at the same time
+        return ('start_time', 'id')
+
+
+class AppointmentCursorPagination(CountingCursorPagination):
+    def get_ordering(self, request, queryset, view):
+        return ('-created_at', '-id')
@@ -0,0 +1,137 @@
+"""
+Cancelling and rescheduling booked appointments.
+
+Both lock the appointment row for a short transaction, so concurrent changes
+to one appointment run one after the other. The new slot of a reschedule is
+claimed with the same conditional UPDATE as an optimistic booking, and the
+old slot is released in the same transaction: other requests see the patient
+on one slot or the other, never both or neither.
+
+Freed slots go to the doctor's waitlist. Participants' Google Calendar events
+are deleted (cancel) or patched (reschedule) by outbox jobs after commit.
+"""
+from datetime import datetime
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .booking import SlotAlreadyBooked, SlotBlocked, SlotHeld, SlotNotFound, not_held_by_others
+from .cache import invalidate_slots
+from .events import SLOT_BOOKED, SLOT_RELEASED, publish_slot_event
+from .holds import offer_freed_slot
+from .models import Appointment, Availability, WaitlistEntry
+from .tasks import enqueue_calendar_updates
+
+
+class AppointmentNotFound(Exception):
+    """The appointment does not exist or is not the user's."""
+
+
+class AppointmentStarted(Exception):
+    """The appointment's slot has already started."""
+
+
+class DifferentDoctor(Exception):
+    """The requested slot belongs to another doctor."""
+
+
+def _lock_appointment(user, appointment_id, now: datetime) -> Appointment:
+    try:
+        appointment = Appointment.objects.select_for_update(of=('self',)).select_related('availability', 'patient').get(
+            Q(patient=user) | Q(availability__doctor=user), pk=appointment_id
+        )
+    except (Appointment.DoesNotExist, ValueError):
+        raise AppointmentNotFound()
+    if appointment.availability.start_time <= now:
+        raise AppointmentStarted()
+    return appointment
+
+
+def release_booked_slot(slot: Availability, now: datetime | None = None) -> bool:
+    """
+    Mark a slot whose appointment is gone as free and offer it to the
+    waitlist. Call inside the transaction that removed or moved the appointment.
+    """
+    if not Availability.objects.filter(pk=slot.pk, is_booked=True).update(is_booked=False):
+        return False
+    slot.is_booked = False
+    # update() sends no post_save, so invalidate and publish here
+    invalidate_slots([slot])
+    publish_slot_event(SLOT_RELEASED, [slot])
+    if not slot.is_blocked:
+        offer_freed_slot(slot, now)
+    return True
+
+
+def cancel_appointment(user, appointment_id) -> None:
+    """
+    Cancel one of the patient's or doctor's upcoming appointments and free
+    its slot. The Appointment post_delete receiver queues deletion of the
+    calendar events.
+
+    Raises ``AppointmentNotFound`` or ``AppointmentStarted``.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        appointment = _lock_appointment(user, appointment_id, now)
+        slot = appointment.availability
+        appointment.delete()
+        release_booked_slot(slot, now)
+
+
+def reschedule_appointment(user, appointment_id, availability_id) -> Appointment:
+    """
+    Move an upcoming appointment to another future slot of the same doctor,
+    claiming the new slot and releasing the old one in one transaction.
+    Holds are checked against the appointment's patient. Returns the
+    updated appointment.
+
+    Raises ``AppointmentNotFound``, ``AppointmentStarted``, ``DifferentDoctor``,
+    ``SlotNotFound``, ``SlotAlreadyBooked``, ``SlotHeld`` or ``SlotBlocked``.
+    """
+    now = timezone.now()
+    # Unlocked read, so a missing or past slot never takes the appointment lock
+    try:
+        new_slot = Availability.objects.get(pk=availability_id, start_time__gt=now)
+    except (Availability.DoesNotExist, ValueError):
+        raise SlotNotFound()
+
+    try:
+        with transaction.atomic():
+            appointment = _lock_appointment(user, appointment_id, now)
+            old_slot = appointment.availability
+            if new_slot.pk == old_slot.pk:
+                return appointment
+            if new_slot.doctor_id != old_slot.doctor_id:
+                raise DifferentDoctor()
+            patient = appointment.patient
+            if new_slot.is_booked:
+                raise SlotAlreadyBooked()
+            if new_slot.is_blocked:
+                raise SlotBlocked()
+            if new_slot.is_held_for_other(patient, now):
+                raise SlotHeld()
+
+            claimed = Availability.objects.filter(pk=new_slot.pk, is_booked=False, is_blocked=False).filter(
+                not_held_by_others(patient, now)
+            ).update(is_booked=True, held_by=None, hold_expires_at=None)
+            if not claimed:
+                raise SlotAlreadyBooked()
+            was_held = new_slot.held_by_id == patient.pk
+            new_slot.is_booked = True
+            new_slot.held_by, new_slot.hold_expires_at = None, None
+
+            appointment.availability = new_slot
+            appointment.save(update_fields=['availability'])
+            if was_held:
+                # A patient moving to the slot they were offered leaves the waitlist
+                WaitlistEntry.objects.filter(patient=patient, doctor_id=new_slot.doctor_id).delete()
+            invalidate_slots([new_slot])
+            publish_slot_event(SLOT_BOOKED, [new_slot])
+            release_booked_slot(old_slot, now)
+            enqueue_calendar_updates(appointment)
+    except IntegrityError:
+        # The one-to-one on Appointment.availability rejected a second booking
+        raise SlotAlreadyBooked()
+    return appointment
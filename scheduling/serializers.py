@@ -1,6 +1,14 @@
 from rest_framework import serializers
+from django.db import IntegrityError, transaction
 from django.utils import timezone
-from .models import Availability, Appointment
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import base64
+from .cache import invalidate_slots
+from .calendar_sync import blocked_flags
+from .events import SLOT_CREATED, publish_slot_event
+from .models import Availability, Appointment, WaitlistEntry
 from users.serializers import UserListSerializer
 
 class AvailabilitySerializer(serializers.ModelSerializer):
@@ -8,8 +16,8 @@ class AvailabilitySerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Availability
-        fields = ['id', 'doctor', 'doctor_details', 'start_time', 'end_time', 'is_booked']
-        read_only_fields = ['doctor', 'is_booked']
+        fields = ['id', 'doctor', 'doctor_details', 'start_time', 'end_time', 'is_booked', 'is_blocked']
+        read_only_fields = ['doctor', 'is_booked', 'is_blocked']
 
     def validate(self, attrs):
         start_time = attrs.get('start_time')
@@ -41,8 +49,214 @@ class AvailabilitySerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         # Automatically assign the logged-in doctor
         validated_data['doctor'] = self.context['request'].user
+        validated_data['is_blocked'] = self._is_blocked(validated_data['doctor'], validated_data)
         return super().create(validated_data)
 
+    def update(self, instance, validated_data):
+        if 'start_time' in validated_data or 'end_time' in validated_data:
+            validated_data['is_blocked'] = self._is_blocked(instance.doctor, {
+                'start_time': validated_data.get('start_time', instance.start_time),
+                'end_time': validated_data.get('end_time', instance.end_time),
+            })
+        return super().update(instance, validated_data)
+
+    def _is_blocked(self, doctor, data) -> bool:
+        # Slots inside busy Google Calendar time start out blocked
+        return blocked_flags(doctor.pk, [(data['start_time'], data['end_time'])])[0]
+
+
+class SlotSerializer(serializers.Serializer):
+    start_time = serializers.DateTimeField()
+    end_time = serializers.DateTimeField()
+
+
+class RecurrenceSerializer(serializers.Serializer):
+    """
+    A weekly schedule expanded into fixed-length slots, e.g. Mon-Fri
+    09:00-17:00 in 30-minute slots for the next 12 weeks.
+    """
+    weekdays = serializers.ListField(
+        child=serializers.IntegerField(min_value=0, max_value=6),
+        allow_empty=False,
+        help_text='Days of the week, Monday=0 ... Sunday=6.'
+    )
+    start_time = serializers.TimeField()
+    end_time = serializers.TimeField()
+    slot_minutes = serializers.IntegerField(min_value=5, max_value=24 * 60)
+    start_date = serializers.DateField(required=False)
+    weeks = serializers.IntegerField(min_value=1, max_value=52)
+    timezone = serializers.CharField(required=False)
+
+    def validate_timezone(self, value):
+        try:
+            return ZoneInfo(value)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise serializers.ValidationError(f"Unknown time zone '{value}'.")
+
+    def validate(self, attrs):
+        if attrs['start_time'] >= attrs['end_time']:
+            raise serializers.ValidationError("Start time must be before end time.")
+        return attrs
+
+    @staticmethod
+    def expand(rule) -> list[tuple[datetime, datetime]]:
+        tz = rule.get('timezone') or timezone.get_current_timezone()
+        first_day = rule.get('start_date') or timezone.localdate(timezone=tz)
+        weekdays = set(rule['weekdays'])
+        step = timedelta(minutes=rule['slot_minutes'])
+
+        intervals = []
+        for offset in range(rule['weeks'] * 7):
+            day = first_day + timedelta(days=offset)
+            if day.weekday() not in weekdays:
+                continue
+            slot_start = timezone.make_aware(datetime.combine(day, rule['start_time']), tz)
+            day_end = timezone.make_aware(datetime.combine(day, rule['end_time']), tz)
+            while slot_start + step <= day_end:
+                intervals.append((slot_start, slot_start + step))
+                slot_start += step
+        return intervals
+
+
+class AvailabilityBulkSerializer(serializers.Serializer):
+    """
+    Creates many slots for the requesting doctor in one request.
+
+    Accepts either an explicit ``slots`` list or a ``recurrence`` rule. All
+    overlap checks run in memory against a single prefetched range of the
+    doctor's existing slots, and the rows are written with one ``bulk_create``.
+    """
+    MAX_SLOTS = 5000
+
+    slots = SlotSerializer(many=True, required=False)
+    recurrence = RecurrenceSerializer(required=False)
+
+    def validate(self, attrs):
+        if ('slots' in attrs) == ('recurrence' in attrs):
+            raise serializers.ValidationError("Provide exactly one of 'slots' or 'recurrence'.")
+
+        now = timezone.now()
+        if 'recurrence' in attrs:
+            # Slots of the first day that have already started are skipped
+            intervals = [
+                interval for interval in RecurrenceSerializer.expand(attrs['recurrence'])
+                if interval[0] >= now
+            ]
+        else:
+            intervals = [(slot['start_time'], slot['end_time']) for slot in attrs['slots']]
+            for start_time, end_time in intervals:
+                if start_time >= end_time:
+                    raise serializers.ValidationError("Start time must be before end time.")
+                if start_time < now:
+                    raise serializers.ValidationError("Availability cannot be created in the past.")
+
+        if not intervals:
+            raise serializers.ValidationError("No slots to create.")
+        if len(intervals) > self.MAX_SLOTS:
+            raise serializers.ValidationError(f"At most {self.MAX_SLOTS} slots can be created per request.")
+
+        intervals.sort()
+        for previous, current in zip(intervals, intervals[1:]):
+            if current[0] < previous[1]:
+                raise serializers.ValidationError(
+                    f"Slots starting at {previous[0].isoformat()} and {current[0].isoformat()} overlap."
+                )
+
+        # Existing slots never overlap each other, so sorted by start they
+        # are also sorted by end and a binary search finds any conflict.
+        existing = list(
+            Availability.objects.filter(
+                doctor=self.context['request'].user,
+                start_time__lt=intervals[-1][1],
+                end_time__gt=intervals[0][0]
+            ).order_by('start_time').values_list('start_time', 'end_time')
+        )
+        existing_ends = [end_time for _, end_time in existing]
+        for start_time, end_time in intervals:
+            idx = bisect_right(existing_ends, start_time)
+            if idx < len(existing) and existing[idx][0] < end_time:
+                raise serializers.ValidationError(
+                    f"Slot starting at {start_time.isoformat()} overlaps with an existing availability."
+                )
+
+        attrs['intervals'] = intervals
+        return attrs
+
+    def create(self, validated_data):
+        doctor = self.context['request'].user
+        intervals = validated_data['intervals']
+        with transaction.atomic():
+            slots = Availability.objects.bulk_create([
+                Availability(doctor=doctor, start_time=start_time, end_time=end_time, is_blocked=is_blocked)
+                for (start_time, end_time), is_blocked in zip(intervals, blocked_flags(doctor.pk, intervals))
+            ])
+            # bulk_create sends no post_save signals
+            invalidate_slots(slots)
+            publish_slot_event(SLOT_CREATED, slots)
+        return slots
+
+
+def encode_slot_cursor(start_time: datetime, slot_id: int) -> str:
+    return base64.urlsafe_b64encode(f'{start_time.isoformat()}|{slot_id}'.encode()).decode()
+
+
+def decode_slot_cursor(cursor: str) -> tuple[datetime, int]:
+    """Raises ValueError for anything ``encode_slot_cursor`` could not have produced."""
+    start_time, slot_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    value = datetime.fromisoformat(start_time)
+    # Naive times cannot be compared with slot start times
+    if timezone.is_naive(value):
+        raise ValueError("Cursor time has no UTC offset.")
+    return value, int(slot_id)
+
+
+class SlotSearchSerializer(serializers.Serializer):
+    """Query parameters for the patient free-slot search."""
+    MAX_DAYS = 31
+
+    doctor = serializers.IntegerField(required=False)
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    time_from = serializers.TimeField(required=False)
+    time_to = serializers.TimeField(required=False)
+    page_size = serializers.IntegerField(required=False, min_value=1, max_value=100, default=20)
+    cursor = serializers.CharField(required=False)
+
+    def validate_cursor(self, value):
+        try:
+            return decode_slot_cursor(value)
+        except (ValueError, UnicodeDecodeError):
+            raise serializers.ValidationError("Invalid cursor.")
+
+    def validate(self, attrs):
+        today = timezone.localdate()
+        attrs['date_from'] = max(attrs.get('date_from') or today, today)
+        attrs['date_to'] = attrs.get('date_to') or attrs['date_from'] + timedelta(days=6)
+        if attrs['date_to'] < attrs['date_from']:
+            raise serializers.ValidationError("date_to must not be before date_from.")
+        if (attrs['date_to'] - attrs['date_from']).days >= self.MAX_DAYS:
+            raise serializers.ValidationError(f"Search at most {self.MAX_DAYS} days at a time.")
+        if 'time_from' in attrs and 'time_to' in attrs and attrs['time_from'] >= attrs['time_to']:
+            raise serializers.ValidationError("time_from must be before time_to.")
+        return attrs
+
+
+class ScheduleQuerySerializer(serializers.Serializer):
+    """Query parameters for a doctor's day-by-day schedule."""
+    MAX_DAYS = 31
+
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+
+    def validate(self, attrs):
+        attrs['date_from'] = attrs.get('date_from') or timezone.localdate()
+        attrs['date_to'] = attrs.get('date_to') or attrs['date_from'] + timedelta(days=6)
+        if attrs['date_to'] < attrs['date_from']:
+            raise serializers.ValidationError("date_to must not be before date_from.")
+        if (attrs['date_to'] - attrs['date_from']).days >= self.MAX_DAYS:
+            raise serializers.ValidationError(f"Request at most {self.MAX_DAYS} days at a time.")
+        return attrs
+
 
 class AppointmentSerializer(serializers.ModelSerializer):
     availability_details = AvailabilitySerializer(source='availability', read_only=True)
@@ -56,6 +270,43 @@ class AppointmentSerializer(serializers.ModelSerializer):
     def validate_availability(self, value):
         if value.is_booked:
             raise serializers.ValidationError("This slot is already booked.")
+        if value.is_blocked:
+            raise serializers.ValidationError("This slot is no longer available.")
         if value.start_time < timezone.now():
             raise serializers.ValidationError("Cannot book a past slot.")
         return value
+
+
+class RescheduleSerializer(serializers.Serializer):
+    availability = serializers.IntegerField()
+
+
+class WaitlistEntrySerializer(serializers.ModelSerializer):
+    doctor_details = UserListSerializer(source='doctor', read_only=True)
+
+    class Meta:
+        model = WaitlistEntry
+        fields = ['id', 'doctor', 'doctor_details', 'created_at', 'offered_slot', 'offer_expires_at']
+        read_only_fields = ['created_at', 'offered_slot', 'offer_expires_at']
+
+    def validate_doctor(self, value):
+        if not value.is_doctor:
+            raise serializers.ValidationError("Waitlist entries must name a doctor.")
+        return value
+
+    already_waiting = "You are already on this doctor's waitlist."
+
+    def validate(self, attrs):
+        patient = self.context['request'].user
+        if WaitlistEntry.objects.filter(patient=patient, doctor=attrs['doctor']).exists():
+            raise serializers.ValidationError(self.already_waiting)
+        return attrs
+
+    def create(self, validated_data):
+        validated_data['patient'] = self.context['request'].user
+        # A concurrent request can insert the same entry after validate()
+        try:
+            with transaction.atomic():
+                return super().create(validated_data)
+        except IntegrityError:
+            raise serializers.ValidationError(self.already_waiting)
@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import invalidate_doctor_days, invalidate_doctor_directory, slot_cache_enabled, slot_day
+from .events import SLOT_BOOKED, SLOT_CREATED, SLOT_DELETED, SLOT_UPDATED, publish_slot_event
+from .models import Appointment, Availability
+from .tasks import enqueue_calendar_deletes, enqueue_calendar_updates
+
+
+@receiver(post_save, sender=Availability)
+def invalidate_free_slots_on_save(sender, instance, created=False, **kwargs):
+    """
+    Drop cached free-slot summaries for the slot's day (and its previous day
+    if the slot was moved) when a slot is created, booked or edited, and
+    queue calendar event updates when a booked slot is moved.
+    """
+    days = {slot_day(instance.start_time)}
+    loaded_start_time = getattr(instance, '_loaded_start_time', None)
+    if loaded_start_time is not None:
+        days.add(slot_day(loaded_start_time))
+    invalidate_doctor_days(instance.doctor_id, days)
+
+    moved = loaded_start_time is not None and (
+        loaded_start_time != instance.start_time
+        or getattr(instance, '_loaded_end_time', None) != instance.end_time
+    )
+    if moved and instance.is_booked:
+        appointment = Appointment.objects.filter(availability=instance).first()
+        if appointment is not None:
+            enqueue_calendar_updates(appointment)
+    instance._loaded_start_time = instance.start_time
+    instance._loaded_end_time = instance.end_time
+
+    if created:
+        publish_slot_event(SLOT_CREATED, [instance])
+    elif instance.is_booked:
+        publish_slot_event(SLOT_BOOKED, [instance])
+    else:
+        publish_slot_event(SLOT_UPDATED, [instance])
+
+
+@receiver(post_delete, sender=Availability)
+def invalidate_free_slots_on_delete(sender, instance, **kwargs):
+    invalidate_doctor_days(instance.doctor_id, [slot_day(instance.start_time)])
+    publish_slot_event(SLOT_DELETED, [instance])
+
+
+# User fields listed in the cached doctor directory
+DIRECTORY_FIELDS = {'username', 'first_name', 'last_name', 'role'}
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_doctor_directory_on_save(sender, instance, created=False, update_fields=None, **kwargs):
+    """Refresh the search's doctor directory when a doctor joins or a listed field changes."""
+    if created and instance.role != 'doctor':
+        return
+    # Saves such as last_login on every login leave the directory alone
+    if update_fields is not None and not DIRECTORY_FIELDS.intersection(update_fields):
+        return
+    invalidate_doctor_directory()
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_doctor_directory_on_delete(sender, instance, **kwargs):
+    if instance.role == 'doctor':
+        invalidate_doctor_directory()
+
+
+@receiver(post_delete, sender=Appointment)
+def delete_calendar_events_on_delete(sender, instance, **kwargs):
+    """
+    Remove the appointment's Google Calendar events once the delete commits,
+    and drop the cached schedule that still shows its patient.
+    """
+    if slot_cache_enabled():
+        slot = Availability.objects.filter(pk=instance.availability_id).values_list('doctor_id', 'start_time').first()
+        if slot is not None:
+            invalidate_doctor_days(slot[0], [slot_day(slot[1])])
+    enqueue_calendar_deletes(instance)
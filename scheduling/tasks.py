@@ -0,0 +1,244 @@
+"""
+Outbox job handlers for booking side effects.
+
+Each participant's calendar event and the confirmation email are separate
+jobs so a retry only repeats the part that failed. The booking jobs also have
+async handlers so the async booking view can run them right away.
+
+Events we created are kept in step with the appointment: moving a booked
+slot patches them and deleting an appointment deletes them.
+"""
+import logging
+from typing import Any
+
+from .models import Appointment, OutboxJob
+from .outbox import enqueue, enqueue_many, register_async_job, register_job
+from users.email_service import get_email_client
+from users.models import User
+from users.services import (
+    CalendarEventDispatcher,
+    acreate_calendar_event,
+    delete_calendar_event,
+    update_calendar_event,
+)
+
+logger = logging.getLogger(__name__)
+
+CALENDAR_EVENT_JOB = 'appointment.calendar_event'
+CALENDAR_UPDATE_JOB = 'appointment.calendar_update'
+CALENDAR_DELETE_JOB = 'calendar.delete_event'
+CONFIRMATION_EMAIL_JOB = 'appointment.confirmation_email'
+SEND_EMAIL_JOB = 'email.send'
+
+
+class IntegrationError(Exception):
+    """Raised by a job handler when an upstream call failed and should be retried."""
+
+
+def enqueue_booking_integrations(appointment: Appointment) -> list[OutboxJob]:
+    """Queue calendar events and the confirmation email for a new booking."""
+    return enqueue_many([
+        (CALENDAR_EVENT_JOB, {'appointment_id': appointment.pk, 'participant': 'doctor'}),
+        (CALENDAR_EVENT_JOB, {'appointment_id': appointment.pk, 'participant': 'patient'}),
+        (CONFIRMATION_EMAIL_JOB, {'appointment_id': appointment.pk}),
+    ])
+
+
+def enqueue_calendar_updates(appointment: Appointment) -> list[OutboxJob]:
+    """Queue patches of both participants' events after the appointment's slot moved."""
+    return enqueue_many([
+        (CALENDAR_UPDATE_JOB, {'appointment_id': appointment.pk, 'participant': participant})
+        for participant in ('doctor', 'patient')
+        if getattr(appointment, _event_id_field(participant))
+    ])
+
+
+def enqueue_calendar_deletes(appointment: Appointment) -> list[OutboxJob]:
+    """
+    Queue deletion of both participants' events. The payload carries the
+    owner and event id since the appointment may be gone when the job runs.
+    """
+    owners = {'doctor': appointment.availability.doctor_id, 'patient': appointment.patient_id}
+    return enqueue_many([
+        (CALENDAR_DELETE_JOB, {'user_id': owners[participant], 'event_id': event_id})
+        for participant in ('doctor', 'patient')
+        if (event_id := getattr(appointment, _event_id_field(participant)))
+    ])
+
+
+def _event_id_field(participant: str) -> str:
+    return 'doctor_google_event_id' if participant == 'doctor' else 'google_event_id'
+
+
+class OutboxEmailBackend:
+    """
+    Durable email dispatch backend for ``EMAIL_DISPATCH_BACKEND``: records an
+    outbox job in the caller's transaction for ``run_outbox_worker`` to send.
+    """
+
+    transactional = True
+
+    def send(self, payload: dict[str, Any]) -> None:
+        enqueue(SEND_EMAIL_JOB, payload)
+
+
+def _load_appointment(appointment_id: int) -> Appointment | None:
+    try:
+        return Appointment.objects.select_related('availability__doctor', 'patient').get(pk=appointment_id)
+    except Appointment.DoesNotExist:
+        logger.warning(f"Appointment {appointment_id} no longer exists. Skipping integration job.")
+        return None
+
+
+async def _aload_appointment(appointment_id: int) -> Appointment | None:
+    try:
+        return await Appointment.objects.select_related('availability__doctor', 'patient').aget(pk=appointment_id)
+    except Appointment.DoesNotExist:
+        logger.warning(f"Appointment {appointment_id} no longer exists. Skipping integration job.")
+        return None
+
+
+def _calendar_event_for(appointment: Appointment, participant: str) -> tuple[Any, dict[str, Any]]:
+    """Returns the calendar owner and event body for one side of an appointment."""
+    doctor = appointment.availability.doctor
+    patient = appointment.patient
+    start_time = appointment.availability.start_time
+    end_time = appointment.availability.end_time
+    # Lets the calendar sync recognise our own events (see scheduling.calendar_sync)
+    properties = {'private': {'hmsAppointmentId': str(appointment.pk)}}
+
+    if participant == 'doctor':
+        return doctor, {
+            'summary': f'Appointment with {patient.get_full_name()}',
+            'description': f'Patient Email: {patient.email}',
+            'start': {'dateTime': start_time.isoformat()},
+            'end': {'dateTime': end_time.isoformat()},
+            'extendedProperties': properties,
+        }
+    return patient, {
+        'summary': f'Appointment with Dr. {doctor.get_full_name()}',
+        'description': f'Doctor Email: {doctor.email}',
+        'start': {'dateTime': start_time.isoformat()},
+        'end': {'dateTime': end_time.isoformat()},
+        'extendedProperties': properties,
+    }
+
+
+@register_job(CALENDAR_EVENT_JOB, batch=True)
+def create_appointment_calendar_events(payloads: list[dict[str, Any]]) -> list[Exception | None]:
+    """
+    Inserts the calendar events for every claimed job through one dispatcher,
+    so a worker pass costs one batch HTTP request per 50 events.
+    """
+    outcomes: list[Exception | None] = [None] * len(payloads)
+    appointments = Appointment.objects.select_related('availability__doctor', 'patient').in_bulk(
+        {payload['appointment_id'] for payload in payloads}
+    )
+
+    dispatcher = CalendarEventDispatcher()
+    for index, payload in enumerate(payloads):
+        appointment = appointments.get(payload['appointment_id'])
+        if appointment is None:
+            logger.warning(f"Appointment {payload['appointment_id']} no longer exists. Skipping integration job.")
+            continue
+        owner, event_body = _calendar_event_for(appointment, payload['participant'])
+        # Users without a linked calendar are skipped, not retried
+        if not owner.google_refresh_token:
+            continue
+        dispatcher.add(index, owner, event_body)
+
+    results = dispatcher.flush()
+    for index, payload in enumerate(payloads):
+        result = results.get(index)
+        if result is None:
+            continue
+        if result.error is not None or result.event is None:
+            outcomes[index] = IntegrationError(f"Calendar event was not created: {result.error}")
+            continue
+        appointment = appointments[payload['appointment_id']]
+        field = _event_id_field(payload['participant'])
+        setattr(appointment, field, result.event.get('id'))
+        appointment.save(update_fields=[field])
+
+    return outcomes
+
+
+@register_async_job(CALENDAR_EVENT_JOB)
+async def acreate_appointment_calendar_event(payload: dict[str, Any]) -> None:
+    """Single-event counterpart of ``create_appointment_calendar_events`` for ``dispatch_now``."""
+    appointment = await _aload_appointment(payload['appointment_id'])
+    if appointment is None:
+        return
+    owner, event_body = _calendar_event_for(appointment, payload['participant'])
+    if not owner.google_refresh_token:
+        return
+
+    event = await acreate_calendar_event(owner, event_body)
+    field = _event_id_field(payload['participant'])
+    setattr(appointment, field, event.get('id'))
+    await appointment.asave(update_fields=[field])
+
+
+@register_job(CALENDAR_UPDATE_JOB)
+def update_appointment_calendar_event(payload: dict[str, Any]) -> None:
+    """Patch a participant's event to the appointment's current slot times."""
+    appointment = _load_appointment(payload['appointment_id'])
+    if appointment is None:
+        return
+    owner, event_body = _calendar_event_for(appointment, payload['participant'])
+    event_id = getattr(appointment, _event_id_field(payload['participant']))
+    # Never created, or deleted in Google since (the calendar sync clears it)
+    if not event_id or not owner.google_refresh_token:
+        return
+    update_calendar_event(owner, event_id, {'start': event_body['start'], 'end': event_body['end']})
+
+
+@register_job(CALENDAR_DELETE_JOB)
+def delete_appointment_calendar_event(payload: dict[str, Any]) -> None:
+    owner = User.objects.filter(pk=payload['user_id']).first()
+    if owner is None or not owner.google_refresh_token:
+        return
+    delete_calendar_event(owner, payload['event_id'])
+
+
+def _confirmation_email(appointment: Appointment) -> dict[str, Any]:
+    doctor = appointment.availability.doctor
+    patient = appointment.patient
+    start_time = appointment.availability.start_time
+    details = f"Appointment with Dr. {doctor.get_full_name()} on {start_time.strftime('%Y-%m-%d at %H:%M')}"
+
+    return {
+        "action": "BOOKING_CONFIRMATION",
+        "recipient": patient.email,
+        "data": {
+            "userName": patient.get_full_name(),
+            "bookingId": str(appointment.id),
+            "details": details
+        }
+    }
+
+
+@register_job(CONFIRMATION_EMAIL_JOB)
+def send_booking_confirmation_email(payload: dict[str, Any]) -> None:
+    appointment = _load_appointment(payload['appointment_id'])
+    if appointment is None:
+        return
+    get_email_client().send(_confirmation_email(appointment))
+
+
+@register_async_job(CONFIRMATION_EMAIL_JOB)
+async def asend_booking_confirmation_email(payload: dict[str, Any]) -> None:
+    appointment = await _aload_appointment(payload['appointment_id'])
+    if appointment is None:
+        return
+    await get_email_client().asend(_confirmation_email(appointment))
+
+
+@register_job(SEND_EMAIL_JOB)
+def send_email(payload: dict[str, Any]) -> None:
+    get_email_client().send(payload)
+
+
+@register_async_job(SEND_EMAIL_JOB)
+async def asend_email(payload: dict[str, Any]) -> None:
+    await get_email_client().asend(payload)
@@ -1,3 +1,1091 @@
-from django.test import TestCase
+import asyncio
+import base64
+import tempfile
+import threading
+from collections.abc import AsyncGenerator
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from unittest import mock
+from urllib.parse import parse_qs, urlencode, urlparse
+from zoneinfo import ZoneInfo
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connection, transaction
+from django.http import StreamingHttpResponse
+from django.test import AsyncClient, Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from benchmarks.fakes import fake_calendar_server
+from users.models import User
+from users.services import invalidate_calendar_client
+
+from .cache import DOCTOR_DIRECTORY_KEY, day_bounds
+from .calendar_sync import sync_doctor_calendar
+from .events import ALL_DOCTORS_CHANNEL, InProcessBroker, doctor_channel
+from .holds import sweep_expired_holds
+from .models import Appointment, Availability, CalendarBlock, OutboxJob, WaitlistEntry
+from .outbox import dispatch_now, enqueue_many, register_async_job
+from . import outbox
+from .rescheduling import reschedule_appointment
+from .serializers import WaitlistEntrySerializer
+from .tasks import CALENDAR_DELETE_JOB, CALENDAR_UPDATE_JOB, SEND_EMAIL_JOB
+
+
+# Slot data is only cached in a cache shared between processes
+SHARED_CACHE = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': tempfile.mkdtemp(prefix='hms-test-cache-'),
+    }
+}
+PER_PROCESS_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def create_user(username, role):
+    return User.objects.create(
+        username=username, email=f'{username}@example.com', first_name=username.title(), last_name='Test', role=role
+    )
+
+
+def api_client(user) -> Client:
+    """An APIClient authenticated as ``user``, typed as the Django test client its responses follow."""
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+def create_slots(doctor, count, start=None):
+    start = start or timezone.now() + timedelta(days=1)
+    return Availability.objects.bulk_create([
+        Availability(doctor=doctor, start_time=start + timedelta(minutes=30 * i),
+                     end_time=start + timedelta(minutes=30 * (i + 1)))
+        for i in range(count)
+    ])
+
+
+class ListQueryCountTests(TestCase):
+    """The list and detail views load each row and its nested users in one query."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = create_user('doctor', 'doctor')
+        cls.patient = create_user('patient', 'patient')
+        slots = create_slots(cls.doctor, 30)
+        booked = slots[:10]
+        Availability.objects.filter(pk__in=[slot.pk for slot in booked]).update(is_booked=True)
+        cls.appointments = Appointment.objects.bulk_create(
+            [Appointment(patient=cls.patient, availability=slot) for slot in booked]
+        )
+        cls.free_slot = slots[-1]
+
+    def test_availability_list(self):
+        for user, expected in ((self.doctor, 20), (self.patient, 20)):
+            client = api_client(user)
+            with self.assertNumQueries(1):
+                response = client.get('/api/scheduling/availability/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()['results']), expected)
+            self.assertEqual(response.json()['results'][0]['doctor_details']['id'], self.doctor.pk)
+
+    def test_availability_retrieve(self):
+        client = api_client(self.patient)
+        with self.assertNumQueries(1):
+            response = client.get(f'/api/scheduling/availability/{self.free_slot.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['doctor_details']['username'], 'doctor')
+
+    def test_appointment_list(self):
+        for user in (self.doctor, self.patient):
+            client = api_client(user)
+            with self.assertNumQueries(1):
+                response = client.get('/api/scheduling/appointments/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()['results']), 10)
+            self.assertEqual(response.json()['results'][0]['patient_name'], 'Patient Test')
+
+    def test_appointment_retrieve(self):
+        client = api_client(self.patient)
+        with self.assertNumQueries(1):
+            response = client.get(f'/api/scheduling/appointments/{self.appointments[0].pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['availability_details']['doctor_details']['id'], self.doctor.pk)
+
+
+class ConcurrentBookingTests(TransactionTestCase):
+    """Simultaneous bookings of one slot: exactly one wins, whatever the booking mode."""
+
+    clients = 8
+
+    def setUp(self):
+        # SQLite's bulk_create reads its parameter limit from an open connection
+        connection.ensure_connection()
+        # bulk_create sends no post_save, so no welcome emails are sent
+        self.doctor, *self.patients = User.objects.bulk_create([
+            User(username='doctor', email='doctor@example.com', role='doctor'),
+            *(User(username=f'patient{i}', email=f'patient{i}@example.com', role='patient') for i in range(self.clients)),
+        ])
+        self.slot = create_slots(self.doctor, 1)[0]
+
+    def book_concurrently(self) -> list[int]:
+        barrier = threading.Barrier(self.clients)
+        statuses: list[int] = []
+        lock = threading.Lock()
+
+        def book(patient):
+            client = api_client(patient)
+            try:
+                barrier.wait()
+                response = client.post('/api/scheduling/appointments/', {'availability': self.slot.pk}, format='json')
+                with lock:
+                    statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=book, args=(patient,)) for patient in self.patients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return statuses
+
+    def assert_one_booking(self, statuses: list[int]) -> None:
+        self.assertEqual(sorted(statuses), [201] + [409] * (self.clients - 1))
+        self.assertEqual(Appointment.objects.filter(availability=self.slot).count(), 1)
+        self.slot.refresh_from_db()
+        self.assertTrue(self.slot.is_booked)
+
+    @override_settings(SCHEDULING_BOOKING_MODE='optimistic')
+    def test_optimistic(self):
+        self.assert_one_booking(self.book_concurrently())
+
+    @override_settings(SCHEDULING_BOOKING_MODE='locking')
+    def test_locking(self):
+        self.assert_one_booking(self.book_concurrently())
+
+
+class ListCursorPaginationTests(TestCase):
+    """The list cursors hold the whole sort key, so rows tied on its first field are neither skipped nor repeated."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = create_user('patient', 'patient')
+        start = timezone.now() + timedelta(days=1)
+        for i in range(5):
+            # Every doctor has slots at the same three start times
+            create_slots(create_user(f'doctor{i}', 'doctor'), 3, start=start)
+
+    def setUp(self):
+        self.client = api_client(self.patient)
+
+    def walk(self, url, link):
+        """Ids on every page reached by following ``link`` from ``url``, and whether any page used OFFSET."""
+        pages, offset = [], False
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            offset = offset or any('OFFSET' in query['sql'] for query in queries)
+            pages.append([item['id'] for item in response.json()['results']])
+            url = response.json()[link]
+        return pages, offset
+
+    def test_availability_pages_through_tied_start_times(self):
+        expected = list(Availability.objects.order_by('start_time', 'id').values_list('id', flat=True))
+        pages, offset = self.walk('/api/scheduling/availability/?page_size=4', 'next')
+        self.assertEqual([slot_id for page in pages for slot_id in page], expected)
+        self.assertEqual([len(page) for page in pages], [4, 4, 4, 3])
+        self.assertFalse(offset)
+
+        # And back again from the last page
+        response = self.client.get('/api/scheduling/availability/?page_size=4')
+        while response.json()['next']:
+            response = self.client.get(response.json()['next'])
+        back, offset = self.walk(response.json()['previous'], 'previous')
+        self.assertEqual(back, pages[-2::-1])
+        self.assertFalse(offset)
+
+    def test_rows_leaving_the_list_do_not_shift_the_next_page(self):
+        expected = list(Availability.objects.order_by('start_time', 'id').values_list('id', flat=True))
+        response = self.client.get('/api/scheduling/availability/?page_size=4')
+        first = [item['id'] for item in response.json()['results']]
+        # A slot on the page already seen is booked before the next one is fetched
+        Availability.objects.filter(pk=first[0]).update(is_booked=True)
+
+        rest, _ = self.walk(response.json()['next'], 'next')
+        self.assertEqual(first + [slot_id for page in rest for slot_id in page], expected)
+
+    def test_appointments_created_together_are_all_listed(self):
+        slots = list(Availability.objects.order_by('id')[:7])
+        Appointment.objects.bulk_create([Appointment(patient=self.patient, availability=slot) for slot in slots])
+        Appointment.objects.update(created_at=timezone.now())
+        expected = list(Appointment.objects.order_by('-id').values_list('id', flat=True))
+
+        pages, offset = self.walk('/api/scheduling/appointments/?page_size=3', 'next')
+        self.assertEqual([appointment_id for page in pages for appointment_id in page], expected)
+        self.assertFalse(offset)
+
+    def test_malformed_cursor_is_rejected(self):
+        for position in ('2030-01-01 09:00:00+00:00', '2030-01-01 09:00:00|1', 'soon|1'):
+            cursor = base64.b64encode(urlencode({'p': position}).encode()).decode()
+            response = self.client.get('/api/scheduling/availability/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 404, position)
+
+
+@override_settings(CACHES=SHARED_CACHE)
+class SlotSearchTests(TestCase):
+    url = '/api/scheduling/availability/search/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = create_user('patient', 'patient')
+        cls.doctors = [create_user(f'doctor{i}', 'doctor') for i in range(3)]
+        for i, doctor in enumerate(cls.doctors):
+            # Interleaved start times across doctors
+            create_slots(doctor, 12, start=timezone.now() + timedelta(hours=2, minutes=10 * i))
+
+    def setUp(self):
+        self.client = api_client(self.patient)
+
+    def tearDown(self):
+        cache.clear()
+
+    def pages(self, params):
+        results, params = [], dict(params)
+        while True:
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 200)
+            results.extend((slot['start_time'], slot['id'], slot['doctor']) for slot in response.json()['results'])
+            if not response.json()['next']:
+                return results
+            params['cursor'] = parse_qs(urlparse(response.json()['next']).query)['cursor'][0]
+
+    def test_uncached_search_matches_cached(self):
+        params = {'page_size': 5}
+        cached = self.pages(params)
+        self.assertEqual(len(cached), 36)
+        self.assertEqual(cached, sorted(cached))
+        with override_settings(SCHEDULING_SEARCH_CACHE_MAX_PAIRS=0):
+            self.assertEqual(self.pages(params), cached)
+
+    def test_naive_or_malformed_cursor_is_rejected(self):
+        naive = base64.urlsafe_b64encode(b'2030-01-01T09:00:00|1').decode()
+        for cursor in (naive, 'not-a-cursor'):
+            response = self.client.get(self.url, {'cursor': cursor})
+            self.assertEqual(response.status_code, 400)
+
+    def test_doctor_directory_follows_doctor_changes(self):
+        self.client.get(self.url)
+        doctor = self.doctors[0]
+        doctor.first_name = 'Renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            doctor.save()
+        response = self.client.get(self.url, {'doctor': doctor.pk})
+        self.assertEqual(response.json()['results'][0]['doctor_details']['first_name'], 'Renamed')
+
+    def search_ids(self, doctor):
+        response = self.client.get(self.url, {'doctor': doctor.pk, 'page_size': 50})
+        return [slot['id'] for slot in response.json()['results']]
+
+    def test_repeat_search_is_served_from_cache(self):
+        doctor = self.doctors[0]
+        slot = Availability.objects.filter(doctor=doctor).first()
+        assert slot is not None
+        self.assertIn(slot.pk, self.search_ids(doctor))
+        with self.assertNumQueries(0):
+            self.assertIn(slot.pk, self.search_ids(doctor))
+
+        other = api_client(create_user('other', 'patient'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(other.post(f'/api/scheduling/availability/{slot.pk}/hold/').status_code, 200)
+        self.assertNotIn(slot.pk, self.search_ids(doctor))
+
+    @override_settings(CACHES=PER_PROCESS_CACHE)
+    def test_per_process_cache_is_bypassed(self):
+        doctor = self.doctors[0]
+        slot = Availability.objects.filter(doctor=doctor).first()
+        assert slot is not None
+        self.assertIn(slot.pk, self.search_ids(doctor))
+        self.assertIsNone(cache.get(DOCTOR_DIRECTORY_KEY))
+
+        # A hold placed by another worker: its invalidation only reaches that
+        # worker's own LocMemCache, never this one
+        Availability.objects.filter(pk=slot.pk).update(
+            held_by=create_user('other', 'patient'), hold_expires_at=timezone.now() + timedelta(minutes=2)
+        )
+        self.assertNotIn(slot.pk, self.search_ids(doctor))
+
+
+class WaitlistJoinTests(TestCase):
+    def test_duplicate_that_passes_validation_is_rejected(self):
+        doctor, patient = create_user('doctor', 'doctor'), create_user('patient', 'patient')
+        WaitlistEntry.objects.create(patient=patient, doctor=doctor)
+        client = api_client(patient)
+
+        # As if the other request inserted its row after this one validated
+        with mock.patch.object(WaitlistEntrySerializer, 'validate', lambda self, attrs: attrs):
+            response = client.post('/api/scheduling/waitlist/', {'doctor': doctor.pk}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(WaitlistEntry.objects.filter(patient=patient, doctor=doctor).count(), 1)
+
+
+@override_settings(SCHEDULING_EAGER_DISPATCH=False)
+class AsyncBookingTests(TransactionTestCase):
+    """The ASGI booking view; its transaction runs on a pool thread, so data must be committed."""
+    url = '/api/scheduling/appointments/book/'
+
+    def setUp(self):
+        connection.ensure_connection()
+        self.doctor, self.patient = User.objects.bulk_create([
+            User(username='doctor', email='doctor@example.com', role='doctor'),
+            User(username='patient', email='patient@example.com', role='patient'),
+        ])
+        self.slot = create_slots(self.doctor, 1)[0]
+        self.token = Token.objects.create(user=self.patient)
+
+    async def book(self, body):
+        # AsyncClient(headers=...) would send them under their WSGI names
+        return await AsyncClient().post(
+            self.url, body, content_type='application/json', headers={'Authorization': f'Token {self.token.key}'}
+        )
+
+    async def test_books_the_slot(self):
+        response = await self.book({'availability': self.slot.pk})
+        self.assertEqual(response.status_code, 201)
+        appointment = await Appointment.objects.aget(availability=self.slot)
+        self.assertEqual(appointment.patient_id, self.patient.pk)
+        self.assertEqual(await OutboxJob.objects.filter(status=OutboxJob.STATUS_PENDING).acount(), 3)
+
+        response = await self.book({'availability': self.slot.pk})
+        self.assertEqual(response.status_code, 409)
+
+    async def test_rejects_bad_slot_ids(self):
+        for body, status in (({}, 400), ({'availability': 'abc'}, 400), ({'availability': [1]}, 400),
+                             ({'availability': self.slot.pk + 1000}, 404)):
+            response = await self.book(body)
+            self.assertEqual(response.status_code, status, body)
+
+    async def test_anonymous_is_rejected(self):
+        response = await AsyncClient().post(self.url, {'availability': self.slot.pk}, content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(SCHEDULING_EAGER_DISPATCH=True)
+    async def test_dispatches_the_booking_jobs(self):
+        with mock.patch('scheduling.views.dispatch_now', new_callable=mock.AsyncMock) as dispatch:
+            response = await self.book({'availability': self.slot.pk})
+            self.assertEqual(response.status_code, 201)
+            await asyncio.sleep(0)
+        dispatch.assert_awaited_once()
+        self.assertEqual(len(dispatch.await_args_list[0].args[0]), 3)
+
+    @override_settings(SCHEDULING_EAGER_DISPATCH=True, SCHEDULING_EAGER_DISPATCH_LIMIT=0)
+    async def test_leaves_jobs_to_the_worker_past_the_dispatch_cap(self):
+        with mock.patch('scheduling.views.dispatch_now', new_callable=mock.AsyncMock) as dispatch:
+            response = await self.book({'availability': self.slot.pk})
+            self.assertEqual(response.status_code, 201)
+            await asyncio.sleep(0)
+        dispatch.assert_not_awaited()
+        self.assertEqual(await OutboxJob.objects.filter(status=OutboxJob.STATUS_PENDING).acount(), 3)
+
+
+class DispatchNowTests(TransactionTestCase):
+    def setUp(self):
+        connection.ensure_connection()
+        self.ran = []
+
+        async def succeed(payload):
+            self.ran.append(payload['n'])
+
+        async def fail(payload):
+            raise RuntimeError('upstream down')
+
+        for kind, handler in (('test.succeed', succeed), ('test.fail', fail)):
+            register_async_job(kind)(handler)
+            self.addCleanup(outbox._async_handlers.pop, kind)
+
+    async def test_runs_async_jobs_and_leaves_the_rest(self):
+        jobs = await sync_to_async(enqueue_many)([
+            ('test.succeed', {'n': 1}), ('test.succeed', {'n': 2}), ('test.fail', {}), ('test.sync_only', {}),
+        ])
+        self.assertEqual(await dispatch_now(jobs), 2)
+        self.assertEqual(sorted(self.ran), [1, 2])
+
+        statuses = {job.kind: (job.status, job.attempts) async for job in OutboxJob.objects.all()}
+        self.assertEqual(statuses['test.succeed'], (OutboxJob.STATUS_DONE, 1))
+        # Failures go back to the worker with backoff; kinds without an async handler are not claimed
+        self.assertEqual(statuses['test.fail'], (OutboxJob.STATUS_PENDING, 1))
+        self.assertEqual(statuses['test.sync_only'], (OutboxJob.STATUS_PENDING, 0))
+
+    async def test_does_not_rerun_claimed_jobs(self):
+        jobs = await sync_to_async(enqueue_many)([('test.succeed', {'n': 1})])
+        await dispatch_now(jobs)
+        self.assertEqual(await dispatch_now(jobs), 0)
+        self.assertEqual(self.ran, [1])
+
+
+@override_settings(OUTBOX_BACKOFF_BASE_SECONDS=60)
+class OutboxWorkerTests(TransactionTestCase):
+    """The worker side of the outbox: visibility, leasing, retries and batching."""
+
+    def setUp(self):
+        connection.ensure_connection()
+        self.batches = []
+
+        def fail(payload):
+            raise RuntimeError('upstream down')
+
+        def batch(payloads):
+            self.batches.append([payload['n'] for payload in payloads])
+            return [None if payload['n'] % 2 else ValueError('even') for payload in payloads]
+
+        outbox.register_job('test.fail')(fail)
+        outbox.register_job('test.batch', batch=True)(batch)
+        self.addCleanup(outbox._handlers.pop, 'test.fail')
+        self.addCleanup(outbox._batch_handlers.pop, 'test.batch')
+
+    def count_from_another_connection(self) -> int:
+        counts = []
+
+        def count():
+            try:
+                counts.append(OutboxJob.objects.count())
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=count)
+        thread.start()
+        thread.join()
+        return counts[0]
+
+    def test_jobs_are_visible_only_once_committed(self):
+        with transaction.atomic():
+            outbox.enqueue('test.fail', {})
+            self.assertEqual(self.count_from_another_connection(), 0)
+        self.assertEqual(self.count_from_another_connection(), 1)
+
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            outbox.enqueue('test.fail', {})
+            raise RuntimeError('booking failed')
+        self.assertEqual(OutboxJob.objects.count(), 1)
+
+    def test_leased_jobs_are_not_claimed_again(self):
+        enqueue_many([('test.fail', {}), ('test.fail', {})])
+        barrier = threading.Barrier(2)
+        claimed: list[list[int]] = []
+
+        def claim():
+            try:
+                barrier.wait()
+                claimed.append([job.pk for job in outbox.claim_due_jobs(1)])
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=claim) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(len(pks) for pks in claimed), [1, 1])
+        self.assertNotEqual(claimed[0], claimed[1])
+        self.assertEqual(outbox.claim_due_jobs(10), [])
+
+        # A lapsed lease means the worker died mid-job; the next one takes over
+        ids = [pks[0] for pks in claimed]
+        later = timezone.now() + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS + 1)
+        reclaimed = outbox.claim_jobs(ids, now=later)
+        self.assertEqual(sorted(job.attempts for job in reclaimed), [2, 2])
+
+    def test_failure_is_retried_with_backoff(self):
+        job = outbox.enqueue('test.fail', {})
+        before = timezone.now()
+        self.assertEqual(outbox.run_pending(), 1)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (OutboxJob.STATUS_PENDING, 1))
+        self.assertEqual(job.last_error, 'RuntimeError: upstream down')
+        self.assertIsNone(job.locked_until)
+        self.assertGreaterEqual(job.run_after, before + timedelta(seconds=30))
+        self.assertLessEqual(job.run_after, timezone.now() + timedelta(seconds=60))
+        # Not due again until the backoff has passed
+        self.assertEqual(outbox.run_pending(), 0)
+
+        self.assertEqual(len(outbox.claim_jobs([job.pk], now=job.run_after)), 1)
+
+    def test_failed_after_max_attempts(self):
+        job = outbox.enqueue('test.fail', {})
+        OutboxJob.objects.filter(pk=job.pk).update(attempts=job.max_attempts - 1)
+        self.assertEqual(outbox.run_pending(), 1)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (OutboxJob.STATUS_FAILED, job.max_attempts))
+        self.assertEqual(outbox.claim_jobs([job.pk], now=timezone.now() + timedelta(days=1)), [])
+
+    def test_batch_handler_gets_its_kind_together(self):
+        jobs = enqueue_many([('test.batch', {'n': n}) for n in range(1, 5)] + [('test.fail', {})])
+        # The claim's SELECT and UPDATE, then one UPDATE per kind; each transaction adds BEGIN and COMMIT
+        with self.assertNumQueries(10):
+            self.assertEqual(outbox.run_pending(), 5)
+        self.assertEqual(self.batches, [[1, 2, 3, 4]])
+
+        statuses = dict(OutboxJob.objects.filter(pk__in=[job.pk for job in jobs]).values_list('payload__n', 'status'))
+        self.assertEqual(statuses[1], OutboxJob.STATUS_DONE)
+        self.assertEqual(statuses[2], OutboxJob.STATUS_PENDING)
+        self.assertEqual(statuses[3], OutboxJob.STATUS_DONE)
+        self.assertEqual(statuses[4], OutboxJob.STATUS_PENDING)
+
+
+def book(patient, slot, **fields):
+    Availability.objects.filter(pk=slot.pk).update(is_booked=True)
+    return Appointment.objects.create(patient=patient, availability=slot, **fields)
+
+
+class CancelRescheduleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = create_user('doctor', 'doctor')
+        cls.other_doctor = create_user('otherdoc', 'doctor')
+        cls.patient = create_user('patient', 'patient')
+        cls.waiting = create_user('waiting', 'patient')
+        cls.slots = create_slots(cls.doctor, 5)
+        cls.appointment = book(cls.patient, cls.slots[0], google_event_id='p-event', doctor_google_event_id='d-event')
+
+    def setUp(self):
+        self.client = api_client(self.patient)
+
+    def reschedule(self, slot):
+        return self.client.post(f'/api/scheduling/appointments/{self.appointment.pk}/reschedule/',
+                                {'availability': slot.pk}, format='json')
+
+    def assert_unchanged(self):
+        self.appointment.refresh_from_db()
+        self.assertEqual(self.appointment.availability_id, self.slots[0].pk)
+        self.assertTrue(Availability.objects.get(pk=self.slots[0].pk).is_booked)
+
+    def test_cancel_frees_the_slot_for_the_waitlist(self):
+        entry = WaitlistEntry.objects.create(patient=self.waiting, doctor=self.doctor)
+        response = self.client.post(f'/api/scheduling/appointments/{self.appointment.pk}/cancel/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Appointment.objects.filter(pk=self.appointment.pk).exists())
+
+        slot = Availability.objects.get(pk=self.slots[0].pk)
+        self.assertFalse(slot.is_booked)
+        self.assertEqual(slot.held_by_id, self.waiting.pk)
+        entry.refresh_from_db()
+        self.assertEqual(entry.offered_slot_id, slot.pk)
+
+        offer = OutboxJob.objects.get(kind=SEND_EMAIL_JOB, payload__action='WAITLIST_OFFER')
+        self.assertEqual(offer.payload['recipient'], self.waiting.email)
+        self.assertEqual(offer.payload['data']['slotId'], str(slot.pk))
+        self.assertEqual(
+            sorted(OutboxJob.objects.filter(kind=CALENDAR_DELETE_JOB).values_list('payload__event_id', flat=True)),
+            ['d-event', 'p-event']
+        )
+
+    def test_reschedule_moves_the_appointment(self):
+        response = self.reschedule(self.slots[1])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['availability'], self.slots[1].pk)
+
+        self.appointment.refresh_from_db()
+        self.assertEqual(self.appointment.availability_id, self.slots[1].pk)
+        self.assertTrue(Availability.objects.get(pk=self.slots[1].pk).is_booked)
+        self.assertFalse(Availability.objects.get(pk=self.slots[0].pk).is_booked)
+        self.assertEqual(OutboxJob.objects.filter(kind=CALENDAR_UPDATE_JOB).count(), 2)
+
+    def test_reschedule_is_one_transaction(self):
+        with mock.patch('scheduling.rescheduling.release_booked_slot', side_effect=DatabaseError('lost')):
+            with self.assertRaises(DatabaseError):
+                reschedule_appointment(self.patient, self.appointment.pk, self.slots[1].pk)
+        # Claiming the new slot is rolled back with the failed release
+        self.assert_unchanged()
+        self.assertFalse(Availability.objects.get(pk=self.slots[1].pk).is_booked)
+        self.assertFalse(OutboxJob.objects.filter(kind=CALENDAR_UPDATE_JOB).exists())
+
+    def test_reschedule_to_unavailable_slot_keeps_the_booking(self):
+        booked, held, blocked = self.slots[2:5]
+        book(self.waiting, booked)
+        Availability.objects.filter(pk=held.pk).update(
+            held_by=self.waiting, hold_expires_at=timezone.now() + timedelta(minutes=5)
+        )
+        Availability.objects.filter(pk=blocked.pk).update(is_blocked=True)
+        elsewhere = create_slots(self.other_doctor, 1)[0]
+
+        for slot, expected in ((booked, 409), (held, 409), (blocked, 409), (elsewhere, 400)):
+            response = self.reschedule(slot)
+            self.assertEqual(response.status_code, expected, response.json())
+            self.assert_unchanged()
+        self.assertEqual(Appointment.objects.get(availability=booked).patient_id, self.waiting.pk)
+        self.assertFalse(Availability.objects.get(pk=elsewhere.pk).is_booked)
+
+    def test_started_appointment_cannot_change(self):
+        start = timezone.now() - timedelta(minutes=10)
+        started = book(self.patient, create_slots(self.doctor, 1, start=start)[0])
+
+        response = self.client.post(f'/api/scheduling/appointments/{started.pk}/cancel/')
+        self.assertEqual(response.status_code, 409)
+        response = self.client.post(f'/api/scheduling/appointments/{started.pk}/reschedule/',
+                                    {'availability': self.slots[1].pk}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertTrue(Appointment.objects.filter(pk=started.pk, availability=started.availability).exists())
+
+    def test_reschedule_to_past_slot(self):
+        past = create_slots(self.doctor, 1, start=timezone.now() - timedelta(days=1))[0]
+        self.assertEqual(self.reschedule(past).status_code, 404)
+        self.assert_unchanged()
+
+    def test_other_patients_cannot_touch_it(self):
+        client = api_client(self.waiting)
+        response = client.post(f'/api/scheduling/appointments/{self.appointment.pk}/cancel/')
+        self.assertEqual(response.status_code, 404)
+        self.assert_unchanged()
+
+
+class RescheduleRaceTests(TransactionTestCase):
+    """A reschedule racing a booking of its target slot: one wins, and a lost reschedule keeps its booking."""
+
+    def setUp(self):
+        connection.ensure_connection()
+        self.doctor, self.patient, self.rival = User.objects.bulk_create([
+            User(username='doctor', email='doctor@example.com', role='doctor'),
+            User(username='patient', email='patient@example.com', role='patient'),
+            User(username='rival', email='rival@example.com', role='patient'),
+        ])
+        self.old_slot, self.target = create_slots(self.doctor, 2)
+        self.appointment = book(self.patient, self.old_slot)
+
+    def race(self) -> dict[str, int]:
+        barrier = threading.Barrier(2)
+        statuses: dict[str, int] = {}
+
+        def request(name, user, url, body):
+            client = api_client(user)
+            try:
+                barrier.wait()
+                statuses[name] = client.post(url, body, format='json').status_code
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=request, args=(
+                'reschedule', self.patient, f'/api/scheduling/appointments/{self.appointment.pk}/reschedule/',
+                {'availability': self.target.pk},
+            )),
+            threading.Thread(target=request, args=(
+                'book', self.rival, '/api/scheduling/appointments/', {'availability': self.target.pk},
+            )),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return statuses
+
+    def assert_consistent(self, statuses: dict[str, int]) -> None:
+        self.assertIn(statuses, ({'reschedule': 200, 'book': 409}, {'reschedule': 409, 'book': 201}))
+        self.assertEqual(Appointment.objects.filter(availability=self.target).count(), 1)
+        self.appointment.refresh_from_db()
+        moved = statuses['reschedule'] == 200
+        self.assertEqual(self.appointment.availability_id, (self.target if moved else self.old_slot).pk)
+        self.assertEqual(Availability.objects.get(pk=self.old_slot.pk).is_booked, not moved)
+        self.assertTrue(Availability.objects.get(pk=self.target.pk).is_booked)
+
+    @override_settings(SCHEDULING_BOOKING_MODE='optimistic')
+    def test_optimistic(self):
+        self.assert_consistent(self.race())
+
+    @override_settings(SCHEDULING_BOOKING_MODE='locking')
+    def test_locking(self):
+        self.assert_consistent(self.race())
+
+
+def calendar_event(event_id, start, minutes=60, **fields):
+    return {
+        'id': event_id, 'status': 'confirmed',
+        'start': {'dateTime': start.isoformat()},
+        'end': {'dateTime': (start + timedelta(minutes=minutes)).isoformat()},
+        **fields,
+    }
+
+
+class CalendarSyncTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.calendar = fake_calendar_server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.calendar.shutdown()
+        cls.calendar.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.calendar.events, self.calendar.changes = None, None
+        self.calendar.busy_events = 1
+        self.calendar.sync_tokens.clear()
+        override = override_settings(GOOGLE_CALENDAR_API_ROOT=self.calendar.url)
+        override.enable()
+        self.addCleanup(override.disable)
+        # A non-expiring access token, so building a client makes no refresh call
+        self.doctor = User.objects.create(
+            username='doc', email='doc@example.com', role='doctor', google_access_token='test',
+            google_refresh_token='test', google_client_id='test', google_client_secret='test'
+        )
+        self.addCleanup(invalidate_calendar_client, self.doctor.pk)
+        self.patient = create_user('patient', 'patient')
+        # The fake's generated event busy0 is tomorrow 09:00-10:00 UTC
+        self.nine = datetime.combine(
+            timezone.now().date() + timedelta(days=1), datetime.min.time(), dt_timezone.utc
+        ) + timedelta(hours=9)
+        self.slots = create_slots(self.doctor, 4, start=self.nine)
+
+    def blocked(self) -> list[bool]:
+        return list(Availability.objects.filter(doctor=self.doctor).order_by('start_time')
+                    .values_list('is_blocked', flat=True))
+
+    def test_stores_the_sync_token_and_sends_it_next_time(self):
+        result = sync_doctor_calendar(self.doctor)
+        self.assertTrue(result.full)
+        self.doctor.refresh_from_db()
+        self.assertEqual(self.doctor.google_sync_token, 'sync-1')
+        self.assertEqual(self.blocked(), [True, True, False, False])
+
+        result = sync_doctor_calendar(self.doctor)
+        self.assertFalse(result.full)
+        self.assertEqual(self.calendar.sync_tokens, [None, 'sync-1'])
+        self.doctor.refresh_from_db()
+        self.assertEqual(self.doctor.google_sync_token, 'sync-2')
+        # The one event moved half an hour later
+        self.assertEqual(self.blocked(), [False, True, True, False])
+
+    def test_expired_token_runs_a_full_resync(self):
+        self.doctor.google_sync_token = 'expired'
+        CalendarBlock.objects.create(doctor=self.doctor, google_event_id='gone', start_time=self.slots[3].start_time,
+                                     end_time=self.slots[3].end_time)
+        Availability.objects.filter(pk=self.slots[3].pk).update(is_blocked=True)
+
+        result = sync_doctor_calendar(self.doctor)
+        self.assertTrue(result.full)
+        self.assertEqual(self.calendar.sync_tokens, ['expired', None])
+        self.assertEqual(User.objects.get(pk=self.doctor.pk).google_sync_token, 'sync-1')
+        # The full listing replaced every block
+        self.assertEqual(list(CalendarBlock.objects.values_list('google_event_id', flat=True)), ['busy0'])
+        self.assertEqual(self.blocked(), [True, True, False, False])
+
+    def test_own_appointment_events_do_not_block(self):
+        appointment = book(self.patient, self.slots[0], doctor_google_event_id='own')
+        self.calendar.events = [
+            calendar_event('own', self.nine, minutes=30),
+            calendar_event('tagged', self.slots[1].start_time, minutes=30,
+                           extendedProperties={'private': {'hmsAppointmentId': '99'}}),
+        ]
+        sync_doctor_calendar(self.doctor)
+        self.assertEqual(self.blocked(), [False] * 4)
+        self.assertFalse(CalendarBlock.objects.exists())
+
+        # Deleting it in Google makes the appointment forget the event
+        self.calendar.changes = [{'id': 'own', 'status': 'cancelled'}]
+        sync_doctor_calendar(self.doctor)
+        appointment.refresh_from_db()
+        self.assertIsNone(appointment.doctor_google_event_id)
+
+    def test_removed_external_event_unblocks_for_the_waitlist(self):
+        self.calendar.events = [calendar_event('external', self.slots[2].start_time, minutes=30)]
+        sync_doctor_calendar(self.doctor)
+        self.assertEqual(self.blocked(), [False, False, True, False])
+
+        entry = WaitlistEntry.objects.create(patient=self.patient, doctor=self.doctor)
+        self.calendar.changes = [{'id': 'external', 'status': 'cancelled'}]
+        result = sync_doctor_calendar(self.doctor)
+        self.assertEqual((result.blocked, result.unblocked), (0, 1))
+        self.assertEqual(self.blocked(), [False] * 4)
+        self.assertFalse(CalendarBlock.objects.exists())
+
+        slot = Availability.objects.get(pk=self.slots[2].pk)
+        self.assertEqual(slot.held_by_id, self.patient.pk)
+        entry.refresh_from_db()
+        self.assertEqual(entry.offered_slot_id, slot.pk)
+
+
+class SlotHoldTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = create_user('doctor', 'doctor')
+        cls.holder = create_user('holder', 'patient')
+        cls.other = create_user('other', 'patient')
+        cls.slots = create_slots(cls.doctor, 4)
+
+    def setUp(self):
+        self.client = api_client(self.holder)
+
+    def hold(self, slot, client=None, method='post'):
+        return getattr(client or self.client, method)(f'/api/scheduling/availability/{slot.pk}/hold/')
+
+    def test_held_slot_is_reserved_for_the_holder(self):
+        slot = self.slots[0]
+        self.assertEqual(self.hold(slot).status_code, 200)
+
+        other = api_client(self.other)
+        self.assertEqual(self.hold(slot, other).status_code, 409)
+        response = other.post('/api/scheduling/appointments/', {'availability': slot.pk}, format='json')
+        self.assertEqual(response.status_code, 409)
+        listed = [item['id'] for item in other.get('/api/scheduling/availability/').json()['results']]
+        self.assertNotIn(slot.pk, listed)
+
+        response = self.client.post('/api/scheduling/appointments/', {'availability': slot.pk}, format='json')
+        self.assertEqual(response.status_code, 201)
+        slot.refresh_from_db()
+        self.assertIsNone(slot.held_by_id)
+
+    def test_holding_again_keeps_the_expiry(self):
+        first = self.hold(self.slots[0]).json()['hold_expires_at']
+        self.assertEqual(self.hold(self.slots[0]).json()['hold_expires_at'], first)
+
+    def test_release_offers_the_slot_to_the_waitlist(self):
+        slot = self.slots[0]
+        self.hold(slot)
+        entry = WaitlistEntry.objects.create(patient=self.other, doctor=self.doctor)
+
+        self.assertEqual(self.hold(slot, method='delete').status_code, 204)
+        slot.refresh_from_db()
+        self.assertEqual(slot.held_by_id, self.other.pk)
+        entry.refresh_from_db()
+        self.assertEqual(entry.offered_slot_id, slot.pk)
+        self.assertEqual(self.hold(slot, method='delete').status_code, 404)
+
+    def test_sweeper_hands_expired_holds_to_the_waitlist(self):
+        slot = self.slots[0]
+        Availability.objects.filter(pk=slot.pk).update(
+            held_by=self.holder, hold_expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        entry = WaitlistEntry.objects.create(patient=self.other, doctor=self.doctor)
+
+        self.assertEqual(sweep_expired_holds(), 1)
+        slot.refresh_from_db()
+        self.assertEqual(slot.held_by_id, self.other.pk)
+        self.assertTrue(slot.is_held_for_other(self.holder))
+        entry.refresh_from_db()
+        self.assertEqual(entry.offered_slot_id, slot.pk)
+        self.assertTrue(OutboxJob.objects.filter(kind=SEND_EMAIL_JOB, payload__action='WAITLIST_OFFER').exists())
+        # The new offer has not lapsed yet
+        self.assertEqual(sweep_expired_holds(), 0)
+
+    @override_settings(SCHEDULING_MAX_HOLDS_PER_PATIENT=2)
+    def test_holds_per_patient_are_capped(self):
+        first, second, third = self.slots[:3]
+        self.assertEqual(self.hold(first).status_code, 200)
+        self.assertEqual(self.hold(second).status_code, 200)
+        response = self.hold(third)
+        self.assertEqual(response.status_code, 409)
+        self.assertIn('at most 2', response.json()['detail'])
+        self.assertIsNone(Availability.objects.get(pk=third.pk).held_by_id)
+        # Renewing a hold already counted is fine
+        self.assertEqual(self.hold(second).status_code, 200)
+
+        self.hold(first, method='delete')
+        self.assertEqual(self.hold(third).status_code, 200)
+
+    def test_non_numeric_slot_id(self):
+        for method in ('post', 'delete'):
+            response = self.client.generic(method.upper(), '/api/scheduling/availability/abc/hold/')
+            self.assertEqual(response.status_code, 404, method)
+
+
+@override_settings(CACHES=SHARED_CACHE)
+class DoctorScheduleTests(TestCase):
+    url = '/api/scheduling/availability/schedule/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = create_user('doctor', 'doctor')
+        cls.patient = create_user('patient', 'patient')
+        cls.day = timezone.localdate() + timedelta(days=1)
+        cls.slots = create_slots(cls.doctor, 3, start=day_bounds(cls.day)[0] + timedelta(hours=10))
+
+    def setUp(self):
+        self.client = api_client(self.doctor)
+
+    def tearDown(self):
+        cache.clear()
+
+    def statuses(self):
+        response = self.client.get(self.url, {'date_from': str(self.day), 'date_to': str(self.day)})
+        self.assertEqual(response.status_code, 200)
+        [day] = response.json()['days']
+        return [(slot['status'], slot['appointment'] and slot['appointment']['patient']['name']) for slot in day['slots']]
+
+    def test_follows_bookings_holds_and_cancellations(self):
+        self.assertEqual(self.statuses(), [('free', None)] * 3)
+        with self.assertNumQueries(0):
+            self.statuses()
+
+        patient = api_client(self.patient)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = patient.post('/api/scheduling/appointments/', {'availability': self.slots[0].pk}, format='json')
+        self.assertEqual(response.status_code, 201)
+        with self.captureOnCommitCallbacks(execute=True):
+            patient.post(f'/api/scheduling/availability/{self.slots[1].pk}/hold/')
+        self.assertEqual(self.statuses(), [('booked', 'Patient Test'), ('held', None), ('free', None)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            patient.post(f"/api/scheduling/appointments/{response.json()['id']}/cancel/")
+        self.assertEqual(self.statuses(), [('free', None), ('held', None), ('free', None)])
+
+    @override_settings(CACHES=PER_PROCESS_CACHE)
+    def test_per_process_cache_is_bypassed(self):
+        self.assertEqual(self.statuses(), [('free', None)] * 3)
+        # A change made by another worker, whose invalidation never reaches this one
+        Availability.objects.filter(pk=self.slots[2].pk).update(is_blocked=True)
+        self.assertEqual(self.statuses(), [('free', None), ('free', None), ('blocked', None)])
+
+    def test_patients_cannot_read_it(self):
+        self.assertEqual(api_client(self.patient).get(self.url).status_code, 403)
+
+
+class BulkAvailabilityTests(TestCase):
+    url = '/api/scheduling/availability/bulk/'
+    tz = ZoneInfo('Europe/Berlin')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = create_user('doctor', 'doctor')
+        today = timezone.localdate()
+        # A Monday at least a week away, so no slot of the rule is in the past
+        cls.monday = today + timedelta(days=7 + (7 - today.weekday()) % 7)
+
+    def setUp(self):
+        self.client = api_client(self.doctor)
+
+    def rule(self, **overrides):
+        return {
+            'weekdays': [0, 2, 4], 'start_time': '09:00', 'end_time': '12:00', 'slot_minutes': 30,
+            'start_date': str(self.monday), 'weeks': 2, 'timezone': 'Europe/Berlin', **overrides,
+        }
+
+    def at(self, day_offset, hour, minute=0):
+        return datetime.combine(self.monday + timedelta(days=day_offset), time(hour, minute), self.tz)
+
+    def test_weekly_recurrence_expands(self):
+        response = self.client.post(self.url, {'recurrence': self.rule()}, format='json')
+        self.assertEqual(response.status_code, 201)
+        # 6 half-hour slots on Monday, Wednesday and Friday of two weeks
+        self.assertEqual(len(response.json()), 36)
+        starts = list(Availability.objects.filter(doctor=self.doctor).values_list('start_time', flat=True))
+        self.assertEqual(len(starts), 36)
+        self.assertEqual(min(starts), self.at(0, 9))
+        self.assertEqual(max(starts), self.at(11, 11, 30))
+        self.assertEqual({start.astimezone(self.tz).weekday() for start in starts}, {0, 2, 4})
+
+    def test_overlap_with_an_existing_slot_rejects_the_whole_rule(self):
+        Availability.objects.create(doctor=self.doctor, start_time=self.at(9, 10, 15), end_time=self.at(9, 10, 45))
+        response = self.client.post(self.url, {'recurrence': self.rule()}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('overlaps with an existing availability', str(response.json()))
+        self.assertEqual(Availability.objects.filter(doctor=self.doctor).count(), 1)
+
+    def test_invalid_or_empty_rules(self):
+        for body in (
+            {},
+            {'recurrence': self.rule(), 'slots': []},
+            {'recurrence': self.rule(weekdays=[])},
+            {'recurrence': self.rule(weekdays=[7])},
+            {'recurrence': self.rule(start_time='12:00', end_time='09:00')},
+            {'recurrence': self.rule(slot_minutes=240)},
+            {'recurrence': self.rule(timezone='Mars/Olympus')},
+            {'recurrence': self.rule(weeks=0)},
+        ):
+            response = self.client.post(self.url, body, format='json')
+            self.assertEqual(response.status_code, 400, body)
+        self.assertFalse(Availability.objects.exists())
+
+    def test_only_doctors_may_create(self):
+        client = api_client(create_user('patient', 'patient'))
+        response = client.post(self.url, {'recurrence': self.rule()}, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Availability.objects.exists())
+
+    def test_inserts_in_one_batch(self):
+        # Every day, 08:00-18:00 in 15-minute slots for 4 weeks: 1120 slots.
+        # The overlap and calendar-block reads, one INSERT, and the savepoint around it
+        with self.assertNumQueries(5):
+            response = self.client.post(self.url, {'recurrence': self.rule(
+                weekdays=list(range(7)), start_time='08:00', end_time='18:00', slot_minutes=15, weeks=4
+            )}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Availability.objects.filter(doctor=self.doctor).count(), 1120)
+
+
+class SlotEventTests(TestCase):
+    url = '/api/scheduling/availability/events/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = create_user('doctor', 'doctor')
+        cls.other_doctor = create_user('otherdoc', 'doctor')
+        cls.patient = create_user('patient', 'patient')
+        cls.slot = create_slots(cls.doctor, 1)[0]
+        cls.token = Token.objects.create(user=cls.patient)
+
+    def setUp(self):
+        self.broker = InProcessBroker()
+        for name in ('scheduling.events.get_event_broker', 'scheduling.views.get_event_broker'):
+            self.enterContext(mock.patch(name, return_value=self.broker))
+
+    def request(self, method, path):
+        with self.captureOnCommitCallbacks(execute=True):
+            return getattr(api_client(self.patient), method)(path, {'availability': self.slot.pk}, format='json')
+
+    async def received(self, subscription):
+        events = []
+        while (message := await subscription.get(timeout=0.05)) is not None:
+            events.append((message['type'], message['slot']['id']))
+        return events
+
+    async def test_slot_changes_reach_doctor_and_all_doctor_subscribers(self):
+        async with (self.broker.subscribe([doctor_channel(self.doctor.pk)]) as doctor_feed,
+                    self.broker.subscribe([ALL_DOCTORS_CHANNEL]) as all_feed,
+                    self.broker.subscribe([doctor_channel(self.other_doctor.pk)]) as other_feed):
+            response = await sync_to_async(self.request)('post', f'/api/scheduling/availability/{self.slot.pk}/hold/')
+            self.assertEqual(response.status_code, 200)
+            response = await sync_to_async(self.request)('post', '/api/scheduling/appointments/')
+            self.assertEqual(response.status_code, 201)
+            appointment_id = response.json()['id']
+            response = await sync_to_async(self.request)('post', f'/api/scheduling/appointments/{appointment_id}/cancel/')
+            self.assertEqual(response.status_code, 204)
+
+            expected = [('slot.held', self.slot.pk), ('slot.booked', self.slot.pk), ('slot.released', self.slot.pk)]
+            self.assertEqual(await self.received(doctor_feed), expected)
+            self.assertEqual(await self.received(all_feed), expected)
+            self.assertEqual(await self.received(other_feed), [])
+
+    def test_wsgi_is_refused(self):
+        self.assertEqual(api_client(self.patient).get(self.url).status_code, 501)
+
+    async def test_anonymous_is_rejected(self):
+        self.assertEqual((await AsyncClient().get(self.url)).status_code, 401)
+
+    async def test_doctor_must_be_an_id(self):
+        response = await AsyncClient().get(
+            self.url, {'doctor': 'abc'}, headers={'Authorization': f'Token {self.token.key}'}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    async def test_streams_events_for_the_doctor(self):
+        response = await AsyncClient().get(
+            self.url, {'doctor': str(self.doctor.pk)}, headers={'Authorization': f'Token {self.token.key}'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        assert isinstance(response, StreamingHttpResponse)
+        stream = response.streaming_content
+        assert isinstance(stream, AsyncGenerator)
+        self.assertEqual(await anext(stream), b'retry: 5000\n\n')
+
+        message = {'type': 'slot.booked', 'slot': {'id': self.slot.pk}}
+        self.broker.publish_many([(doctor_channel(self.other_doctor.pk), message),
+                                  (doctor_channel(self.doctor.pk), message)])
+        self.assertEqual(await anext(stream), f'event: slot.booked\ndata: {{"id": {self.slot.pk}}}\n\n'.encode())
+        await stream.aclose()
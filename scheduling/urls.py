@@ -1,13 +1,17 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import AvailabilityViewSet, AppointmentViewSet
+from .views import AvailabilityViewSet, AppointmentViewSet, WaitlistViewSet, book_appointment, slot_event_stream
 
 app_name = 'scheduling'
 
 router = DefaultRouter()
 router.register(r'availability', AvailabilityViewSet, basename='availability')
 router.register(r'appointments', AppointmentViewSet, basename='appointments')
+router.register(r'waitlist', WaitlistViewSet, basename='waitlist')
 
 urlpatterns = [
+    # Before the router so "events" and "book" are not taken for a pk
+    path('availability/events/', slot_event_stream, name='availability-events'),
+    path('appointments/book/', book_appointment, name='appointments-book'),
     path('', include(router.urls)),
 ]
@@ -1,17 +1,48 @@
 from rest_framework import viewsets, permissions, status, mixins
+from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.request import Request
-from django.db import transaction, DatabaseError
-from django.db.models import QuerySet
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import DatabaseError
+from django.db.models import Q, QuerySet
+from django.http import HttpRequest, JsonResponse, StreamingHttpResponse
 from django.utils import timezone
-from typing import TYPE_CHECKING, Any, TypeGuard
-import requests
+from django.views.decorators.csrf import csrf_exempt
+from datetime import date, datetime, timedelta
+import asyncio
+import heapq
+from itertools import islice
+import json
+from typing import TYPE_CHECKING, Any, Iterator, TypeGuard
 import logging
 
-from .models import Availability, Appointment
-from .serializers import AvailabilitySerializer, AppointmentSerializer
-from users.permissions import IsDoctor
-from users.services import create_calendar_event
+from .models import Availability, Appointment, WaitlistEntry
+from .booking import Booking, SlotAlreadyBooked, SlotBlocked, SlotHeld, SlotNotFound, book_slot, not_held_by_others
+from .cache import day_bounds, doctor_directory, get_doctor_schedule, get_free_slots
+from .events import ALL_DOCTORS_CHANNEL, doctor_channel, get_event_broker
+from .holds import TooManyHolds, hold_slot, max_holds, release_hold
+from .outbox import dispatch_now, run_in_db_thread
+from .pagination import AppointmentCursorPagination, AvailabilityCursorPagination
+from .rescheduling import (
+    AppointmentNotFound,
+    AppointmentStarted,
+    DifferentDoctor,
+    cancel_appointment,
+    reschedule_appointment,
+)
+from .serializers import (
+    AvailabilitySerializer,
+    AvailabilityBulkSerializer,
+    AppointmentSerializer,
+    RescheduleSerializer,
+    ScheduleQuerySerializer,
+    SlotSearchSerializer,
+    WaitlistEntrySerializer,
+    encode_slot_cursor,
+)
+from users.authentication import aauthenticate
+from users.permissions import IsDoctor, IsPatient
 
 if TYPE_CHECKING:
     from users.models import User
@@ -19,6 +50,71 @@ if TYPE_CHECKING:
 logger = logging.getLogger(__name__)
 
 
+# Column projections matching AvailabilitySerializer / AppointmentSerializer,
+# including the nested UserListSerializer and patient.get_full_name.
+AVAILABILITY_FIELDS = (
+    'id', 'doctor', 'start_time', 'end_time', 'is_booked', 'is_blocked',
+    'doctor__id', 'doctor__username', 'doctor__first_name', 'doctor__last_name', 'doctor__role',
+)
+APPOINTMENT_FIELDS = (
+    'id', 'patient', 'availability', 'created_at', 'google_event_id',
+    'patient__id', 'patient__first_name', 'patient__last_name',
+    *(f'availability__{field}' for field in AVAILABILITY_FIELDS),
+)
+
+
+def availability_queryset() -> QuerySet[Availability]:
+    return Availability.objects.select_related('doctor').only(*AVAILABILITY_FIELDS)
+
+
+def appointment_queryset() -> QuerySet[Appointment]:
+    return Appointment.objects.select_related('patient', 'availability__doctor').only(*APPOINTMENT_FIELDS)
+
+
+def schedule_entry(row: dict[str, Any], now: datetime) -> dict[str, Any]:
+    """One cached schedule row as returned by the schedule endpoint, with holds checked at ``now``."""
+    held = row['hold_expires_at'] is not None and row['hold_expires_at'] > now
+    if row['is_booked']:
+        slot_status = 'booked'
+    elif row['is_blocked']:
+        slot_status = 'blocked'
+    else:
+        slot_status = 'held' if held else 'free'
+    appointment = None
+    if row['appointment_id'] is not None:
+        appointment = {
+            'id': row['appointment_id'],
+            'patient': {'id': row['patient_id'], 'name': row['patient_name']},
+        }
+    return {
+        'id': row['id'],
+        'start_time': row['start_time'],
+        'end_time': row['end_time'],
+        'status': slot_status,
+        'is_blocked': row['is_blocked'],
+        'hold_expires_at': row['hold_expires_at'] if held else None,
+        'appointment': appointment,
+    }
+
+
+def open_slots(date_from: date, date_to: date, now: datetime, after: tuple[datetime, int] | None) -> Iterator[tuple]:
+    """
+    ``(start_time, end_time, id, doctor_id)`` of every doctor's free slots in
+    the date range, in (start_time, id) order after the ``after`` keyset.
+    Streamed, so the search stops reading once its page is full.
+    """
+    slots = Availability.objects.filter(
+        Q(hold_expires_at__isnull=True) | Q(hold_expires_at__lte=now),
+        start_time__gte=max(day_bounds(date_from)[0], now),
+        start_time__lt=day_bounds(date_to)[1],
+        is_booked=False,
+        is_blocked=False,
+    )
+    if after:
+        slots = slots.filter(Q(start_time__gt=after[0]) | Q(start_time=after[0], id__gt=after[1]))
+    return slots.order_by('start_time', 'id').values_list('start_time', 'end_time', 'id', 'doctor_id').iterator()
+
+
 def get_authenticated_user(request: Request) -> "User | None":
     user = request.user
     if user.is_authenticated:
@@ -32,10 +128,13 @@ def is_authenticated_user(user: Any) -> TypeGuard["User"]:
 
 class AvailabilityViewSet(viewsets.ModelViewSet):
     serializer_class = AvailabilitySerializer
+    pagination_class = AvailabilityCursorPagination
 
     def get_permissions(self) -> list[permissions.BasePermission]:
-        if self.action in ['create', 'update', 'partial_update', 'destroy']:
+        if self.action in ['create', 'bulk', 'update', 'partial_update', 'destroy', 'schedule']:
             return [IsDoctor()]
+        if self.action == 'hold':
+            return [IsPatient()]
         return [permissions.IsAuthenticated()]
 
     def get_queryset(self) -> QuerySet[Availability]:
@@ -44,14 +143,156 @@ class AvailabilityViewSet(viewsets.ModelViewSet):
             return Availability.objects.none()
 
         if user.is_doctor:
-            return Availability.objects.filter(doctor=user)
+            return availability_queryset().filter(doctor=user)
         elif user.is_patient:
-            return Availability.objects.filter(
+            now = timezone.now()
+            return availability_queryset().filter(
+                not_held_by_others(user, now),
                 is_booked=False,
-                start_time__gt=timezone.now()
+                is_blocked=False,
+                start_time__gt=now
             )
         return Availability.objects.none()
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request: Request) -> Response:
+        """Create many slots at once from a list or a weekly recurrence rule."""
+        serializer = AvailabilityBulkSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        slots = serializer.save()
+        return Response(
+            AvailabilitySerializer(slots, many=True, context=self.get_serializer_context()).data,
+            status=status.HTTP_201_CREATED
+        )
+
+    @action(detail=True, methods=['post', 'delete'])
+    def hold(self, request: Request, pk: str | None = None) -> Response:
+        """
+        POST holds the slot for the patient for SCHEDULING_HOLD_SECONDS so it
+        can be booked without racing; DELETE releases it to the waitlist.
+        """
+        user = request.user
+        if request.method == 'DELETE':
+            if not release_hold(user, pk):
+                return Response({"detail": "You do not hold this slot."}, status=status.HTTP_404_NOT_FOUND)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        try:
+            slot = hold_slot(user, pk)
+        except SlotNotFound:
+            return Response({"detail": "Availability slot not found."}, status=status.HTTP_404_NOT_FOUND)
+        except SlotHeld:
+            return Response({"detail": "This slot is held by another patient."}, status=status.HTTP_409_CONFLICT)
+        except SlotBlocked:
+            return Response({"detail": "This slot is no longer available."}, status=status.HTTP_409_CONFLICT)
+        except SlotAlreadyBooked:
+            return Response({"detail": "This slot has already been booked."}, status=status.HTTP_409_CONFLICT)
+        except TooManyHolds:
+            return Response(
+                {"detail": f"You can hold at most {max_holds()} slots at a time."},
+                status=status.HTTP_409_CONFLICT
+            )
+        return Response({'id': slot.pk, 'hold_expires_at': slot.hold_expires_at})
+
+    @action(detail=False, methods=['get'])
+    def search(self, request: Request) -> Response:
+        """
+        Free slots across doctors, filtered by doctor, date range and time of
+        day, with keyset pagination on (start_time, id). Served from the
+        per-doctor, per-day free-slot cache, or for searches spanning more
+        doctor-days than SCHEDULING_SEARCH_CACHE_MAX_PAIRS, by walking the
+        open-slot index.
+        """
+        params = SlotSearchSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        query = params.validated_data
+
+        doctors = doctor_directory()
+        doctor_ids = [query['doctor']] if 'doctor' in query else list(doctors)
+        days = [
+            query['date_from'] + timedelta(days=offset)
+            for offset in range((query['date_to'] - query['date_from']).days + 1)
+        ]
+        now = timezone.now()
+        after = query.get('cursor')
+        time_from = query.get('time_from')
+        time_to = query.get('time_to')
+
+        def matches(slot: tuple) -> bool:
+            start_time, _, slot_id = slot
+            if start_time <= now or (after and (start_time, slot_id) <= after):
+                return False
+            if time_from or time_to:
+                local_time = timezone.localtime(start_time).time()
+                if (time_from and local_time < time_from) or (time_to and local_time >= time_to):
+                    return False
+            return True
+
+        page_size = query['page_size']
+        if len(doctor_ids) * len(days) <= getattr(settings, 'SCHEDULING_SEARCH_CACHE_MAX_PAIRS', 500):
+            candidates = (
+                (slot[0], slot[2], doctor_id, slot[1])
+                for (doctor_id, _), slots in get_free_slots(doctor_ids, days).items()
+                for slot in slots
+                if matches(slot)
+            )
+            page = heapq.nsmallest(page_size + 1, candidates)
+        else:
+            # Already in page order
+            page = list(islice((
+                (start_time, slot_id, doctor_id, end_time)
+                for start_time, end_time, slot_id, doctor_id in open_slots(days[0], days[-1], now, after)
+                if matches((start_time, end_time, slot_id))
+            ), page_size + 1))
+
+        next_url = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            last_start, last_id = page[-1][0], page[-1][1]
+            next_params = request.query_params.copy()
+            next_params['cursor'] = encode_slot_cursor(last_start, last_id)
+            next_url = request.build_absolute_uri(f"{request.path}?{next_params.urlencode()}")
+
+        return Response({
+            'next': next_url,
+            'results': [
+                {
+                    'id': slot_id,
+                    'doctor': doctor_id,
+                    'doctor_details': doctors.get(doctor_id),
+                    'start_time': start_time,
+                    'end_time': end_time,
+                    'is_booked': False,
+                    'is_blocked': False,
+                }
+                for start_time, slot_id, doctor_id, end_time in page
+            ],
+        })
+
+
+    @action(detail=False, methods=['get'])
+    def schedule(self, request: Request) -> Response:
+        """
+        The doctor's slots for a date range, grouped by day, with booking
+        status and patient, in place of paging through the availability and
+        appointment lists. Served from the per-doctor, per-day schedule cache.
+        """
+        params = ScheduleQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        date_from, date_to = params.validated_data['date_from'], params.validated_data['date_to']
+
+        days = [date_from + timedelta(days=offset) for offset in range((date_to - date_from).days + 1)]
+        schedule = get_doctor_schedule(request.user.pk, days)
+        now = timezone.now()
+        return Response({
+            'doctor': request.user.pk,
+            'date_from': date_from,
+            'date_to': date_to,
+            'days': [
+                {'date': day, 'slots': [schedule_entry(row, now) for row in schedule[day]]}
+                for day in days
+            ],
+        })
 
 class AppointmentViewSet(
     mixins.CreateModelMixin,
@@ -61,6 +302,7 @@ class AppointmentViewSet(
 ):
     serializer_class = AppointmentSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = AppointmentCursorPagination
 
     def get_queryset(self) -> QuerySet[Appointment]:
         user = self.request.user
@@ -68,8 +310,8 @@ class AppointmentViewSet(
             return Appointment.objects.none()
 
         if user.is_doctor:
-            return Appointment.objects.filter(availability__doctor=user)
-        return Appointment.objects.filter(patient=user)
+            return appointment_queryset().filter(availability__doctor=user)
+        return appointment_queryset().filter(patient=user)
 
     def create(self, request: Request, *args: Any, **kwargs: Any) -> Response:
         user = get_authenticated_user(request)
@@ -99,89 +341,206 @@ class AppointmentViewSet(
             )
 
         try:
-            with transaction.atomic():
-                availability_slot = Availability.objects.select_for_update().get(
-                    pk=availability_id
-                )
-
-                if availability_slot.is_booked:
-                    return Response(
-                        {"detail": "This slot has already been booked."},
-                        status=status.HTTP_409_CONFLICT
-                    )
-
-                availability_slot.is_booked = True
-                availability_slot.save()
-
-                appointment = Appointment.objects.create(
-                    patient=user,
-                    availability=availability_slot
-                )
-
-        except Availability.DoesNotExist:
+            appointment = book_slot(user, availability_id).appointment
+        except SlotNotFound:
             return Response(
                 {"detail": "Availability slot not found."},
                 status=status.HTTP_404_NOT_FOUND
             )
+        except SlotHeld:
+            return Response(
+                {"detail": "This slot is held by another patient."},
+                status=status.HTTP_409_CONFLICT
+            )
+        except SlotBlocked:
+            return Response(
+                {"detail": "This slot is no longer available."},
+                status=status.HTTP_409_CONFLICT
+            )
+        except SlotAlreadyBooked:
+            return Response(
+                {"detail": "This slot has already been booked."},
+                status=status.HTTP_409_CONFLICT
+            )
         except DatabaseError:
             return Response(
                 {"detail": "An error occurred while processing the booking."},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-        self._handle_integrations(appointment)
-
         serializer = self.get_serializer(appointment)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-    def _handle_integrations(self, appointment: Appointment) -> None:
-        doctor = appointment.availability.doctor
-        patient = appointment.patient
-        start_time = appointment.availability.start_time
-        end_time = appointment.availability.end_time
-
-        # 1. Google Calendar: Doctor
-        doctor_event_body = {
-            'summary': f'Appointment with {patient.get_full_name()}',
-            'description': f'Patient Email: {patient.email}',
-            'start': {'dateTime': start_time.isoformat()},
-            'end': {'dateTime': end_time.isoformat()},
-        }
-        create_calendar_event(doctor, doctor_event_body)
-
-        # 2. Google Calendar: Patient
-        patient_event_body = {
-            'summary': f'Appointment with Dr. {doctor.get_full_name()}',
-            'description': f'Doctor Email: {doctor.email}',
-            'start': {'dateTime': start_time.isoformat()},
-            'end': {'dateTime': end_time.isoformat()},
-        }
-        patient_event = create_calendar_event(patient, patient_event_body)
-
-        # Save patient's event ID if created
-        if patient_event:
-            appointment.google_event_id = patient_event.get('id')
-            appointment.save(update_fields=['google_event_id'])
-
-        # 3. Send booking confirmation email via email service
-        details = f"Appointment with Dr. {doctor.get_full_name()} on {start_time.strftime('%Y-%m-%d at %H:%M')}"
-        
-        email_payload = {
-            "action": "BOOKING_CONFIRMATION",
-            "recipient": patient.email,
-            "data": {
-                "userName": patient.get_full_name(),
-                "bookingId": str(appointment.id),
-                "details": details
-            }
-        }
-
+    @action(detail=True, methods=['post'])
+    def cancel(self, request: Request, pk: str | None = None) -> Response:
+        """Cancel an upcoming appointment (patient or doctor) and free its slot."""
         try:
-            requests.post(
-                'http://localhost:3003/email/send',
-                json=email_payload,
-                timeout=5
+            cancel_appointment(request.user, pk)
+        except AppointmentNotFound:
+            return Response({"detail": "Appointment not found."}, status=status.HTTP_404_NOT_FOUND)
+        except AppointmentStarted:
+            return Response(
+                {"detail": "Appointments cannot be changed once they have started."},
+                status=status.HTTP_409_CONFLICT
+            )
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['post'])
+    def reschedule(self, request: Request, pk: str | None = None) -> Response:
+        """
+        Move an upcoming appointment to another free slot of the same doctor;
+        the old slot is released in the same transaction.
+        """
+        serializer = RescheduleSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            appointment = reschedule_appointment(request.user, pk, serializer.validated_data['availability'])
+        except AppointmentNotFound:
+            return Response({"detail": "Appointment not found."}, status=status.HTTP_404_NOT_FOUND)
+        except AppointmentStarted:
+            return Response(
+                {"detail": "Appointments cannot be changed once they have started."},
+                status=status.HTTP_409_CONFLICT
             )
-        except requests.RequestException as e:
-            # Log the error but do not crash or rollback the booking
-            logger.error(f"Failed to send booking confirmation email: {e}")
+        except DifferentDoctor:
+            return Response(
+                {"availability": "Choose a slot with the same doctor."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except SlotNotFound:
+            return Response({"detail": "Availability slot not found."}, status=status.HTTP_404_NOT_FOUND)
+        except SlotHeld:
+            return Response({"detail": "This slot is held by another patient."}, status=status.HTTP_409_CONFLICT)
+        except SlotBlocked:
+            return Response({"detail": "This slot is no longer available."}, status=status.HTTP_409_CONFLICT)
+        except SlotAlreadyBooked:
+            return Response({"detail": "This slot has already been booked."}, status=status.HTTP_409_CONFLICT)
+        return Response(self.get_serializer(appointment).data)
+
+
+class WaitlistViewSet(
+    mixins.CreateModelMixin,
+    mixins.ListModelMixin,
+    mixins.DestroyModelMixin,
+    viewsets.GenericViewSet
+):
+    """A patient's waitlist places; freed slots are offered oldest place first."""
+    serializer_class = WaitlistEntrySerializer
+    permission_classes = [IsPatient]
+
+    def get_queryset(self) -> QuerySet[WaitlistEntry]:
+        return WaitlistEntry.objects.filter(patient=self.request.user).order_by('-created_at', '-id')
+
+
+async def slot_event_stream(request: HttpRequest) -> StreamingHttpResponse | JsonResponse:
+    """
+    Server-sent events feed of slot changes (created, updated, booked, held,
+    released, blocked, deleted) for ``?doctor=<id>`` (repeatable) or every doctor.
+
+    ASGI only: under WSGI Django consumes an async stream to the end before
+    sending anything, so the response would never start while it buffered
+    events forever. Such requests get 501.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({"detail": "Event streaming requires an ASGI server."}, status=501)
+    if request.method != 'GET':
+        return JsonResponse({"detail": f'Method "{request.method}" not allowed.'}, status=405)
+    if await aauthenticate(request) is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+
+    try:
+        doctor_ids = {int(value) for value in request.GET.getlist('doctor')}
+    except ValueError:
+        return JsonResponse({"doctor": "Must be a doctor id."}, status=400)
+    channels = [doctor_channel(doctor_id) for doctor_id in doctor_ids] or [ALL_DOCTORS_CHANNEL]
+    keepalive = getattr(settings, 'SCHEDULING_EVENT_KEEPALIVE_SECONDS', 15)
+
+    async def events():
+        async with get_event_broker().subscribe(channels) as subscription:
+            # Reconnect delay hint for EventSource clients, in milliseconds
+            yield 'retry: 5000\n\n'
+            while True:
+                message = await subscription.get(timeout=keepalive)
+                if message is None:
+                    # SSE comment line; keeps proxies from closing an idle stream
+                    yield ': keepalive\n\n'
+                    continue
+                yield f"event: {message['type']}\ndata: {json.dumps(message['slot'])}\n\n"
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# Strong references to in-flight dispatch tasks so they are not garbage collected
+_dispatch_tasks: set[asyncio.Task] = set()
+
+
+def _dispatch_in_background(request: HttpRequest, booking: Booking) -> None:
+    # Under WSGI the view runs in a throwaway async_to_sync loop that is torn
+    # down with the response, abandoning the task; leave the jobs to the worker
+    if not isinstance(request, ASGIRequest):
+        return
+    # Each dispatch writes its outcomes back; past the cap those writes start
+    # queuing behind the bookings themselves, so leave the overflow to the worker
+    if len(_dispatch_tasks) >= getattr(settings, 'SCHEDULING_EAGER_DISPATCH_LIMIT', 4):
+        return
+    task = asyncio.get_running_loop().create_task(dispatch_now(booking.jobs))
+    _dispatch_tasks.add(task)
+    task.add_done_callback(_dispatch_tasks.discard)
+
+
+@csrf_exempt
+async def book_appointment(request: HttpRequest) -> JsonResponse:
+    """
+    Async ``AppointmentViewSet.create`` for ASGI deployments.
+
+    The booking transaction runs in the sync thread; when served over ASGI
+    with SCHEDULING_EAGER_DISPATCH the calendar and email jobs it queued are
+    then run concurrently on the event loop after the response is sent,
+    instead of waiting for the outbox worker (which still retries any that
+    fail). At most SCHEDULING_EAGER_DISPATCH_LIMIT dispatches run at once;
+    further bookings leave their jobs to the worker.
+    """
+    if request.method != 'POST':
+        return JsonResponse({"detail": f'Method "{request.method}" not allowed.'}, status=405)
+    user = await aauthenticate(request, enforce_csrf=True)
+    if user is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+    if not user.is_patient:
+        return JsonResponse({"detail": "Only patients can book appointments."}, status=403)
+
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({"detail": "JSON parse error."}, status=400)
+    availability_id = data.get('availability') if isinstance(data, dict) else None
+    if not availability_id:
+        return JsonResponse({"availability": "This field is required."}, status=400)
+    try:
+        availability_id = int(availability_id)
+    except (TypeError, ValueError):
+        return JsonResponse({"availability": "Must be a slot id."}, status=400)
+
+    def book() -> tuple[Booking, dict[str, Any]]:
+        booking = book_slot(user, availability_id)
+        return booking, AppointmentSerializer(booking.appointment).data
+
+    try:
+        booking, body = await run_in_db_thread(book)
+    except SlotNotFound:
+        return JsonResponse({"detail": "Availability slot not found."}, status=404)
+    except SlotHeld:
+        return JsonResponse({"detail": "This slot is held by another patient."}, status=409)
+    except SlotBlocked:
+        return JsonResponse({"detail": "This slot is no longer available."}, status=409)
+    except SlotAlreadyBooked:
+        return JsonResponse({"detail": "This slot has already been booked."}, status=409)
+    except DatabaseError:
+        return JsonResponse({"detail": "An error occurred while processing the booking."}, status=500)
+
+    if getattr(settings, 'SCHEDULING_EAGER_DISPATCH', True):
+        _dispatch_in_background(request, booking)
+    return JsonResponse(body, status=201)
@@ -0,0 +1,178 @@
+import io
+import json
+import smtplib
+from contextlib import redirect_stdout
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+import handler
+
+
+class RenderEmailTests(SimpleTestCase):
+    def test_html_body_escapes_values(self):
+        rendered = handler.render_email(
+            'BOOKING_CONFIRMATION', {'userName': '<script>alert(1)</script>', 'details': 'Room "A" & B'}
+        )
+        assert rendered is not None
+        subject, html_body, text_body = rendered
+
+        self.assertIn('Booking Confirmed, &lt;script&gt;alert(1)&lt;/script&gt;!', html_body)
+        self.assertIn('Room &quot;A&quot; &amp; B', html_body)
+        self.assertNotIn('<script>', html_body)
+        assert text_body is not None
+        self.assertIn('Booking Confirmed, <script>alert(1)</script>!', text_body)
+
+    def test_missing_values_use_defaults_or_render_empty(self):
+        rendered = handler.render_email('BOOKING_CONFIRMATION', {})
+        assert rendered is not None
+        subject, html_body, text_body = rendered
+        self.assertEqual(subject, 'Booking Confirmation #N/A')
+        self.assertIn('Booking Confirmed, User!', html_body)
+
+        template = handler.CompiledTemplate('Hi {{ name }}, your code is {{code}}.', autoescape=True)
+        self.assertEqual(template.render({'name': 'Pat'}), 'Hi Pat, your code is .')
+
+    def test_subject_stays_on_one_line(self):
+        rendered = handler.render_email('BOOKING_CONFIRMATION', {'bookingId': '42\r\nBcc: victim@example.com'})
+        assert rendered is not None
+        self.assertEqual(rendered[0], 'Booking Confirmation #42 Bcc: victim@example.com')
+
+    def test_templates_are_compiled_once(self):
+        self.assertIsNone(handler.render_email('UNKNOWN', {}))
+        self.assertIs(handler.get_email_template('SIGNUP_WELCOME'), handler.get_email_template('SIGNUP_WELCOME'))
+
+
+class SMTPTestCase(SimpleTestCase):
+    """Routes handler sends through a fresh SMTP pool whose connections are mocks."""
+
+    def use_smtp(self):
+        self.enterContext(redirect_stdout(io.StringIO()))
+        self.enterContext(mock.patch.object(handler, 'DEV_MODE', False))
+        self.enterContext(mock.patch.object(handler, 'EMAIL_SERVICE_PROVIDER', 'SMTP'))
+        self.pool = handler.SMTPConnectionPool(size=2, idle_timeout=60)
+        self.enterContext(mock.patch.object(handler, '_smtp_pool', self.pool))
+        self.connections = []
+        self.sendmail = None
+        self.enterContext(mock.patch.object(self.pool, '_connect', side_effect=self.connect))
+
+    def connect(self):
+        server = mock.Mock(spec=smtplib.SMTP)
+        server.sendmail.side_effect = self.sendmail
+        self.connections.append(server)
+        return server
+
+
+class SMTPConnectionPoolTests(SMTPTestCase):
+    def setUp(self):
+        self.use_smtp()
+
+    def send(self, recipient='pat@example.com'):
+        return handler.send_via_smtp(recipient, 'Subject', '<p>Hi</p>', 'Hi', fallback=False)
+
+    def test_connection_is_reused_between_sends(self):
+        self.assertTrue(self.send())
+        self.assertTrue(self.send('sam@example.com'))
+
+        self.assertEqual(len(self.connections), 1)
+        self.assertEqual(self.connections[0].sendmail.call_count, 2)
+
+    def test_dropped_connection_is_replaced(self):
+        self.assertTrue(self.send())
+        dropped = self.connections[0]
+        dropped.sendmail.side_effect = smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+
+        self.assertTrue(self.send())
+        self.assertTrue(self.send())
+
+        self.assertEqual(len(self.connections), 2)
+        dropped.quit.assert_called_once()
+        self.assertEqual(self.connections[1].sendmail.call_count, 2)
+
+    def test_idle_connection_is_replaced(self):
+        self.assertTrue(self.send())
+        with mock.patch.object(handler.time, 'monotonic', return_value=handler.time.monotonic() + 61):
+            self.assertTrue(self.send())
+
+        self.assertEqual(len(self.connections), 2)
+        self.connections[0].quit.assert_called_once()
+
+
+class SESClientTests(SimpleTestCase):
+    def setUp(self):
+        self.enterContext(redirect_stdout(io.StringIO()))
+        handler.reset_ses_client()
+        self.addCleanup(handler.reset_ses_client)
+        self.boto3_client = self.enterContext(mock.patch('boto3.client'))
+        self.boto3_client.return_value.send_email.return_value = {'MessageId': 'abc'}
+
+    def send(self):
+        return handler.send_via_ses('pat@example.com', 'Subject', '<p>Hi</p>', 'Hi', fallback=False)
+
+    def test_client_is_created_once(self):
+        self.assertTrue(self.send())
+        self.assertTrue(self.send())
+
+        self.boto3_client.assert_called_once()
+        self.assertEqual(self.boto3_client.return_value.send_email.call_count, 2)
+
+    def test_client_is_rebuilt_after_an_error(self):
+        self.boto3_client.return_value.send_email.side_effect = [RuntimeError('expired token'), {'MessageId': 'abc'}]
+
+        self.assertFalse(self.send())
+        self.assertTrue(self.send())
+
+        self.assertEqual(self.boto3_client.call_count, 2)
+
+
+class SendEmailBatchTests(SMTPTestCase):
+    def setUp(self):
+        self.use_smtp()
+        self.enterContext(mock.patch.object(handler, '_batch_executor', None))
+        self.addCleanup(lambda: handler._get_batch_executor().shutdown())
+
+    def send_batch(self, messages):
+        response = handler.send_email_batch({'body': json.dumps({'messages': messages})}, None)
+        return response['statusCode'], json.loads(response['body'])
+
+    def welcome(self, recipient):
+        return {'action': 'SIGNUP_WELCOME', 'recipient': recipient, 'data': {'userName': 'Pat'}}
+
+    def test_each_worker_sends_its_share_over_one_connection(self):
+        checkouts = self.enterContext(mock.patch.object(self.pool, 'connection', wraps=self.pool.connection))
+        status, body = self.send_batch([self.welcome(f'p{i}@example.com') for i in range(6)])
+
+        self.assertEqual(status, 200)
+        self.assertEqual([result['status'] for result in body['results']], ['sent'] * 6)
+        self.assertEqual(checkouts.call_count, 2)
+        self.assertLessEqual(len(self.connections), 2)
+        self.assertEqual(sum(server.sendmail.call_count for server in self.connections), 6)
+
+    def test_partial_failure_reports_each_message(self):
+        def sendmail(sender, recipient, payload):
+            if recipient == 'refused@example.com':
+                raise smtplib.SMTPRecipientsRefused({recipient: (550, b'No such user')})
+
+        self.sendmail = sendmail
+        status, body = self.send_batch([
+            self.welcome('pat@example.com'),
+            self.welcome('refused@example.com'),
+            {'action': 'UNKNOWN', 'recipient': 'sam@example.com'},
+            self.welcome('kim@example.com'),
+            {'recipient': 'lee@example.com'},
+        ])
+
+        self.assertEqual(status, 207)
+        self.assertEqual(body['message'], '2 of 5 emails sent.')
+        self.assertEqual(
+            [(result['index'], result['recipient'], result['status']) for result in body['results']],
+            [
+                (0, 'pat@example.com', 'sent'),
+                (1, 'refused@example.com', 'failed'),
+                (2, 'sam@example.com', 'invalid'),
+                (3, 'kim@example.com', 'sent'),
+                (4, 'lee@example.com', 'invalid'),
+            ],
+        )
+        self.assertIn('No such user', body['results'][1]['error'])
+        self.assertEqual(body['results'][2]['error'], 'Unknown action "UNKNOWN"')
@@ -0,0 +1,49 @@
+"""
+Shared async HTTP client for upstream calls made from async views.
+
+Uses httpx when installed (the ``asgi`` extra); callers fall back to running
+their synchronous client in a worker thread when ``get_async_client``
+returns None. One pooled client is kept per event loop, since httpx clients
+cannot be shared across loops. httpx is imported on first use so it stays
+out of cold starts that never make an async call.
+"""
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any
+import asyncio
+import threading
+
+from django.conf import settings
+
+if TYPE_CHECKING:
+    import httpx
+
+_clients: dict[asyncio.AbstractEventLoop, Any] = {}
+_clients_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def _httpx() -> Any:
+    try:
+        import httpx
+    except ImportError:  # pragma: no cover - optional dependency
+        return None
+    return httpx
+
+
+def get_async_client() -> "httpx.AsyncClient | None":
+    httpx = _httpx()
+    if httpx is None:
+        return None
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        client = _clients.get(loop)
+        if client is None:
+            # Drop clients whose loop has gone away (e.g. asyncio.run in scripts)
+            for stale in [other for other in _clients if other.is_closed()]:
+                del _clients[stale]
+            client = httpx.AsyncClient(
+                timeout=getattr(settings, 'ASYNC_HTTP_TIMEOUT', 10),
+                limits=httpx.Limits(max_connections=getattr(settings, 'ASYNC_HTTP_MAX_CONNECTIONS', 100)),
+            )
+            _clients[loop] = client
+        return client
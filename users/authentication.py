@@ -0,0 +1,116 @@
+import hashlib
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import PermissionDenied
+from django.db import DEFAULT_DB_ALIAS
+from django.http import HttpRequest, HttpResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+# User fields kept with a cached token: what permission checks and user
+# listings read. Credentials and Google tokens are never cached.
+CACHED_USER_FIELDS = ('username', 'email', 'first_name', 'last_name', 'role', 'is_active', 'is_staff', 'is_superuser')
+
+
+def token_cache_key(key: str) -> str:
+    # Hashed so the raw credential never appears in the cache
+    return f'auth:token:{hashlib.sha256(key.encode()).hexdigest()}'
+
+
+def invalidate_token(key: str) -> None:
+    cache.delete(token_cache_key(key))
+
+
+def invalidate_user_tokens(user_id: int) -> None:
+    """Drop cached lookups for every token belonging to a user."""
+    keys = Token.objects.filter(user_id=user_id).values_list('key', flat=True)
+    cache.delete_many([token_cache_key(key) for key in keys])
+
+
+def token_cache_enabled() -> bool:
+    """
+    Whether token lookups may be cached: only when the default cache is shared
+    by every process, so that invalidation on logout reaches all of them.
+    """
+    return getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 300) > 0 and not isinstance(caches['default'], LocMemCache)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication with a read-through cache of token -> the user's id
+    and ``CACHED_USER_FIELDS``, so an authenticated request whose view only
+    checks permissions makes no authentication query at all.
+
+    On a hit the user is built from the cached fields; the others are deferred
+    and loaded from the database on first access, and saving the user writes
+    only the fields it has loaded. Entries expire after AUTH_TOKEN_CACHE_TTL
+    seconds and are invalidated when the token is deleted (logout or user
+    deletion) or the user is saved; see users.signals. Changes made with a
+    queryset ``update()`` send no signal and show up once the entry expires.
+    With a per-process cache (LocMemCache) the cache is bypassed, see
+    ``token_cache_enabled``.
+    """
+
+    def authenticate_credentials(self, key):
+        if not token_cache_enabled():
+            return super().authenticate_credentials(key)
+
+        cache_key = token_cache_key(key)
+        cached = cache.get(cache_key)
+        # Entries written in another shape (an older release) count as misses
+        if cached is None or len(cached) != len(CACHED_USER_FIELDS) + 1:
+            user, token = super().authenticate_credentials(key)
+            cache.set(
+                cache_key,
+                (user.pk, *(getattr(user, field) for field in CACHED_USER_FIELDS)),
+                getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 300)
+            )
+            return (user, token)
+
+        User = get_user_model()
+        loaded = dict(zip(('id', *CACHED_USER_FIELDS), cached))
+        # from_db takes the loaded values in model field order
+        field_names = [field.attname for field in User._meta.concrete_fields if field.attname in loaded]
+        user = User.from_db(DEFAULT_DB_ALIAS, field_names, [loaded[name] for name in field_names])
+        if not user.is_active:
+            raise AuthenticationFailed('User inactive or deleted.')
+        return (user, Token(key=key, user=user))
+
+
+def _not_called(request: HttpRequest) -> HttpResponse:
+    raise NotImplementedError
+
+
+def _csrf_failed(request: HttpRequest) -> bool:
+    # Same check DRF's SessionAuthentication runs for csrf-exempt API views;
+    # only the check runs, so the middleware never calls a response or view
+    check = CsrfViewMiddleware(_not_called)
+    check.process_request(request)
+    return check.process_view(request, _not_called, (), {}) is not None
+
+
+async def aauthenticate(request: HttpRequest, enforce_csrf: bool = False):
+    """
+    Session-or-token authentication for plain async Django views, which DRF's
+    authentication classes cannot serve. Returns the user or None.
+
+    With ``enforce_csrf`` (csrf-exempt views taking unsafe methods), session
+    authenticated requests without a valid CSRF token raise PermissionDenied,
+    as with SessionAuthentication.
+    """
+    user = await request.auser()
+    if user.is_authenticated:
+        if enforce_csrf and _csrf_failed(request):
+            raise PermissionDenied("CSRF Failed")
+        return user
+    try:
+        result = await sync_to_async(CachedTokenAuthentication().authenticate)(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
@@ -0,0 +1,68 @@
+"""
+Background dispatch of email-service calls.
+
+``dispatch_email`` never performs network I/O on the caller's thread. The
+backend is chosen by ``EMAIL_DISPATCH_BACKEND`` (a dotted path):
+
+* ``users.dispatch.ThreadPoolEmailBackend`` (default) posts from an
+  in-process thread pool once the surrounding transaction commits.
+* ``scheduling.tasks.OutboxEmailBackend`` records a durable outbox job in the
+  surrounding transaction, to be sent by ``run_outbox_worker``.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+import logging
+
+from .email_service import EmailServiceError, get_email_client
+
+logger = logging.getLogger(__name__)
+
+
+class ThreadPoolEmailBackend:
+    """Posts emails from a small in-process thread pool; best effort, not durable."""
+
+    # Nothing is written in the caller's transaction: sends are deferred to
+    # transaction.on_commit instead (see dispatch_email), so a rolled-back
+    # user never gets an email
+    transactional = False
+
+    def __init__(self, max_workers: int | None = None):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or getattr(settings, 'EMAIL_DISPATCH_WORKERS', 4),
+            thread_name_prefix='email-dispatch'
+        )
+
+    def send(self, payload: dict[str, Any]) -> None:
+        self._executor.submit(self._send, payload)
+
+    @staticmethod
+    def _send(payload: dict[str, Any]) -> None:
+        try:
+            get_email_client().send(payload)
+            logger.info(f"{payload.get('action')} email sent to {payload.get('recipient')}")
+        except EmailServiceError as e:
+            logger.error(f"Failed to send {payload.get('action')} email to {payload.get('recipient')}: {e}")
+
+
+@lru_cache(maxsize=1)
+def get_email_backend() -> Any:
+    path = getattr(settings, 'EMAIL_DISPATCH_BACKEND', 'users.dispatch.ThreadPoolEmailBackend')
+    return import_string(path)()
+
+
+def dispatch_email(payload: dict[str, Any]) -> None:
+    """
+    Queue an email-service request without blocking the caller.
+
+    Transactional backends write inside the current transaction; the others
+    are handed the payload from a ``transaction.on_commit`` hook.
+    """
+    backend = get_email_backend()
+    if backend.transactional:
+        backend.send(payload)
+    else:
+        transaction.on_commit(lambda: backend.send(payload))
@@ -0,0 +1,206 @@
+"""
+Client for the internal email service (``handler.send_email`` behind HTTP).
+
+One process-wide ``EmailServiceClient`` keeps a pooled keep-alive
+``requests.Session`` to ``EMAIL_SERVICE_URL``, fails fast through a circuit
+breaker while the service is down, and records latency/failure metrics.
+``asend`` is the same call for async code, sharing the breaker and metrics.
+"""
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any
+from django.conf import settings
+import asyncio
+import logging
+import threading
+import time
+
+from .async_http import get_async_client
+from main.instrumentation import timed
+
+logger = logging.getLogger(__name__)
+
+
+class EmailServiceError(Exception):
+    """The email service could not accept the request."""
+
+
+class CircuitOpenError(EmailServiceError):
+    """Raised without contacting the service while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Opens after ``failure_threshold`` consecutive failures and rejects calls
+    for ``reset_timeout`` seconds, then lets a single trial call through
+    (half-open) to decide whether to close again.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning("Email service circuit breaker opened")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+@dataclass
+class EmailServiceMetrics:
+    requests: int = 0
+    failures: int = 0
+    rejected: int = 0
+    latency_total: float = 0.0
+    latency_max: float = 0.0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record(self, latency: float, ok: bool) -> None:
+        with self._lock:
+            self.requests += 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+            if not ok:
+                self.failures += 1
+
+    def record_rejected(self) -> None:
+        with self._lock:
+            self.rejected += 1
+
+    def snapshot(self) -> dict[str, float]:
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'failures': self.failures,
+                'rejected': self.rejected,
+                'latency_avg_ms': (self.latency_total / self.requests * 1000) if self.requests else 0.0,
+                'latency_max_ms': self.latency_max * 1000,
+            }
+
+
+class EmailServiceClient:
+    def __init__(self, base_url: str, timeout: float, pool_size: int, breaker: CircuitBreaker):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.breaker = breaker
+        self.metrics = EmailServiceMetrics()
+        # Imported here, not at module load, to keep requests out of cold starts
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def send(self, payload: dict[str, Any]) -> dict[str, Any]:
+        """Sends one ``{"action", "recipient", "data"}`` message."""
+        return self._post('/email/send', payload)
+
+    def send_batch(self, messages: list[dict[str, Any]]) -> dict[str, Any]:
+        """Sends many messages in one request; the response has a status per message."""
+        return self._post('/email/send-batch', {'messages': messages})
+
+    async def asend(self, payload: dict[str, Any]) -> dict[str, Any]:
+        """``send`` for async callers; runs ``send`` in a thread without httpx."""
+        client = get_async_client()
+        if client is None:
+            return await asyncio.to_thread(self.send, payload)
+        return await self._apost(client, '/email/send', payload)
+
+    async def _apost(self, client: Any, path: str, body: dict[str, Any]) -> dict[str, Any]:
+        import httpx
+
+        if not self.breaker.allow():
+            self.metrics.record_rejected()
+            raise CircuitOpenError("Email service circuit breaker is open")
+
+        started, ok = time.perf_counter(), False
+        try:
+            with timed('email', path.rsplit('/', 1)[-1]):
+                response = await client.post(f'{self.base_url}{path}', json=body, timeout=self.timeout)
+                response.raise_for_status()
+            ok = True
+        except httpx.HTTPError as e:
+            raise EmailServiceError(str(e)) from e
+        finally:
+            self._record(time.perf_counter() - started, ok)
+
+        try:
+            return response.json()
+        except ValueError:
+            return {}
+
+    def _record(self, latency: float, ok: bool) -> None:
+        """
+        Feeds a call's outcome to the metrics and the breaker. Called from a
+        ``finally`` so that any exception, cancellation included, counts as a
+        failure; otherwise a half-open trial that raised would never report.
+        """
+        self.metrics.record(latency, ok)
+        if ok:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+
+    def _post(self, path: str, body: dict[str, Any]) -> dict[str, Any]:
+        import requests
+
+        if not self.breaker.allow():
+            self.metrics.record_rejected()
+            raise CircuitOpenError("Email service circuit breaker is open")
+
+        started, ok = time.perf_counter(), False
+        try:
+            with timed('email', path.rsplit('/', 1)[-1]):
+                response = self.session.post(f'{self.base_url}{path}', json=body, timeout=self.timeout)
+                # Partial batch failures (207) are reported per message, not as errors
+                response.raise_for_status()
+            ok = True
+        except requests.RequestException as e:
+            raise EmailServiceError(str(e)) from e
+        finally:
+            self._record(time.perf_counter() - started, ok)
+
+        try:
+            return response.json()
+        except ValueError:
+            return {}
+
+
+@lru_cache(maxsize=1)
+def get_email_client() -> EmailServiceClient:
+    return EmailServiceClient(
+        base_url=getattr(settings, 'EMAIL_SERVICE_URL', 'http://localhost:3003'),
+        timeout=getattr(settings, 'EMAIL_SERVICE_TIMEOUT', 5),
+        pool_size=getattr(settings, 'EMAIL_SERVICE_POOL_SIZE', 10),
+        breaker=CircuitBreaker(
+            failure_threshold=getattr(settings, 'EMAIL_SERVICE_BREAKER_THRESHOLD', 5),
+            reset_timeout=getattr(settings, 'EMAIL_SERVICE_BREAKER_RESET_SECONDS', 30),
+        ),
+    )
@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-17 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_google_access_token_user_google_client_id_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='google_sync_token',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='google_synced_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
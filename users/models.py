@@ -23,6 +23,9 @@ class User(AbstractUser):
     google_token_uri = models.CharField(max_length=500, null=True, blank=True)
     google_client_id = models.CharField(max_length=500, null=True, blank=True)
     google_client_secret = models.CharField(max_length=500, null=True, blank=True)
+    # Incremental calendar sync state (see scheduling.calendar_sync)
+    google_sync_token = models.TextField(null=True, blank=True)
+    google_synced_at = models.DateTimeField(null=True, blank=True)
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name', 'role']
@@ -34,6 +37,15 @@ class User(AbstractUser):
     def __str__(self):
         return f"{self.username} ({self.get_role_display()})"
 
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        # Users authenticated from the token cache are only partly loaded;
+        # fetch every deferred field on first access instead of one per query
+        if fields is not None:
+            deferred = self.get_deferred_fields()
+            if deferred.intersection(fields):
+                fields = deferred.union(fields)
+        super().refresh_from_db(using, fields, from_queryset)
+
     @property
     def is_doctor(self):
         return self.role == 'doctor'
@@ -1,59 +1,444 @@
-from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Hashable
+import json
 import logging
+import threading
+import time
+
+from .async_http import get_async_client
+from main.instrumentation import timed
+
+# The Google client libraries, httplib2 and requests are imported where they
+# are used: this module loads at startup (via the outbox job registry) and
+# most processes, such as the API Lambda on a cold start, never call Google.
+if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials
 
 logger = logging.getLogger(__name__)
 
-def create_calendar_event(user, event_details):
+DEFAULT_TOKEN_URI = 'https://oauth2.googleapis.com/token'
+# Google caps Calendar batch requests at 50 calls
+CALENDAR_BATCH_LIMIT = 50
+# Largest page events.list allows; fewer round trips per sync
+CALENDAR_LIST_PAGE_SIZE = 2500
+# Only what the calendar sync reads, to keep full listings small
+CALENDAR_SYNC_FIELDS = 'items(id,status,start,end,transparency,extendedProperties/private),nextPageToken,nextSyncToken'
+
+
+def _api_root() -> str:
+    # Overridable so the client can be pointed at a local fake Calendar server
+    return getattr(settings, 'GOOGLE_CALENDAR_API_ROOT', 'https://www.googleapis.com').rstrip('/')
+
+
+@dataclass
+class CalendarClient:
+    """A built Calendar service bound to one user's credentials and HTTP connection."""
+    service: Any
+    credentials: 'Credentials'
+    refresh_token: str
+    persisted_token: str | None
+    created_at: float = field(default_factory=time.monotonic)
+    # httplib2 connections are not thread-safe; requests on one client are serialized
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class CalendarClientCache:
     """
-    Creates a Google Calendar event for the specified user.
-    
-    Args:
-        user (User): The user instance (Doctor or Patient)
-        event_details (dict): A dictionary matching the Google Calendar API event resource structure.
+    Per-process LRU cache of Calendar clients keyed by user id.
+
+    Entries expire after ``ttl`` seconds and are dropped when the user's
+    refresh token changes (reconnect) or on explicit invalidation (disconnect).
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[int, CalendarClient] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user) -> CalendarClient | None:
+        with self._lock:
+            client = self._entries.get(user.pk)
+            if client is None:
+                return None
+            if (
+                client.refresh_token != user.google_refresh_token
+                or time.monotonic() - client.created_at > self.ttl
+            ):
+                del self._entries[user.pk]
+                return None
+            self._entries.move_to_end(user.pk)
+            return client
+
+    def put(self, user_id: int, client: CalendarClient) -> None:
+        with self._lock:
+            self._entries[user_id] = client
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_client_cache = CalendarClientCache(
+    max_size=getattr(settings, 'GOOGLE_CALENDAR_CLIENT_CACHE_SIZE', 256),
+    ttl=getattr(settings, 'GOOGLE_CALENDAR_CLIENT_TTL', 3000),
+)
+
+_batch_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def _refresh_request() -> Any:
+    """Shared transport for explicit token refreshes."""
+    from google.auth.transport.requests import Request
+    import requests
+
+    return Request(session=requests.Session())
+
+
+@lru_cache(maxsize=1)
+def _batch_http() -> Any:
+    """Shared keep-alive connection for batch requests; inner calls carry their own credentials."""
+    import httplib2
+
+    return httplib2.Http(timeout=getattr(settings, 'GOOGLE_API_TIMEOUT', 10))
+
+
+@lru_cache(maxsize=1)
+def _calendar_discovery_document() -> dict[str, Any]:
+    # Parsed once per process instead of on every build()
+    from googleapiclient.discovery_cache import get_static_doc
+
+    document = get_static_doc('calendar', 'v3')
+    if document is None:
+        raise ImproperlyConfigured("google-api-python-client has no bundled calendar v3 discovery document")
+    return json.loads(document)
+
+
+def invalidate_calendar_client(user_id: int) -> None:
+    """Drop the cached client for a user, e.g. after disconnecting their calendar."""
+    _client_cache.invalidate(user_id)
+
+
+def get_calendar_client(user) -> CalendarClient | None:
+    """
+    Returns a cached Calendar client for the user, building one if needed.
+    Returns None if the user has not linked Google Calendar or credentials are unusable.
     """
-    
     # 1. Check if user has linked Google Calendar
     if not user.google_refresh_token:
         logger.warning(f"User {user.email} has not linked Google Calendar. Skipping event creation.")
         return None
 
+    client = _client_cache.get(user)
+    if client is not None:
+        return client
+
+    from google.oauth2.credentials import Credentials
+    from google_auth_httplib2 import AuthorizedHttp
+    from googleapiclient.discovery import build_from_document
+    import httplib2
+
     # 2. Reconstruct Credentials from DB
     # We use a default token_uri if the one in DB is missing.
-    token_uri = user.google_token_uri or 'https://oauth2.googleapis.com/token'
-
     creds = Credentials(
         token=user.google_access_token,
         refresh_token=user.google_refresh_token,
-        token_uri=token_uri,
+        token_uri=user.google_token_uri or DEFAULT_TOKEN_URI,
         client_id=user.google_client_id,
         client_secret=user.google_client_secret,
         scopes=settings.GOOGLE_API_SCOPES
     )
 
-    # 3. Handle Token Refresh if expired
+    # 3. Refresh up front only if there is no usable access token; expired
+    # tokens are otherwise refreshed by AuthorizedHttp on a 401.
     if not creds.valid:
-        if creds.expired and creds.refresh_token:
-            try:
-                creds.refresh(Request())
-                # Save the new access token back to the DB
-                user.google_access_token = creds.token
-                user.save(update_fields=['google_access_token'])
-            except Exception as e:
-                logger.error(f"Failed to refresh token for user {user.email}: {str(e)}")
-                return None
-        else:
-            logger.error(f"Credentials invalid and no refresh token for {user.email}")
+        try:
+            creds.refresh(_refresh_request())
+        except Exception as e:
+            logger.error(f"Failed to refresh token for user {user.email}: {str(e)}")
             return None
 
+    http = AuthorizedHttp(creds, http=httplib2.Http(timeout=getattr(settings, 'GOOGLE_API_TIMEOUT', 10)))
+    service = build_from_document(
+        _calendar_discovery_document(),
+        http=http,
+        client_options={'api_endpoint': f'{_api_root()}/calendar/v3/'}
+    )
+    client = CalendarClient(
+        service=service,
+        credentials=creds,
+        refresh_token=user.google_refresh_token,
+        persisted_token=user.google_access_token,
+    )
+    _persist_refreshed_token(user, client)
+    _client_cache.put(user.pk, client)
+    return client
+
+
+def _persist_refreshed_token(user, client: CalendarClient) -> None:
+    """Write the access token back to the user only when a refresh changed it."""
+    token = client.credentials.token
+    if token and token != client.persisted_token:
+        user.google_access_token = token
+        user.save(update_fields=['google_access_token'])
+        client.persisted_token = token
+
+
+def create_calendar_event(user, event_details):
+    """
+    Creates a Google Calendar event for the specified user.
+
+    Args:
+        user (User): The user instance (Doctor or Patient)
+        event_details (dict): A dictionary matching the Google Calendar API event resource structure.
+    """
+    client = get_calendar_client(user)
+    if client is None:
+        return None
+
     # 4. Insert Event
     try:
-        service = build('calendar', 'v3', credentials=creds)
-        event = service.events().insert(calendarId='primary', body=event_details).execute()
+        with client.lock:
+            with timed('calendar', 'events.insert'):
+                event = client.service.events().insert(calendarId='primary', body=event_details).execute()
+            _persist_refreshed_token(user, client)
         logger.info(f"Event created for {user.email}: {event.get('htmlLink')}")
         return event
     except Exception as e:
+        # The connection or credentials may be broken; rebuild on next use
+        invalidate_calendar_client(user.pk)
         logger.error(f"Google API Error for user {user.email}: {str(e)}")
         return None
+
+
+def calendar_access_token(user) -> str | None:
+    """A currently valid access token for the user's calendar, refreshed and persisted if needed."""
+    client = get_calendar_client(user)
+    if client is None:
+        return None
+    with client.lock:
+        if not client.credentials.valid:
+            with timed('calendar', 'token.refresh'):
+                client.credentials.refresh(_refresh_request())
+            _persist_refreshed_token(user, client)
+        return client.credentials.token
+
+
+async def acreate_calendar_event(user, event_details: dict[str, Any]) -> dict[str, Any]:
+    """
+    Async ``create_calendar_event``: the token comes from the cached client
+    (refreshed in a thread if needed) and the insert is a plain REST call on
+    the shared async HTTP client. Raises on failure instead of returning None.
+    """
+    client = get_async_client()
+    if client is None:
+        # Off the shared sync thread so concurrent inserts are not serialized
+        event = await sync_to_async(create_calendar_event, thread_sensitive=False)(user, event_details)
+        if event is None:
+            raise RuntimeError(f"Calendar event was not created for {user.email}")
+        return event
+
+    import httpx
+
+    token = await sync_to_async(calendar_access_token)(user)
+    if token is None:
+        raise LookupError(f"No usable Google credentials for {user.email}")
+    try:
+        with timed('calendar', 'events.insert'):
+            response = await client.post(
+                f'{_api_root()}/calendar/v3/calendars/primary/events',
+                json=event_details,
+                headers={'Authorization': f'Bearer {token}'},
+                timeout=getattr(settings, 'GOOGLE_API_TIMEOUT', 10),
+            )
+            response.raise_for_status()
+    except httpx.HTTPError as e:
+        # The token may have been revoked; rebuild the client on next use
+        invalidate_calendar_client(user.pk)
+        logger.error(f"Google API Error for user {user.email}: {str(e)}")
+        raise
+    event = response.json()
+    logger.info(f"Event created for {user.email}: {event.get('htmlLink')}")
+    return event
+
+
+class SyncTokenExpired(Exception):
+    """Google no longer accepts the stored sync token (410 Gone); a full sync is needed."""
+
+
+def list_calendar_changes(user, sync_token: str | None) -> tuple[list[dict[str, Any]], str | None]:
+    """
+    Events in the user's primary calendar changed since ``sync_token``
+    (deleted events come back with status ``cancelled``), or every event when
+    it is None. Follows pagination and returns the events and Google's next
+    sync token.
+
+    Raises ``SyncTokenExpired`` when the token must be discarded, LookupError
+    when the user has no usable credentials and HttpError otherwise.
+    """
+    from googleapiclient.errors import HttpError
+
+    client = get_calendar_client(user)
+    if client is None:
+        raise LookupError(f"No usable Google credentials for {user.email}")
+
+    params: dict[str, Any] = {
+        'calendarId': 'primary',
+        'singleEvents': True,
+        'maxResults': CALENDAR_LIST_PAGE_SIZE,
+        'fields': CALENDAR_SYNC_FIELDS,
+    }
+    if sync_token:
+        params['syncToken'] = sync_token
+
+    events: list[dict[str, Any]] = []
+    page_token = None
+    with client.lock:
+        while True:
+            try:
+                with timed('calendar', 'events.list'):
+                    response = client.service.events().list(pageToken=page_token, **params).execute()
+            except HttpError as e:
+                if e.resp.status == 410:
+                    raise SyncTokenExpired() from e
+                invalidate_calendar_client(user.pk)
+                raise
+            events.extend(response.get('items', []))
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                _persist_refreshed_token(user, client)
+                return events, response.get('nextSyncToken')
+
+
+def update_calendar_event(user, event_id: str, changes: dict[str, Any]) -> dict[str, Any] | None:
+    """
+    Patch one of the user's events. Returns the updated event, or None if the
+    user has not linked Google Calendar or the event no longer exists. Raises
+    HttpError on other failures.
+    """
+    from googleapiclient.errors import HttpError
+
+    client = get_calendar_client(user)
+    if client is None:
+        return None
+    try:
+        with client.lock:
+            with timed('calendar', 'events.patch'):
+                event = client.service.events().patch(calendarId='primary', eventId=event_id, body=changes).execute()
+            _persist_refreshed_token(user, client)
+    except HttpError as e:
+        if e.resp.status in (404, 410):
+            logger.warning(f"Event {event_id} no longer exists for {user.email}; not updated")
+            return None
+        invalidate_calendar_client(user.pk)
+        raise
+    logger.info(f"Event {event_id} updated for {user.email}")
+    return event
+
+
+def delete_calendar_event(user, event_id: str) -> bool:
+    """
+    Delete one of the user's events; an event already gone counts as deleted.
+    Returns False if the user has not linked Google Calendar. Raises HttpError
+    on other failures.
+    """
+    from googleapiclient.errors import HttpError
+
+    client = get_calendar_client(user)
+    if client is None:
+        return False
+    try:
+        with client.lock:
+            with timed('calendar', 'events.delete'):
+                client.service.events().delete(calendarId='primary', eventId=event_id).execute()
+            _persist_refreshed_token(user, client)
+    except HttpError as e:
+        if e.resp.status not in (404, 410):
+            invalidate_calendar_client(user.pk)
+            raise
+    logger.info(f"Event {event_id} deleted for {user.email}")
+    return True
+
+
+@dataclass
+class CalendarInsertResult:
+    event: dict[str, Any] | None = None
+    error: Exception | None = None
+
+
+class CalendarEventDispatcher:
+    """
+    Collects event inserts for any number of users and sends them as Google
+    batch HTTP requests (up to CALENDAR_BATCH_LIMIT calls per round trip).
+
+    Each inner request carries its own user's credentials, so one batch can mix
+    doctors and patients. ``flush`` returns a result per key passed to ``add``.
+    """
+
+    def __init__(self):
+        self._pending: list[tuple[Hashable, Any, dict[str, Any]]] = []
+
+    def add(self, key: Hashable, user, event_details: dict[str, Any]) -> None:
+        self._pending.append((key, user, event_details))
+
+    def flush(self) -> dict[Hashable, CalendarInsertResult]:
+        pending, self._pending = self._pending, []
+        results: dict[Hashable, CalendarInsertResult] = {}
+
+        ready = []
+        for key, user, body in pending:
+            client = get_calendar_client(user)
+            if client is None:
+                results[key] = CalendarInsertResult(error=LookupError(f"No usable Google credentials for {user.email}"))
+            else:
+                ready.append((key, user, client, body))
+
+        for start in range(0, len(ready), CALENDAR_BATCH_LIMIT):
+            chunk = ready[start:start + CALENDAR_BATCH_LIMIT]
+            results.update(self._execute_batch(chunk))
+        return results
+
+    def _execute_batch(self, chunk) -> dict[Hashable, CalendarInsertResult]:
+        from googleapiclient.http import BatchHttpRequest
+
+        results: dict[Hashable, CalendarInsertResult] = {}
+        keys = {str(i): key for i, (key, _, _, _) in enumerate(chunk)}
+
+        def callback(request_id, response, exception):
+            key = keys[request_id]
+            results[key] = CalendarInsertResult(event=response, error=exception)
+
+        batch = BatchHttpRequest(callback=callback, batch_uri=f'{_api_root()}/batch/calendar/v3')
+        for i, (_, _, client, body) in enumerate(chunk):
+            batch.add(client.service.events().insert(calendarId='primary', body=body), request_id=str(i))
+
+        with _batch_lock:
+            try:
+                with timed('calendar', 'batch'):
+                    batch.execute(http=_batch_http())
+            except Exception as e:
+                logger.error(f"Google API batch error: {str(e)}")
+                for key in keys.values():
+                    results.setdefault(key, CalendarInsertResult(error=e))
+
+        for key, user, client, _ in chunk:
+            result = results.setdefault(key, CalendarInsertResult(error=RuntimeError("No response in batch")))
+            if result.error is not None:
+                invalidate_calendar_client(user.pk)
+                logger.error(f"Google API Error for user {user.email}: {str(result.error)}")
+            else:
+                _persist_refreshed_token(user, client)
+        return results
@@ -1,9 +1,12 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.conf import settings
-import requests
+from rest_framework.authtoken.models import Token
 import logging
 
+from .authentication import invalidate_token, invalidate_user_tokens, token_cache_enabled
+from .dispatch import dispatch_email
+
 logger = logging.getLogger(__name__)
 
 
@@ -12,6 +15,7 @@ def send_welcome_email_on_signup(sender, instance, created, **kwargs):
     """
     Send a welcome email when a new user is created.
     Listens for the post_save signal on the User model.
+    The email is dispatched in the background once the transaction commits.
     """
     if not created:
         return
@@ -27,13 +31,19 @@ def send_welcome_email_on_signup(sender, instance, created, **kwargs):
         }
     }
 
-    try:
-        requests.post(
-            'http://localhost:3003/email/send',
-            json=email_payload,
-            timeout=5
-        )
-        logger.info(f"Welcome email triggered for user: {instance.email}")
-    except requests.RequestException as e:
-        # Log the error but do not crash the signup process
-        logger.error(f"Failed to send welcome email to {instance.email}: {e}")
+    dispatch_email(email_payload)
+    logger.info(f"Welcome email queued for user: {instance.email}")
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_cached_auth_on_user_save(sender, instance, created, **kwargs):
+    """Cached token lookups hold the user's fields; refresh them on any change."""
+    if created or not token_cache_enabled():
+        return
+    invalidate_user_tokens(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_cached_auth_on_logout(sender, instance, **kwargs):
+    if token_cache_enabled():
+        invalidate_token(instance.key)
@@ -1,3 +1,174 @@
-from django.test import TestCase
+import tempfile
 
-# Create your tests here.
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from googleapiclient.errors import HttpError
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from benchmarks.fakes import fake_calendar_server
+
+from .authentication import token_cache_key
+from .email_service import CircuitBreaker, EmailServiceClient
+from .models import User
+from .services import CALENDAR_BATCH_LIMIT, CalendarEventDispatcher, invalidate_calendar_client
+
+# Token lookups are only cached in a cache shared between processes, with AUTH_TOKEN_CACHE_TTL set
+SHARED_CACHE = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': tempfile.mkdtemp(prefix='hms-test-cache-'),
+    }
+}
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='pat', email='pat@example.com', password='x', first_name='Pat', last_name='Lee', role='patient'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def tearDown(self):
+        cache.clear()
+
+    @override_settings(AUTH_TOKEN_CACHE_TTL=300)
+    def test_per_process_cache_is_bypassed(self):
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, 200)
+        self.assertIsNone(cache.get(token_cache_key(self.token.key)))
+        # Nor do saves look up tokens to invalidate
+        with self.assertNumQueries(1):
+            self.user.save()
+
+    @override_settings(CACHES=SHARED_CACHE, AUTH_TOKEN_CACHE_TTL=300)
+    def test_caches_public_fields_under_hashed_key(self):
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, 200)
+        key = token_cache_key(self.token.key)
+        self.assertNotIn(self.token.key, key)
+        self.assertEqual(cache.get(key), (self.user.pk, 'pat', 'pat@example.com', 'Pat', 'Lee', 'patient', True, False, False))
+
+    @override_settings(CACHES=SHARED_CACHE, AUTH_TOKEN_CACHE_TTL=300)
+    def test_cache_hit_makes_no_auth_query(self):
+        # The token/user join, then the appointment list
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get('/api/scheduling/appointments/').status_code, 200)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/scheduling/appointments/').status_code, 200)
+
+    @override_settings(CACHES=SHARED_CACHE, AUTH_TOKEN_CACHE_TTL=300)
+    def test_uncached_fields_load_fresh_in_one_query(self):
+        self.client.get('/api/auth/profile/')
+        User.objects.filter(pk=self.user.pk).update(phone_number='555-0100', google_refresh_token='refresh')
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/auth/profile/')
+        self.assertEqual(response.json()['phone_number'], '555-0100')
+        self.assertTrue(response.json()['google_calendar_connected'])
+
+    @override_settings(CACHES=SHARED_CACHE, AUTH_TOKEN_CACHE_TTL=300)
+    def test_saved_changes_invalidate(self):
+        self.client.get('/api/auth/profile/')
+        self.user.first_name = 'Patricia'
+        self.user.save()
+        response = self.client.get('/api/auth/profile/')
+        self.assertEqual(response.json()['first_name'], 'Patricia')
+
+    @override_settings(CACHES=SHARED_CACHE, AUTH_TOKEN_CACHE_TTL=300)
+    def test_profile_update_from_cached_user(self):
+        self.client.get('/api/auth/profile/')
+        response = self.client.put('/api/auth/profile/', {'last_name': 'Lin'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.last_name, self.user.email), ('Lin', 'pat@example.com'))
+        self.assertTrue(self.user.check_password('x'))
+
+    @override_settings(CACHES=SHARED_CACHE, AUTH_TOKEN_CACHE_TTL=300)
+    def test_deactivation_and_logout_invalidate(self):
+        self.client.get('/api/auth/profile/')
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, 403)
+
+        self.user.is_active = True
+        self.user.save()
+        self.client.get('/api/auth/profile/')
+        key = self.token.key
+        self.token.delete()
+        self.assertIsNone(cache.get(token_cache_key(key)))
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, 403)
+
+
+class CalendarEventDispatcherTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.calendar = fake_calendar_server()
+        cls.calendar.rejected_summaries = {'rejected'}
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.calendar.shutdown()
+        cls.calendar.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.calendar.counts.clear()
+        override = override_settings(GOOGLE_CALENDAR_API_ROOT=self.calendar.url)
+        override.enable()
+        self.addCleanup(override.disable)
+        # A non-expiring access token, so building a client makes no refresh call
+        self.doctor, self.patient = [
+            User.objects.create(
+                username=name, email=f'{name}@example.com', role=role, google_access_token='test',
+                google_refresh_token='test', google_client_id='test', google_client_secret='test'
+            )
+            for name, role in (('doc', 'doctor'), ('pat', 'patient'))
+        ]
+        self.unlinked = User.objects.create(username='unlinked', email='unlinked@example.com', role='patient')
+        for user in (self.doctor, self.patient):
+            self.addCleanup(invalidate_calendar_client, user.pk)
+
+    def test_inserts_are_chunked_into_batches(self):
+        dispatcher = CalendarEventDispatcher()
+        count = CALENDAR_BATCH_LIMIT * 2 + 10
+        for i in range(count):
+            dispatcher.add(i, self.doctor if i % 2 else self.patient, {'summary': f'Appointment {i}'})
+        results = dispatcher.flush()
+
+        self.assertEqual(self.calendar.counts, {'request': 3, 'batch': 3, 'insert': count})
+        self.assertEqual(set(results), set(range(count)))
+        for i, result in results.items():
+            self.assertIsNone(result.error)
+            self.assertEqual((result.event or {}).get('summary'), f'Appointment {i}')
+
+    def test_errors_are_mapped_to_their_items(self):
+        dispatcher = CalendarEventDispatcher()
+        dispatcher.add('ok', self.doctor, {'summary': 'accepted'})
+        dispatcher.add('rejected', self.patient, {'summary': 'rejected'})
+        dispatcher.add('unlinked', self.unlinked, {'summary': 'accepted'})
+        results = dispatcher.flush()
+
+        self.assertEqual(self.calendar.counts, {'request': 1, 'batch': 1, 'insert': 1})
+        self.assertIsNone(results['ok'].error)
+        self.assertEqual((results['ok'].event or {}).get('summary'), 'accepted')
+        error = results['rejected'].error
+        assert isinstance(error, HttpError)
+        self.assertEqual(error.resp.status, 403)
+        self.assertIsNone(results['rejected'].event)
+        self.assertIsInstance(results['unlinked'].error, LookupError)
+
+
+class EmailServiceBreakerTests(TestCase):
+    def test_unexpected_error_in_half_open_trial_reopens(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        client = EmailServiceClient('http://email.invalid', timeout=1, pool_size=1, breaker=breaker)
+        breaker.record_failure()
+
+        with mock.patch.object(client.session, 'post', side_effect=KeyError('boom')):
+            with self.assertRaises(KeyError):
+                client.send({'action': 'SIGNUP_WELCOME', 'recipient': 'pat@example.com'})
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(client.metrics.snapshot()['failures'], 1)
@@ -2,7 +2,10 @@ from rest_framework import status, permissions, generics
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.authtoken.models import Token
-from django.contrib.auth import login, logout
+from asgiref.sync import sync_to_async
+from django.contrib.auth import alogin, login, logout
+from django.http import JsonResponse
+from django.views import View
 from django.views.generic import CreateView 
 from django.urls import reverse_lazy
 from django.contrib import messages
@@ -15,10 +18,13 @@ from .serializers import (
 )
 from django.shortcuts import redirect
 from django.conf import settings
-from google_auth_oauthlib.flow import Flow
 from .forms import CustomUserCreationForm
-from rest_framework.authentication import SessionAuthentication, TokenAuthentication
+from .services import invalidate_calendar_client
+from rest_framework.authentication import SessionAuthentication
+from .authentication import CachedTokenAuthentication, aauthenticate
 from django.conf import settings
+from functools import lru_cache
+import json
 import logging
 logger = logging.getLogger(__name__)
 class RegisterView(APIView):
@@ -89,32 +95,36 @@ class DoctorListView(generics.ListAPIView):
     serializer_class = UserListSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-class GoogleCalendarInitView(APIView):
+@lru_cache(maxsize=1)
+def _google_client_config() -> dict:
+    # Read once instead of on every OAuth start
+    with open(settings.GOOGLE_CLIENT_SECRETS_FILE) as f:
+        return json.load(f)
+
+
+class GoogleCalendarInitView(View):
     """
     Initiates Google Calendar OAuth flow.
     Accepts authentication via:
     - Session (cookie-based, for browser redirects)
     - Token (header-based, for API calls)
     - Query parameter token (for redirect-based flows)
+
+    Async so it runs on the event loop under main.asgi.
     """
-    authentication_classes = [TokenAuthentication, SessionAuthentication]
-    permission_classes = [permissions.AllowAny]  # We'll handle auth manually
 
-    def get(self, request):
-        user = None
-        
+    async def get(self, request):
         # Try to get user from session or token auth first
-        if request.user.is_authenticated:
-            user = request.user
-        else:
+        user = await aauthenticate(request)
+        if user is None:
             # Try to authenticate via query parameter token
             token_key = request.GET.get('token')
             if token_key:
                 try:
-                    token = Token.objects.get(key=token_key)
+                    token = await Token.objects.select_related('user').aget(key=token_key)
                     user = token.user
                     # Log the user in to create a session for the callback
-                    login(request, user)
+                    await alogin(request, user)
                 except Token.DoesNotExist:
                     pass
         
@@ -123,8 +133,12 @@ class GoogleCalendarInitView(APIView):
             return redirect(f"{settings.FRONTEND_URL}/calendar/callback?error=Authentication%20required")
 
         try:
-            flow = Flow.from_client_secrets_file(
-                settings.GOOGLE_CLIENT_SECRETS_FILE,
+            # Loaded here so the OAuth libraries stay out of cold starts
+            from google_auth_oauthlib.flow import Flow
+
+            client_config = await sync_to_async(_google_client_config)()
+            flow = Flow.from_client_config(
+                client_config,
                 scopes=settings.GOOGLE_API_SCOPES,
                 redirect_uri=settings.REDIRECT_URI
             )
@@ -135,8 +149,8 @@ class GoogleCalendarInitView(APIView):
             )
             
             # Store state and user ID in session
-            request.session['google_oauth_state'] = state
-            request.session['google_oauth_user_id'] = user.id
+            await request.session.aset('google_oauth_state', state)
+            await request.session.aset('google_oauth_user_id', user.id)
             
             return redirect(authorization_url)
             
@@ -171,7 +185,9 @@ class GoogleCalendarRedirectView(APIView):
         try:
             # Get user from stored user_id
             user = User.objects.get(id=user_id)
-            
+
+            from google_auth_oauthlib.flow import Flow
+
             flow = Flow.from_client_secrets_file(
                 settings.GOOGLE_CLIENT_SECRETS_FILE,
                 scopes=settings.GOOGLE_API_SCOPES,
@@ -194,7 +210,11 @@ class GoogleCalendarRedirectView(APIView):
             user.google_token_uri = token_uri
             user.google_client_id = credentials.client_id
             user.google_client_secret = credentials.client_secret
+            # Possibly a different Google account: start calendar sync afresh
+            user.google_sync_token = None
+            user.google_synced_at = None
             user.save()
+            invalidate_calendar_client(user.pk)
 
             # Clean up session
             if 'google_oauth_state' in request.session:
@@ -215,7 +235,7 @@ class GoogleCalendarRedirectView(APIView):
 
 # Add endpoint to disconnect Google Calendar
 class GoogleCalendarDisconnectView(APIView):
-    authentication_classes = [TokenAuthentication, SessionAuthentication]
+    authentication_classes = [CachedTokenAuthentication, SessionAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
@@ -225,24 +245,29 @@ class GoogleCalendarDisconnectView(APIView):
         user.google_token_uri = None
         user.google_client_id = None
         user.google_client_secret = None
+        user.google_sync_token = None
+        user.google_synced_at = None
         user.save()
-        
+        invalidate_calendar_client(user.pk)
+
         return Response({'message': 'Google Calendar disconnected successfully'})
 
 
 # Add endpoint to check Google Calendar status
-class GoogleCalendarStatusView(APIView):
-    authentication_classes = [TokenAuthentication, SessionAuthentication]
-    permission_classes = [permissions.IsAuthenticated]
+class GoogleCalendarStatusView(View):
+    async def get(self, request):
+        user = await aauthenticate(request)
+        if user is None:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
 
-    def get(self, request):
-        user = request.user
         is_connected = bool(user.google_refresh_token)
         
-        return Response({
+        return JsonResponse({
             'connected': is_connected,
             'email': user.email if is_connected else None
         })
+
+
 class SignUpView(CreateView):
     form_class = CustomUserCreationForm
     success_url = reverse_lazy('login')